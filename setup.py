@@ -27,11 +27,28 @@ from __future__ import absolute_import
 from setuptools import setup
 from yaclifw import __file__ as module_file
 from yaclifw.version import get_git_version
+from yaclifw.version import write_version_module
 
+from setuptools.command.build_py import build_py
 from setuptools.command.test import test as TestCommand
+import os
 import sys
 
 
+class BuildPy(build_py):
+    """
+    Bakes the version into yaclifw/_version.py so that
+    installed copies never need to run git.
+    """
+
+    def run(self):
+        build_py.run(self)
+        if not self.dry_run:
+            write_version_module(
+                os.path.join(self.build_lib, "yaclifw", "_version.py"),
+                VERSION)
+
+
 class PyTest(TestCommand):
     user_options = [
         ('test-path=', 't', "base dir for test collection"),
@@ -122,6 +139,6 @@ setup(name='yaclifw',
       classifiers=CLASSIFIERS,
       version=VERSION,
 
-      cmdclass={'test': PyTest},
+      cmdclass={'build_py': BuildPy, 'test': PyTest},
       tests_require=['pytest', 'restview', 'mox'],
       )
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Benchmarks of start-up, parser construction, parsing and
+help rendering. Run with "tox -e bench", which saves each
+run under .benchmarks/ for comparison with earlier commits.
+"""
+
+from __future__ import absolute_import
+import os
+import subprocess
+import sys
+import pytest
+
+from yaclifw.framework import App
+from yaclifw.framework import Command
+from yaclifw.framework import main
+from yaclifw.main import entry_point
+
+pytest.importorskip("pytest_benchmark")
+
+SIZES = (1, 10, 100, 1000)
+
+
+def synthetic(count):
+    """
+    count Command subclasses with one option each
+    """
+    def run(self, args):
+        pass
+
+    def init(self, sub_parsers):
+        Command.__init__(self, sub_parsers)
+        self.parser.add_argument("--value", default=None)
+
+    items = []
+    for i in range(count):
+        name = "cmd%04d" % i
+        MyCommand = type(str("Cmd%04d" % i), (Command,), {
+            "NAME": name, "__doc__": "Synthetic command %d" % i,
+            "__init__": init, "__call__": run})
+        items.append((name, MyCommand))
+    return items
+
+
+class DeepCommand(Command):
+    """Accepts arbitrarily long argument lists"""
+
+    NAME = "deep"
+
+    def __init__(self, sub_parsers):
+        super(DeepCommand, self).__init__(sub_parsers)
+        self.parser.add_argument("--option", action="append", default=[])
+        self.parser.add_argument("-f", "--flag", action="count", default=0)
+        self.parser.add_argument("files", nargs="*")
+
+    def __call__(self, args):
+        pass
+
+
+def cold(*args):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))] + sys.path)
+    env.pop("YACLIFW_SERVER", None)
+    subprocess.check_call(
+        [sys.executable, "-m", "yaclifw.main"] + list(args), env=env,
+        stdout=subprocess.DEVNULL)
+
+
+@pytest.fixture(scope="module")
+def pyz(tmpdir_factory):
+    from yaclifw.bundle import build
+    return build(str(tmpdir_factory.mktemp("bundle").join("yaclifw.pyz")))
+
+
+def cold_pyz(pyz, *args):
+    env = dict(os.environ)
+    env.pop("PYTHONPATH", None)
+    env.pop("YACLIFW_SERVER", None)
+    subprocess.check_call([sys.executable, pyz] + list(args), env=env,
+                          stdout=subprocess.DEVNULL)
+
+
+class TestStartup(object):
+
+    @pytest.mark.benchmark(group="cold")
+    def testColdEntryPoint(self, benchmark):
+        benchmark.pedantic(cold, args=("-h",), rounds=10, warmup_rounds=1)
+
+    @pytest.mark.benchmark(group="cold")
+    def testColdZipapp(self, benchmark, pyz):
+        benchmark.pedantic(cold_pyz, args=(pyz, "-h"), rounds=10,
+                           warmup_rounds=1)
+
+    def testWarmEntryPoint(self, benchmark, monkeypatch, capsys):
+        monkeypatch.setattr("sys.argv", ["yaclifw", "-h"])
+        monkeypatch.delenv("YACLIFW_SERVER", raising=False)
+
+        def warm():
+            with pytest.raises(SystemExit):
+                entry_point()
+        warm()
+        benchmark(warm)
+
+    @pytest.mark.parametrize("lazy", (False, True))
+    @pytest.mark.parametrize("count", SIZES)
+    def testMain(self, benchmark, count, lazy):
+        items = synthetic(count)
+        benchmark(main, "bench", ["cmd0000", "--value=1"], items=items,
+                  lazy=lazy)
+
+
+class TestParsing(object):
+
+    @pytest.mark.parametrize("depth", (10, 100, 1000, 10000))
+    def testParseArgs(self, benchmark, depth):
+        app = App("bench", [("deep", DeepCommand)])
+        args = ["deep"]
+        for i in range(depth):
+            args += ["--option", str(i), "-f"]
+        args += ["file%d" % i for i in range(depth)]
+        ns = benchmark(app.parse, args)
+        assert len(ns.files) == depth
+
+
+class TestHelp(object):
+
+    @pytest.mark.parametrize("count", SIZES)
+    def testTopLevel(self, benchmark, count):
+        app = App("bench", synthetic(count))
+        text = benchmark(app.parser.format_help)
+        assert "cmd0000" in text
+
+    @pytest.mark.parametrize("count", SIZES)
+    def testStubs(self, benchmark, count):
+        items = synthetic(count)
+
+        def render():
+            return App("bench", items, lazy=True).stub_parser().format_help()
+        assert "cmd0000" in benchmark(render)
+
+    def testCommand(self, benchmark):
+        app = App("bench", [("deep", DeepCommand)])
+        parser = app.commands["deep"].parser
+        assert "--option" in benchmark(parser.format_help)
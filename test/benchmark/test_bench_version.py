@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Benchmarks of get_git_version() in a git checkout, with and
+without the describe cache, and in an unpacked release.
+"""
+
+from __future__ import absolute_import
+import subprocess
+import pytest
+
+from yaclifw.version import get_git_version
+from yaclifw.version import reset_version_cache
+from yaclifw.version import write_release_version
+
+pytest.importorskip("pytest_benchmark")
+
+try:
+    subprocess.check_output(["git", "--version"])
+    HAS_GIT = True
+except Exception:
+    HAS_GIT = False
+
+
+def git(path, *args):
+    env = {"GIT_AUTHOR_NAME": "bench", "GIT_AUTHOR_EMAIL": "b@example.com",
+           "GIT_COMMITTER_NAME": "bench",
+           "GIT_COMMITTER_EMAIL": "b@example.com",
+           "GIT_CONFIG_NOSYSTEM": "1", "HOME": str(path)}
+    subprocess.check_call(("git",) + args, cwd=str(path), env=env,
+                          stdout=subprocess.DEVNULL)
+
+
+@pytest.fixture
+def checkout(tmpdir):
+    git(tmpdir, "init", "-q")
+    for i in range(50):
+        git(tmpdir, "commit", "-q", "--allow-empty", "-m", "c%d" % i)
+        if i % 10 == 0:
+            git(tmpdir, "tag", "-a", "1.%d.0" % i, "-m", "1.%d.0" % i)
+    return str(tmpdir.join("module.py"))
+
+
+@pytest.mark.skipif(not HAS_GIT, reason="git not installed")
+class TestGitCheckout(object):
+
+    def testUncached(self, benchmark, checkout):
+        def uncached():
+            reset_version_cache(checkout)
+            return get_git_version(checkout)
+        assert benchmark(uncached).startswith("1.40.0")
+
+    def testCached(self, benchmark, checkout):
+        get_git_version(checkout)
+        assert benchmark(get_git_version, checkout).startswith("1.40.0")
+
+    def testPacked(self, benchmark, checkout, tmpdir):
+        git(tmpdir, "gc", "-q")
+
+        def uncached():
+            reset_version_cache(checkout)
+            return get_git_version(checkout)
+        assert benchmark(uncached).startswith("1.40.0")
+
+
+class TestRelease(object):
+
+    def testReleaseVersion(self, benchmark, tmpdir):
+        module_file = str(tmpdir.join("module.py"))
+        write_release_version(module_file, "2.0.0")
+        assert benchmark(get_git_version, module_file) == "2.0.0"
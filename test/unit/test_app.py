@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import logging
+import threading
+import pytest
+
+from yaclifw import framework
+from yaclifw.framework import App
+from yaclifw.framework import Command
+from yaclifw.framework import Stop
+
+
+BUILT = []
+
+
+class SumCommand(Command):
+    """Adds numbers"""
+
+    NAME = "sum"
+
+    def __init__(self, sub_parsers):
+        super(SumCommand, self).__init__(sub_parsers)
+        self.parser.add_argument("numbers", nargs="*", type=int)
+        BUILT.append(self.NAME)
+
+    def __call__(self, args):
+        raise Stop(sum(args.numbers), self.log.name)
+
+
+class OtherCommand(Command):
+    """Never selected"""
+
+    NAME = "other"
+
+    def __init__(self, sub_parsers):
+        super(OtherCommand, self).__init__(sub_parsers)
+        BUILT.append(self.NAME)
+
+
+class TalkCommand(Command):
+    """Logs once all runs have started"""
+
+    NAME = "talk"
+    barrier = None
+
+    def __init__(self, sub_parsers):
+        super(TalkCommand, self).__init__(sub_parsers)
+        self.parser.add_argument("n", type=int)
+
+    def __call__(self, args):
+        super(TalkCommand, self).__call__(args)
+        self.barrier.wait(5)
+        self.log.debug("debug %d", args.n)
+        self.log.info("info %d", args.n)
+        self.log.warning("warning %d", args.n)
+        self.barrier.wait(5)
+        raise Stop(self.log_level, "")
+
+
+ITEMS = [("sum", SumCommand), ("other", OtherCommand),
+         ("talk", TalkCommand)]
+
+
+def rc(app, args):
+    with pytest.raises(Stop) as exc:
+        app.run(args)
+    return exc.value.rc
+
+
+class TestApp(object):
+
+    def setup_method(self, method):
+        del BUILT[:]
+
+    def testBuiltOnce(self):
+        app = App("test", ITEMS)
+        assert sorted(BUILT) == ["other", "sum"]
+        assert rc(app, ["sum", "1", "2"]) == 3
+        assert rc(app, ["sum", "4"]) == 4
+        assert sorted(BUILT) == ["other", "sum"]
+
+    def testInstanceState(self, monkeypatch):
+        monkeypatch.setenv("EMBEDDED_DEBUG_LEVEL", "10")
+        app = App("embedded", ITEMS)
+        assert app.debug_level == 10
+        assert app.commands["sum"].default_log_level == 10
+        with pytest.raises(Stop) as exc:
+            app.run(["sum"])
+        assert str(exc.value) == "embedded.sum"
+        assert framework.FRAMEWORK_NAME != "embedded"
+
+    def testLazy(self, capsys):
+        app = App("test", ITEMS, lazy=True)
+        assert BUILT == []
+        for i in range(2):
+            with pytest.raises(SystemExit):
+                app.run(["-h"])
+        out, err = capsys.readouterr()
+        assert "Never selected" in out
+        assert BUILT == []
+        assert rc(app, ["sum", "5"]) == 5
+        assert rc(app, ["sum", "6"]) == 6
+        assert BUILT == ["sum"]
+
+    @pytest.mark.parametrize('lazy', [False, True])
+    def testThreads(self, lazy):
+        app = App("test", ITEMS, lazy=lazy)
+        results = {}
+
+        def work(n):
+            results[n] = [rc(app, ["sum", str(n), str(i)])
+                          for i in range(50)]
+
+        threads = [threading.Thread(target=work, args=(n,))
+                   for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for n in range(8):
+            assert results[n] == [n + i for i in range(50)]
+        assert BUILT.count("sum") == 1
+
+    def testThreadLevels(self, capsys):
+        # pytest adds handlers of its own while each test runs
+        del logging.getLogger().handlers[:]
+        app = App("test", ITEMS)
+        options = ["-v", "-q", "", "-vv"]
+        TalkCommand.barrier = threading.Barrier(len(options))
+        results = {}
+
+        def work(n):
+            args = ["talk", str(n)] + [o for o in [options[n]] if o]
+            results[n] = rc(app, args)
+
+        threads = [threading.Thread(target=work, args=(n,))
+                   for n in range(len(options))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == {0: 10, 1: 30, 2: 20, 3: 0}
+        lines = capsys.readouterr()[1]
+        for n, levels in enumerate([("debug", "info", "warning"),
+                                    ("warning",), ("info", "warning"),
+                                    ("debug", "info", "warning")]):
+            logged = tuple(level for level in ("debug", "info", "warning")
+                           if "%s %d" % (level, n) in lines)
+            assert logged == levels
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import argparse
+import asyncio
+import pytest
+
+from yaclifw.framework import main
+from yaclifw.framework import Command
+from yaclifw.framework import Stop
+
+
+EVENTS = []
+
+
+class AsyncCommand(Command):
+    """A coroutine command"""
+
+    NAME = "async"
+
+    def __init__(self, sub_parsers):
+        super(AsyncCommand, self).__init__(sub_parsers)
+        self.parser.add_argument("--mode", default="ok")
+        self.parser.add_argument(
+            '--callback', default=self.cb, help=argparse.SUPPRESS)
+
+    async def __call__(self, args):
+        super(AsyncCommand, self).__call__(args)
+        self.loop = asyncio.get_running_loop()
+        if args.mode == "stop":
+            raise Stop(7, "stopped")
+        elif args.mode == "cancel":
+            asyncio.current_task().cancel()
+        elif args.mode == "interrupt":
+            def interrupt():
+                raise KeyboardInterrupt()
+            self.loop.call_later(0.01, interrupt)
+        try:
+            await asyncio.sleep(0 if args.mode == "ok" else 10)
+        except asyncio.CancelledError:
+            EVENTS.append("cleanup")
+            raise
+        EVENTS.append("call")
+
+    async def cb(self):
+        assert asyncio.get_running_loop() is self.loop
+        EVENTS.append("cb")
+
+
+class SyncCommand(Command):
+    """A plain command with a coroutine callback"""
+
+    NAME = "sync"
+
+    def __init__(self, sub_parsers):
+        super(SyncCommand, self).__init__(sub_parsers)
+        self.parser.add_argument(
+            '--callback', default=self.cb, help=argparse.SUPPRESS)
+
+    def __call__(self, args):
+        EVENTS.append("call")
+
+    async def cb(self):
+        await asyncio.sleep(0)
+        EVENTS.append("cb")
+
+
+ITEMS = [("async", AsyncCommand), ("sync", SyncCommand)]
+
+
+class TestAsync(object):
+
+    def setup_method(self, method):
+        del EVENTS[:]
+
+    def testCoroutine(self):
+        main("test", ["async"], items=ITEMS)
+        assert EVENTS == ["call", "cb"]
+
+    def testCoroutineCallback(self):
+        main("test", ["sync"], items=ITEMS)
+        assert EVENTS == ["call", "cb"]
+
+    def testStop(self):
+        with pytest.raises(Stop) as exc:
+            main("test", ["async", "--mode=stop"], items=ITEMS)
+        assert exc.value.rc == 7
+
+    def testCancelled(self):
+        with pytest.raises(Stop) as exc:
+            main("test", ["async", "--mode=cancel"], items=ITEMS)
+        assert exc.value.rc == 1
+        assert EVENTS == ["cleanup"]
+
+    def testKeyboardInterrupt(self):
+        with pytest.raises(KeyboardInterrupt):
+            main("test", ["async", "--mode=interrupt"], items=ITEMS)
+        assert EVENTS == ["cleanup"]
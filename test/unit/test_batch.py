@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import pytest
+
+from yaclifw.framework import main
+from yaclifw.framework import Batch
+from yaclifw.framework import Command
+from yaclifw.framework import Stop
+
+
+CALLS = []
+
+
+class EchoCommand(Command):
+    """Records its arguments"""
+
+    NAME = "echo"
+
+    def __init__(self, sub_parsers):
+        super(EchoCommand, self).__init__(sub_parsers)
+        self.parser.add_argument("words", nargs="*")
+        self.parser.add_argument("--rc", type=int, default=0)
+        CALLS.append("init")
+
+    def __call__(self, args):
+        super(EchoCommand, self).__call__(args)
+        CALLS.append((args.words, self.log_level))
+        if args.rc:
+            raise Stop(args.rc, "echo failed")
+
+
+ITEMS = [("batch", Batch), ("echo", EchoCommand)]
+
+
+class TestBatch(object):
+
+    def setup_method(self, method):
+        del CALLS[:]
+
+    def run(self, tmpdir, lines, *args):
+        batch = tmpdir.join("batch.txt")
+        batch.write("\n".join(lines) + "\n")
+        main("test", ["batch", str(batch)] + list(args), items=ITEMS,
+             lazy=True)
+
+    def testParsersBuiltOnce(self, tmpdir):
+        self.run(tmpdir, ["echo a", "", "# comment", "echo 'b c' -v",
+                          "echo d"])
+        assert CALLS == ["init", (["a"], 20), (["b c"], 10), (["d"], 20)]
+
+    def testFailures(self, tmpdir, capsys):
+        with pytest.raises(Stop) as exc:
+            self.run(tmpdir, ["echo a", "echo --rc=4", "echo --bogus",
+                              "unknown", "batch", "echo b"])
+        assert exc.value.rc == 4
+        assert str(exc.value) == "4 of 6 command lines failed"
+        assert CALLS[-1] == (["b"], 20)
+        out, err = capsys.readouterr()
+        assert "echo failed" in out
+
+    def testStopOnError(self, tmpdir):
+        with pytest.raises(Stop) as exc:
+            self.run(tmpdir, ["echo a", "echo --rc=3", "echo b"],
+                     "--stop-on-error")
+        assert exc.value.rc == 3
+        assert str(exc.value) == "1 of 2 command lines failed"
+        assert CALLS == ["init", (["a"], 20), ([], 20)]
+
+    def testBadQuoting(self, tmpdir, caplog):
+        with pytest.raises(Stop) as exc:
+            self.run(tmpdir, ["echo a", 'echo "b', "echo c"])
+        assert exc.value.rc == 2
+        assert str(exc.value) == "1 of 3 command lines failed"
+        assert CALLS == ["init", (["a"], 20), (["c"], 20)]
+        assert "line 2: No closing quotation" in caplog.text
+
+        del CALLS[:]
+        with pytest.raises(Stop):
+            self.run(tmpdir, ["echo a", 'echo "b', "echo c"],
+                     "--stop-on-error")
+        assert CALLS == ["init", (["a"], 20)]
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import json
+import os
+import subprocess
+import sys
+import zipfile
+import pytest
+
+from yaclifw.bundle import build
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+# Runs a script, recording the files which it opens
+OPENS = """
+import json, runpy, sys
+opened = set()
+
+def hook(event, args):
+    if event == "open" and isinstance(args[0], str):
+        opened.add(args[0])
+
+sys.addaudithook(hook)
+target, sys.argv = sys.argv[1], sys.argv[1:]
+try:
+    if target.endswith(".pyz"):
+        runpy.run_path(target, run_name="__main__")
+    else:
+        runpy.run_module(target, run_name="__main__", alter_sys=True)
+except SystemExit:
+    pass
+sys.stderr.write(json.dumps(sorted(opened)))
+"""
+
+
+@pytest.fixture(scope="module")
+def pyz(tmpdir_factory):
+    return str(build(str(tmpdir_factory.mktemp("bundle").join("y.pyz"))))
+
+
+def run(*args, **kwargs):
+    env = dict(os.environ, PYTHONPATH=ROOT, **kwargs)
+    env.pop("YACLIFW_SERVER", None)
+    return subprocess.run([sys.executable] + list(args), env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+
+
+class TestBundle(object):
+
+    def testContents(self, pyz):
+        names = zipfile.ZipFile(pyz).namelist()
+        assert "__main__.py" in names
+        assert "yaclifw/_version.pyc" in names
+        assert [n for n in names if n.endswith(".py")] == ["__main__.py"]
+        with open(pyz, "rb") as f:
+            assert f.readline().startswith(b"#!")
+
+    def testRun(self, pyz, tmpdir):
+        env = {"YACLIFW_CACHE_DIR": str(tmpdir)}
+        out = run(pyz, "-h", **env).stdout
+        for name in ("batch", "completion", "example", "version"):
+            assert name in out
+        assert run(pyz, "version", **env).stdout.strip()
+        assert os.listdir(str(tmpdir)) == []  # No index, no help cache
+
+    def testFewerOpens(self, pyz, tmpdir):
+        env = {"YACLIFW_CACHE_DIR": str(tmpdir)}
+        run("-m", "yaclifw.main", "-h", **env)  # Fill the caches
+
+        def opened(target):
+            stderr = run("-c", OPENS, target, "-h", **env).stderr
+            return [f for f in json.loads(stderr)
+                    if not f.startswith(sys.base_prefix)]
+        installed = opened("yaclifw.main")
+        bundled = opened(pyz)
+        assert set(bundled) == set([pyz])
+        assert len(installed) > len(set(bundled))
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import io
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import pytest
+
+from yaclifw import cancel
+from yaclifw.framework import App
+from yaclifw.framework import Batch
+from yaclifw.framework import Command
+from yaclifw.framework import Stop
+from yaclifw.parallel import ParallelCommand
+
+
+class SlowCommand(Command):
+    """Takes its time"""
+
+    NAME = "slow"
+
+    def __init__(self, sub_parsers):
+        super(SlowCommand, self).__init__(sub_parsers)
+        self.parser.add_argument(
+            "mode", choices=("sleep", "loop", "child", "term", "quick"))
+
+    def __call__(self, args):
+        if args.mode == "sleep":
+            time.sleep(10)  # Never looks at the token
+        elif args.mode == "loop":
+            while True:
+                self.token.check()
+                time.sleep(0.01)
+        elif args.mode == "child":
+            self.child = subprocess.Popen(
+                [sys.executable, "-c", "import time; time.sleep(30)"])
+            with self.token.terminating(self.child):
+                self.child.wait()
+        elif args.mode == "term":
+            os.kill(os.getpid(), signal.SIGTERM)
+            time.sleep(10)
+
+
+def snooze(item):
+    time.sleep(10)
+
+
+class FanCommand(ParallelCommand):
+    """Waits in a pool"""
+
+    NAME = "fan"
+
+    def __call__(self, args):
+        for item in self.fan_out(snooze, range(4), args):
+            pass
+
+
+ITEMS = [("batch", Batch), ("fan", FanCommand), ("slow", SlowCommand)]
+
+
+def run(*args):
+    app = App("test", ITEMS)
+    start = time.time()
+    with pytest.raises(Stop) as exc:
+        app.run(list(args))
+    return exc.value, time.time() - start
+
+
+class TestToken(object):
+
+    def testCancel(self):
+        token = cancel.Token()
+        calls = []
+        token.on_cancel(calls.append)
+        token.check()
+        token.cancel()
+        token.cancel()
+        assert token.cancelled
+        assert len(calls) == 1
+        assert isinstance(calls[0], cancel.Cancelled)
+        with pytest.raises(cancel.Cancelled):
+            token.check()
+        token.on_cancel(calls.append)
+        assert len(calls) == 2
+
+    def testDeadline(self):
+        token = cancel.Token(0.05)
+        assert not token.cancelled
+        assert token.wait(5)
+        with pytest.raises(cancel.TimedOut) as exc:
+            token.check()
+        assert exc.value.rc == cancel.TIMEOUT_RC
+
+    def testParent(self):
+        parent = cancel.Token(60)
+        child = cancel.Token(None, parent)
+        assert child.deadline == parent.deadline
+        parent.cancel()
+        assert child.cancelled
+
+    def testOutsideRun(self):
+        assert not cancel.current().cancelled
+
+
+class TestTimeout(object):
+
+    def testUncooperative(self):
+        stop, elapsed = run("slow", "sleep", "--timeout=0.2")
+        assert stop.rc == cancel.TIMEOUT_RC
+        assert elapsed < 5
+        assert signal.getsignal(signal.SIGALRM) == signal.SIG_DFL
+        assert signal.getsignal(signal.SIGINT) == signal.default_int_handler
+
+    @pytest.mark.parametrize("args", [["slow", "quick"],
+                                      ["slow", "quick", "--timeout=5"]])
+    def testHostTimer(self, args):
+        signal.setitimer(signal.ITIMER_REAL, 100, 50)
+        try:
+            App("test", ITEMS).run(args)
+            value, interval = signal.getitimer(signal.ITIMER_REAL)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        assert 99 < value <= 100
+        assert interval == 50
+
+    def testEnvironment(self, monkeypatch):
+        monkeypatch.setenv("TEST_TIMEOUT", "0.2")
+        stop, elapsed = run("slow", "loop")
+        assert stop.rc == cancel.TIMEOUT_RC
+
+    @pytest.mark.parametrize("name,value", [
+        ("TEST_TIMEOUT", "abc"), ("TEST_MAX_CPU", "abc"),
+        ("TEST_MAX_RSS", "lots")])
+    def testInvalidEnvironment(self, monkeypatch, caplog, name, value):
+        monkeypatch.setenv(name, value)
+        App("test", ITEMS).run(["slow", "quick"])
+        assert "Ignoring %s=%s" % (name, value) in caplog.text
+
+    def testThread(self):
+        # No signals outside of the main thread: the token is checked
+        result = []
+
+        def target():
+            try:
+                App("test", ITEMS).run(["slow", "loop", "--timeout=0.2"])
+            except Stop as stop:
+                result.append(stop.rc)
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join(5)
+        assert result == [cancel.TIMEOUT_RC]
+
+    def testChildTerminated(self):
+        app = App("test", ITEMS)
+        with pytest.raises(Stop):
+            app.run(["slow", "child", "--timeout=0.3"])
+        child = app.commands["slow"].child
+        assert child.wait(5) == -signal.SIGTERM
+
+    def testTerminated(self):
+        stop, elapsed = run("slow", "term")
+        assert stop.rc == cancel.TERMINATED_RC
+        assert signal.getsignal(signal.SIGTERM) == signal.SIG_DFL
+
+    def testPool(self):
+        stop, elapsed = run("fan", "-j2", "--executor=process",
+                            "--timeout=0.5")
+        assert stop.rc == cancel.TIMEOUT_RC
+        assert elapsed < 5
+
+    def testBatchLine(self, monkeypatch, capsys):
+        monkeypatch.setattr("sys.stdin", io.StringIO(
+            "slow loop --timeout=0.1\nslow quick\n"))
+        stop, elapsed = run("batch")
+        assert stop.rc == cancel.TIMEOUT_RC
+        assert "1 of 2 command lines failed" in str(stop)
+
+    def testBatchDeadline(self, monkeypatch, capsys):
+        monkeypatch.setattr("sys.stdin", io.StringIO(
+            "slow loop\nslow quick\n"))
+        stop, elapsed = run("batch", "--timeout=0.2")
+        assert isinstance(stop, cancel.TimedOut)
+        assert "Timed out" in str(stop)
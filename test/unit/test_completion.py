@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import subprocess
+import pytest
+
+from yaclifw.completion import Completion
+from yaclifw.completion import dynamic
+from yaclifw.completion import script
+from yaclifw.framework import App
+from yaclifw.framework import Command
+from yaclifw.framework import Stop
+
+
+class RepoCommand(Command):
+    """Works on a repository"""
+
+    NAME = "repo"
+
+    def __init__(self, sub_parsers):
+        super(RepoCommand, self).__init__(sub_parsers)
+        self.parser.add_argument("--mode", choices=("fast", "slow"))
+        dynamic(self.parser.add_argument("--name"), self.names)
+        self.parser.add_argument("action", choices=("pull", "push"))
+
+    def names(self, prefix):
+        return ["origin", "upstream", "other"]
+
+    def __call__(self, args):
+        pass
+
+
+ITEMS = [("completion", Completion), ("repo", RepoCommand)]
+
+try:
+    subprocess.check_output(["bash", "--version"])
+    HAS_BASH = True
+except Exception:
+    HAS_BASH = False
+
+
+class TestCompletion(object):
+
+    def generate(self, capsys, shell, lazy=True):
+        App("test", ITEMS, lazy=lazy).run(
+            ["completion", shell, "--prog", "tool"])
+        return capsys.readouterr()[0]
+
+    @pytest.mark.parametrize("shell", ("bash", "zsh", "fish"))
+    def testScripts(self, capsys, shell):
+        text = self.generate(capsys, shell)
+        assert "tool" in text
+        for word in ("repo", "mode", "fast", "slow", "push"):
+            assert word in text
+        assert "completion --values repo name" in text
+        # Only the flagged argument calls back into Python
+        assert text.count("--values") == 1
+
+    def testLazyMatchesEager(self, capsys):
+        assert self.generate(capsys, "zsh", lazy=True) == \
+            self.generate(capsys, "zsh", lazy=False)
+
+    def testValues(self, capsys):
+        App("test", ITEMS, lazy=True).run(
+            ["completion", "--values", "repo", "name", "o"])
+        assert capsys.readouterr()[0].split() == ["origin", "other"]
+
+    def testNotDynamic(self):
+        with pytest.raises(Stop) as exc:
+            App("test", ITEMS).run(
+                ["completion", "--values", "repo", "mode"])
+        assert exc.value.rc == 2
+
+    def testHelpQuoted(self):
+        app = App("test", ITEMS)
+        app.commands["repo"].parser.add_argument(
+            "--quote", help="It's [a]: test")
+        text = script("zsh", "tool", app.parser)
+        assert "'--quote[It'\\''s \\[a\\]\\: test]:quote:_files'" in text
+
+    @pytest.mark.skipif(not HAS_BASH, reason="bash not installed")
+    @pytest.mark.parametrize("words,expected", (
+        (["tool", "r"], ["repo"]),
+        (["tool", "repo", "--mode", ""], ["fast", "slow"]),
+        (["tool", "-h", "repo", "p"], ["pull", "push"]),
+        (["tool", "repo", "--mo"], ["--mode"]),
+    ))
+    def testBash(self, capsys, tmpdir, words, expected):
+        path = tmpdir.join("tool.bash")
+        path.write(self.generate(capsys, "bash"))
+        command = "source %s; COMP_WORDS=(%s); COMP_CWORD=%d; _tool; " \
+            "echo ${COMPREPLY[@]}" % (
+                path, " ".join("'%s'" % w for w in words), len(words) - 1)
+        output = subprocess.check_output(["bash", "-c", command])
+        assert output.decode("utf-8").split() == expected
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import os
+import subprocess
+import pytest
+
+from yaclifw.describe import describe
+from yaclifw.describe import find_git_dir
+from yaclifw.describe import Unsupported
+from yaclifw.version import call_git_describe
+
+try:
+    subprocess.check_output(["git", "--version"])
+    HAS_GIT = True
+except Exception:
+    HAS_GIT = False
+
+pytestmark = pytest.mark.skipif(not HAS_GIT, reason="git not installed")
+
+
+class Repo(object):
+    """
+    A throw-away repository with deterministic commit dates
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.time = 1400000000
+        self.git("init", "-q")
+
+    def git(self, *args):
+        env = dict(os.environ)
+        env.update({
+            "GIT_AUTHOR_NAME": "test", "GIT_AUTHOR_EMAIL": "t@example.com",
+            "GIT_COMMITTER_NAME": "test",
+            "GIT_COMMITTER_EMAIL": "t@example.com",
+            "GIT_AUTHOR_DATE": "%d +0000" % self.time,
+            "GIT_COMMITTER_DATE": "%d +0000" % self.time})
+        return subprocess.check_output(
+            ("git",) + args, cwd=self.path, env=env,
+            stderr=subprocess.STDOUT).decode("utf-8").strip()
+
+    def commit(self, message="commit"):
+        self.time += 60
+        self.git("commit", "-q", "--allow-empty", "-m", message)
+
+    def tag(self, name, annotated=True):
+        self.time += 1
+        if annotated:
+            self.git("tag", "-a", name, "-m", name)
+        else:
+            self.git("tag", name)
+
+    def expected(self, abbrev=4):
+        try:
+            return self.git("describe", "--match=[v0-9][.0-9]*",
+                            "--abbrev=%d" % abbrev)
+        except subprocess.CalledProcessError:
+            return None
+
+    def check(self, abbrev=4):
+        expected = self.expected(abbrev)
+        assert describe(find_git_dir(self.path), abbrev) == expected
+        return expected
+
+
+@pytest.fixture
+def repo(tmpdir):
+    return Repo(str(tmpdir.mkdir("repo")))
+
+
+class TestDescribe(object):
+
+    def testNoCommits(self, repo):
+        assert describe(find_git_dir(repo.path)) is None
+
+    def testNoTags(self, repo):
+        repo.commit()
+        assert repo.check() is None
+
+    def testExactTag(self, repo):
+        repo.commit()
+        repo.tag("v1.0.0")
+        assert repo.check() == "v1.0.0"
+
+    @pytest.mark.parametrize('abbrev', [0, 4, 7, 40])
+    def testAbbrev(self, repo, abbrev):
+        repo.commit()
+        repo.tag("1.0.0")
+        repo.commit()
+        repo.commit()
+        repo.check(abbrev)
+
+    def testIgnoredTags(self, repo):
+        repo.commit()
+        repo.tag("v1.0.0")
+        repo.commit()
+        repo.tag("v1.1.0", annotated=False)
+        repo.commit()
+        repo.tag("release-2", annotated=True)
+        repo.commit()
+        assert repo.check().startswith("v1.0.0-3-g")
+
+    def testNewestTagOnCommit(self, repo):
+        repo.commit()
+        repo.tag("v1.0.0")
+        repo.tag("v1.0.1")
+        assert repo.check() == "v1.0.1"
+
+    def testMerge(self, repo):
+        repo.commit()
+        repo.tag("v1.0.0")
+        repo.git("checkout", "-q", "-b", "feature")
+        repo.commit()
+        repo.tag("v2.0.0-rc1")
+        repo.commit()
+        repo.git("checkout", "-q", "-")
+        repo.commit()
+        repo.commit()
+        repo.commit()
+        repo.tag("v1.1.0")
+        repo.commit()
+        repo.git("merge", "-q", "--no-ff", "-m", "merge", "feature")
+        repo.check()
+
+    def testPacked(self, repo):
+        for i in range(20):
+            repo.commit()
+            if i % 5 == 0:
+                repo.tag("v1.%d.0" % i)
+        repo.git("gc", "-q", "--aggressive")
+        assert not os.listdir(os.path.join(repo.path, ".git", "refs", "tags"))
+        repo.commit()
+        assert repo.check().startswith("v1.15.0-5-g")
+
+    def testWorktree(self, repo, tmpdir):
+        repo.commit()
+        repo.tag("v1.0.0")
+        repo.commit()
+        worktree = str(tmpdir.join("worktree"))
+        repo.git("worktree", "add", "-q", "-b", "other", worktree)
+        expected = repo.check()
+        assert describe(find_git_dir(worktree)) == expected
+
+    def testShallowUnsupported(self, repo):
+        repo.commit()
+        open(os.path.join(repo.path, ".git", "shallow"), "w").close()
+        with pytest.raises(Unsupported):
+            describe(find_git_dir(repo.path))
+
+    def testCallGitDescribe(self, repo):
+        repo.commit()
+        repo.tag("v1.0.0")
+        repo.commit()
+        cwd = os.getcwd()
+        assert call_git_describe(4, repo.path) == repo.expected()
+        assert os.getcwd() == cwd
+
+    def testFallback(self, repo, monkeypatch):
+        repo.commit()
+        repo.tag("v1.0.0")
+
+        def unsupported(git_dir, abbrev):
+            raise Unsupported("test")
+        import yaclifw.version
+        monkeypatch.setattr(yaclifw.version, "describe", unsupported)
+        assert call_git_describe(4, repo.path) == "v1.0.0"
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import os
+import sys
+import pytest
+
+import yaclifw.discovery
+from yaclifw.discovery import discover
+from yaclifw.discovery import index_file
+from yaclifw.framework import main
+
+
+PLUGIN = '''
+from yaclifw.framework import Command
+
+
+class PluginCommand(Command):
+    """Command found via an entry point"""
+
+    NAME = "plugin"
+
+    def __call__(self, args):
+        print("plugin called")
+
+
+class OtherCommand(Command):
+    """Another command"""
+
+    NAME = "other"
+'''
+
+
+class TestDiscovery(object):
+
+    @pytest.fixture(autouse=True)
+    def plugin(self, tmpdir, monkeypatch):
+        tmpdir.mkdir("plugin").join("yaclifw_test_plugin.py").write(PLUGIN)
+        monkeypatch.syspath_prepend(str(tmpdir.join("plugin")))
+        monkeypatch.setattr(sys, "dont_write_bytecode", True)
+        monkeypatch.setenv("TEST_CACHE_DIR", str(tmpdir.join("cache")))
+        monkeypatch.setattr(
+            yaclifw.discovery, "_entry_points", lambda group: [
+                ("plugin", "yaclifw_test_plugin:PluginCommand"),
+                ("other", "yaclifw_test_plugin:OtherCommand")])
+        yield
+        sys.modules.pop("yaclifw_test_plugin", None)
+
+    def forget(self):
+        sys.modules.pop("yaclifw_test_plugin", None)
+
+    def testIndex(self):
+        items = discover("test")
+        assert [name for name, ref in items] == ["other", "plugin"]
+        assert items[1][1].help == "Command found via an entry point"
+        assert os.path.isfile(index_file("test", "test.commands"))
+
+    def testCachedIndexImportsNothing(self, monkeypatch):
+        discover("test")
+        self.forget()
+
+        def fail(group):
+            raise AssertionError("index should be cached")
+        monkeypatch.setattr(yaclifw.discovery, "_entry_points", fail)
+        items = discover("test")
+        assert len(items) == 2
+        assert "yaclifw_test_plugin" not in sys.modules
+
+    def testStampInvalidates(self, monkeypatch):
+        discover("test")
+        monkeypatch.setattr(yaclifw.discovery, "_entry_points",
+                            lambda group: [])
+        monkeypatch.setattr(yaclifw.discovery, "_stamp", lambda: [])
+        assert discover("test") == []
+
+    def testStamp(self, tmpdir, monkeypatch):
+        from yaclifw.discovery import _stamp
+        site = tmpdir.mkdir("site-packages")
+        os.utime(str(site), (1, 1))
+        monkeypatch.setattr(sys, "path", [str(tmpdir), "", str(site)])
+        assert _stamp() == [[str(site), 1]]
+        site.mkdir("yaclifw_test-1.0.dist-info")
+        assert _stamp() != [[str(site), 1]]
+
+    def testHelpImportsNothing(self, capsys):
+        items = discover("test")
+        self.forget()
+        with pytest.raises(SystemExit):
+            main("test", ["-h"], items=items, lazy=True)
+        out, err = capsys.readouterr()
+        assert "Command found via an entry point" in out
+        assert "yaclifw_test_plugin" not in sys.modules
+
+    def testDispatch(self, capsys):
+        items = discover("test")
+        self.forget()
+        main("test", ["plugin"], items=items, lazy=True)
+        out, err = capsys.readouterr()
+        assert out == "plugin called\n"
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import os
+import pytest
+
+from yaclifw import helpcache
+from yaclifw.framework import App
+from yaclifw.framework import Command
+
+
+CONSTRUCTED = []
+
+
+class AlphaCommand(Command):
+    """First command
+
+    With a longer description.
+    """
+
+    NAME = "alpha"
+
+    def __init__(self, sub_parsers):
+        super(AlphaCommand, self).__init__(sub_parsers)
+        CONSTRUCTED.append(self.NAME)
+        self.parser.add_argument("--level", type=int)
+
+    def __call__(self, args):
+        pass
+
+
+ITEMS = [("alpha", AlphaCommand)]
+
+
+class TestHelpCache(object):
+
+    @pytest.fixture(autouse=True)
+    def cache(self, tmpdir, monkeypatch):
+        del CONSTRUCTED[:]
+        self.dir = tmpdir.join("cache")
+        monkeypatch.setenv("TEST_CACHE_DIR", str(self.dir))
+        monkeypatch.delenv("TEST_HELP_CACHE", raising=False)
+        self.version = "1.0"
+        monkeypatch.setattr(helpcache, "cache_version",
+                            lambda package: self.version)
+
+    def help(self, capsys, *args, **kwargs):
+        kwargs.setdefault("lazy", True)
+        app = App("test", ITEMS, package="test", **kwargs)
+        with pytest.raises(SystemExit) as exc:
+            app.run(list(args))
+        assert exc.value.code == 0
+        return capsys.readouterr()[0]
+
+    def files(self):
+        return sorted(os.listdir(str(self.dir)))
+
+    def testRequest(self):
+        names = ["alpha"]
+        assert helpcache.help_request(["-h"], names) == ""
+        assert helpcache.help_request(["alpha", "--help"], names) == "alpha"
+        assert helpcache.help_request(["beta", "-h"], names) is None
+        assert helpcache.help_request(["alpha", "-v", "-h"], names) is None
+        assert helpcache.help_request([], names) is None
+
+    def testTopLevel(self, capsys):
+        first = self.help(capsys, "-h")
+        assert "First command" in first
+        assert "longer description" not in first
+        assert self.help(capsys, "-h") == first
+        assert len(self.files()) == 1
+        assert CONSTRUCTED == []
+
+    def testCommand(self, capsys):
+        first = self.help(capsys, "alpha", "-h")
+        assert "--level" in first
+        assert CONSTRUCTED == ["alpha"]
+        assert self.help(capsys, "alpha", "--help") == first
+        assert CONSTRUCTED == ["alpha"]
+
+    def testNewVersion(self, capsys):
+        self.help(capsys, "alpha", "-h")
+        old = self.files()
+        self.version = "2.0"
+        self.help(capsys, "alpha", "-h")
+        assert CONSTRUCTED == ["alpha", "alpha"]
+        assert len(self.files()) == 1
+        assert self.files() != old
+
+    def testEnvironmentInKey(self, capsys, monkeypatch):
+        self.help(capsys, "alpha", "-h")
+        monkeypatch.setenv("TEST_PROFILE", "mem")
+        self.help(capsys, "alpha", "-h")
+        assert CONSTRUCTED == ["alpha", "alpha"]
+
+    @pytest.mark.parametrize("kwargs", [{}, {"package": "tool"}])
+    def testEntryPoint(self, capsys, monkeypatch, kwargs):
+        # Tools calling entry_point() with their own items must
+        # name their package: yaclifw's version says nothing of
+        # their help
+        from yaclifw.main import entry_point
+        monkeypatch.setenv("YACLIFW_CACHE_DIR", str(self.dir))
+        monkeypatch.delenv("YACLIFW_HELP_CACHE", raising=False)
+        monkeypatch.setattr("sys.argv", ["tool", "-h"])
+        with pytest.raises(SystemExit):
+            entry_point(items=ITEMS, **kwargs)
+        assert "alpha" in capsys.readouterr()[0]
+        assert self.dir.check() is bool(kwargs)
+
+    def testDisabled(self, capsys, monkeypatch):
+        monkeypatch.setenv("TEST_HELP_CACHE", "0")
+        self.help(capsys, "alpha", "-h")
+        assert not self.dir.check()
+
+    def testNoVersion(self, capsys):
+        self.version = None
+        self.help(capsys, "-h")
+        assert not self.dir.check()
+
+    def testNotLazy(self, capsys):
+        self.help(capsys, "-h", lazy=False)
+        assert not self.dir.check()
+
+    def testReadOnly(self, capsys, tmpdir, monkeypatch):
+        target = tmpdir.join("file")
+        target.write("")
+        monkeypatch.setenv("TEST_CACHE_DIR", str(target.join("cache")))
+        assert "--level" in self.help(capsys, "alpha", "-h")
+
+
+class TestCacheVersion(object):
+
+    def testBaked(self, tmpdir, monkeypatch):
+        import sys
+        pkg = tmpdir.mkdir("yaclifw_helped")
+        pkg.join("__init__.py").write("")
+        pkg.join("_version.py").write("version = '7.8.9'\n")
+        monkeypatch.syspath_prepend(str(tmpdir))
+        try:
+            assert helpcache.cache_version("yaclifw_helped") == "7.8.9"
+        finally:
+            for name in ("yaclifw_helped", "yaclifw_helped._version"):
+                sys.modules.pop(name, None)
+
+    def testUnknown(self):
+        assert helpcache.cache_version("yaclifw_no_such_package") is None
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import pytest
+
+from yaclifw.framework import main
+from yaclifw.framework import find_subcommand
+from yaclifw.framework import Command
+
+
+CONSTRUCTED = []
+
+
+class CountingCommand(Command):
+    """Records its construction"""
+
+    def __init__(self, sub_parsers):
+        super(CountingCommand, self).__init__(sub_parsers)
+        CONSTRUCTED.append(self.NAME)
+
+    def __call__(self, args):
+        pass
+
+
+class AlphaCommand(CountingCommand):
+    """First command"""
+    NAME = "alpha"
+
+
+class BetaCommand(CountingCommand):
+    """Second command"""
+    NAME = "beta"
+
+
+ITEMS = [("alpha", AlphaCommand), ("beta", BetaCommand)]
+
+
+class TestLazy(object):
+
+    def setup_method(self, method):
+        del CONSTRUCTED[:]
+
+    def testEager(self):
+        main("test", ["alpha"], items=ITEMS)
+        assert CONSTRUCTED == ["alpha", "beta"]
+
+    def testUnselectedNotConstructed(self):
+        main("test", ["beta", "-v"], items=ITEMS, lazy=True)
+        assert CONSTRUCTED == ["beta"]
+
+    def testHelpConstructsNothing(self, capsys):
+        with pytest.raises(SystemExit):
+            main("test", ["-h"], items=ITEMS, lazy=True)
+        out, err = capsys.readouterr()
+        assert CONSTRUCTED == []
+        assert "First command" in out
+        assert "Second command" in out
+
+    def testUnknownCommand(self, capsys):
+        with pytest.raises(SystemExit):
+            main("test", ["gamma"], items=ITEMS, lazy=True)
+        out, err = capsys.readouterr()
+        assert CONSTRUCTED == []
+        assert "invalid choice" in err
+
+    @pytest.mark.parametrize(('args', 'expected'), [
+        [["alpha"], "alpha"],
+        [["alpha", "-h"], "alpha"],
+        [["-h", "alpha"], None],
+        [["gamma", "alpha"], None],
+        [[], None]])
+    def testFindSubcommand(self, args, expected):
+        assert find_subcommand(args, ["alpha", "beta"]) == expected
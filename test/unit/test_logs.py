@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import io
+import json
+import logging
+import pytest
+
+from yaclifw import logs
+from yaclifw.framework import App
+from yaclifw.framework import Command
+from yaclifw.parallel import fan_out
+
+
+class LoggingCommand(Command):
+    """Logs a little"""
+
+    NAME = "logging"
+
+    def __call__(self, args):
+        super(LoggingCommand, self).__call__(args)
+        self.configure_logging(args)
+        self.log.debug("debug %s", "arg")
+        self.log.info("info")
+        try:
+            raise ValueError("oops")
+        except ValueError:
+            self.log.error("failed", exc_info=True)
+
+
+def worker(item):
+    logging.getLogger("test.worker").warning("item %s", item)
+    return item
+
+
+class TestLogs(object):
+
+    @pytest.fixture(autouse=True)
+    def root(self, monkeypatch, capsys):
+        root = logging.getLogger()
+        monkeypatch.setattr(root, "handlers", [])
+        monkeypatch.setattr(root, "level", root.level)
+        self.capsys = capsys
+        yield
+        logs.shutdown()
+
+    def detach(self):
+        # pytest adds handlers of its own while each test runs
+        del logging.getLogger().handlers[:]
+
+    def err(self):
+        return self.capsys.readouterr()[1]
+
+    def run(self, *args):
+        self.detach()
+        app = App("test", [("logging", LoggingCommand)])
+        app.run(["logging"] + list(args))
+        return self.err().splitlines()
+
+    def testText(self):
+        lines = self.run()
+        assert "INFO  info" in lines[0]
+        assert "ERROR failed" in lines[1]
+        assert "ValueError: oops" in lines[-1]
+        assert not logging.getLogger().handlers
+
+    def testVerboseOnce(self):
+        lines = self.run("-v")
+        assert "DEBUG debug arg" in lines[0]
+        assert logging.getLogger().level == logging.DEBUG
+
+    def testJson(self):
+        lines = self.run("--log-format=json", "-v")
+        records = [json.loads(line) for line in lines]
+        records = [r for r in records if r["name"] == "test.logging"]
+        assert [r["message"] for r in records] == [
+            "debug arg", "info", "failed"]
+        assert records[0]["name"] == "test.logging"
+        assert "ValueError: oops" in records[2]["exc_info"]
+
+    def testEnvironment(self, monkeypatch):
+        monkeypatch.setenv("TEST_LOG_FORMAT", "json")
+        json.loads(self.run()[0])
+
+    def testInvalidEnvironment(self, monkeypatch):
+        monkeypatch.setenv("TEST_LOG_FORMAT", "xml")
+        lines = self.run()
+        assert lines[0].startswith("Ignoring TEST_LOG_FORMAT=xml")
+        assert "INFO  info" in lines[1]
+
+    def testExistingHandlers(self):
+        self.detach()
+        handler = logging.StreamHandler(io.StringIO())
+        logging.getLogger().addHandler(handler)
+        app = App("test", [("logging", LoggingCommand)])
+        app.run(["logging"])
+        assert self.err() == ""
+        assert "info" in handler.stream.getvalue()
+        assert logging.getLogger().handlers == [handler]
+
+    def testConfigureOnce(self):
+        self.detach()
+        logs.configure(logging.INFO)
+        logs.configure(logging.DEBUG, "json")
+        assert len(logging.getLogger().handlers) == 1
+        logging.getLogger("test").debug("queued")
+        logs.shutdown()
+        assert json.loads(self.err())["message"] == "queued"
+
+    def testWorkerProcesses(self):
+        self.detach()
+        logs.configure(logging.INFO)
+        results = list(fan_out(worker, range(4), jobs=2, executor="process"))
+        assert len(results) == 4
+        logs.shutdown()
+        lines = self.err().splitlines()
+        assert sorted(line.split("WARNI ")[1] for line in lines) == [
+            "item 0", "item 1", "item 2", "item 3"]
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import io
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+from yaclifw.framework import App
+from yaclifw.framework import Command
+from yaclifw.framework import Stop
+from yaclifw.output import FORMATS
+from yaclifw.output import Output
+from yaclifw.output import PIPE_RC
+
+
+class CountingStream(io.StringIO):
+
+    writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super(CountingStream, self).write(text)
+
+
+class RowsCommand(Command):
+    """Prints rows"""
+
+    NAME = "rows"
+    OUTPUT_FORMATS = FORMATS
+
+    def __call__(self, args):
+        with self.output(args, fields=("n", "text")) as out:
+            out.write((i, "row %d" % i) for i in range(3))
+
+
+def formatted(format, records, fields=None):
+    stream = io.StringIO()
+    with Output(format, fields, stream=stream) as out:
+        out.write(records)
+    return stream.getvalue()
+
+
+SCRIPT = """
+from yaclifw.framework import Command
+from yaclifw.main import entry_point
+
+class Many(Command):
+    NAME = "many"
+    OUTPUT_FORMATS = ("text",)
+
+    def __call__(self, args):
+        with self.output(args) as out:
+            out.write("line %d" % i for i in range(10 ** 6))
+
+entry_point(items=[("many", Many)])
+"""
+
+
+class TestOutput(object):
+
+    def testText(self):
+        assert formatted("text", ["a", ("b", None, 1)]) == "a\nb\t\t1\n"
+
+    def testDicts(self):
+        records = [{"name": "a", "size": 1}, {"size": 2, "name": "b\tc"}]
+        assert formatted("tsv", records) == \
+            "name\tsize\na\t1\nb\\tc\t2\n"
+        assert formatted("csv", records) == \
+            "name,size\na,1\nb\tc,2\n"
+        lines = formatted("jsonl", records).splitlines()
+        assert [json.loads(line) for line in lines] == records
+
+    def testTuplesWithFields(self):
+        records = [(1, 'say "hi"'), (2, "x,y")]
+        assert formatted("csv", records, ("n", "s")) == \
+            'n,s\n1,"say ""hi"""\n2,"x,y"\n'
+        assert json.loads(formatted("jsonl", records, ("n", "s")).split(
+            "\n")[0]) == {"n": 1, "s": 'say "hi"'}
+
+    def testUnknownFormat(self):
+        with pytest.raises(ValueError):
+            Output("xml")
+
+    def testBuffered(self):
+        stream = CountingStream()
+        with Output("text", stream=stream, buffer_size=1024) as out:
+            out.write("line %d" % i for i in range(1000))
+        assert stream.getvalue().count("\n") == 1000
+        assert stream.writes < 20
+
+    def testCommand(self, capsys):
+        App("test", [("rows", RowsCommand)]).run(["rows", "--format=csv"])
+        assert capsys.readouterr()[0] == \
+            "n,text\n0,row 0\n1,row 1\n2,row 2\n"
+
+    def testDefaultFormat(self, capsys):
+        App("test", [("rows", RowsCommand)]).run(["rows"])
+        assert capsys.readouterr()[0].splitlines()[0] == "0\trow 0"
+
+    def testNoOption(self):
+        class Plain(Command):
+            NAME = "plain"
+
+            def __call__(self, args):
+                pass
+        with pytest.raises(SystemExit):
+            App("test", [("plain", Plain)]).parse(["plain", "--format=csv"])
+
+    def testBrokenPipe(self):
+        class Closed(io.StringIO):
+            def write(self, text):
+                raise BrokenPipeError()
+        out = Output("text", stream=Closed())
+        out.writerow("a")
+        with pytest.raises(Stop) as exc:
+            out.close()
+        assert exc.value.rc == PIPE_RC
+
+    def testHead(self):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(sys.path)
+        p = subprocess.Popen(
+            [sys.executable, "-c", SCRIPT, "many"], env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        first = p.stdout.readline()
+        p.stdout.close()
+        err = p.stderr.read()
+        p.stderr.close()
+        assert p.wait() == PIPE_RC
+        assert first == b"line 0\n"
+        assert err == b""
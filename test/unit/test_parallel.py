@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import logging
+import threading
+import time
+import pytest
+
+from yaclifw.framework import main
+from yaclifw.framework import Stop
+from yaclifw.parallel import fan_out
+from yaclifw.parallel import ParallelCommand
+
+
+def square(n):
+    if n < 0:
+        raise Stop(-n, "negative")
+    if n == 13:
+        raise ValueError("unlucky")
+    time.sleep(0.001 * (10 - n % 10))
+    return n * n
+
+
+def noisy(n):
+    logging.getLogger("yaclifw.test").info("item %d", n)
+    return n
+
+
+class Recorder(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class SquareCommand(ParallelCommand):
+    """Squares numbers in parallel"""
+
+    NAME = "square"
+
+    def __init__(self, sub_parsers):
+        super(SquareCommand, self).__init__(sub_parsers)
+        self.parser.add_argument("numbers", nargs="*", type=int)
+
+    def __call__(self, args):
+        super(SquareCommand, self).__call__(args)
+        for n, result in self.fan_out(square, args.numbers, args,
+                                      ordered=True):
+            print(result)
+
+
+class TestFanOut(object):
+
+    def testOrdered(self):
+        results = list(fan_out(square, range(13), jobs=4, ordered=True))
+        assert results == [(n, n * n) for n in range(13)]
+
+    def testCompletionOrder(self):
+        results = list(fan_out(square, range(10), jobs=10))
+        assert sorted(results) == [(n, n * n) for n in range(10)]
+        # Later items sleep for less time and finish first
+        assert results[0][0] > results[-1][0]
+
+    def testFailures(self):
+        results = []
+        with pytest.raises(Stop) as exc:
+            for item in fan_out(square, [1, -3, 13, -2, 4], jobs=2):
+                results.append(item)
+        assert exc.value.rc == 3
+        assert str(exc.value) == "3 of 5 items failed"
+        assert sorted(results) == [(1, 1), (4, 16)]
+
+    def testBounded(self):
+        submitted = []
+        lock = threading.Lock()
+
+        def work():
+            for n in range(100):
+                with lock:
+                    submitted.append(n)
+                yield n
+
+        gen = fan_out(square, work(), jobs=2, ordered=True)
+        next(gen)
+        assert len(submitted) <= 5
+        gen.close()
+
+    def testProcessLogging(self):
+        recorder = Recorder()
+        root = logging.getLogger()
+        root.addHandler(recorder)
+        old_level = root.level
+        root.setLevel(logging.INFO)
+        try:
+            results = list(fan_out(noisy, range(5), jobs=2,
+                                   executor="process", ordered=True))
+        finally:
+            root.removeHandler(recorder)
+            root.setLevel(old_level)
+        assert results == [(n, n) for n in range(5)]
+        assert sorted(recorder.messages) == ["item %d" % n for n in range(5)]
+
+    def testCommand(self, capsys):
+        main("test", ["square", "-j", "3", "1", "2", "3"],
+             items=[("square", SquareCommand)])
+        out, err = capsys.readouterr()
+        assert out == "1\n4\n9\n"
+
+    def testProcessFailures(self):
+        recorder = Recorder()
+        log = logging.getLogger("yaclifw.test.failures")
+        log.addHandler(recorder)
+        try:
+            with pytest.raises(Stop):
+                list(fan_out(square, [1, -3], jobs=2, executor="process",
+                             log=log))
+        finally:
+            log.removeHandler(recorder)
+        assert recorder.messages == ["-3: negative"]
+
+    def testTerminate(self):
+        from yaclifw.parallel import _Pool
+        pool = _Pool(1, "thread")
+        with pool:
+            running = pool.submit(time.sleep, 0.2)
+            queued = pool.submit(time.sleep, 0.2)
+            pool.terminate()
+        assert queued.cancelled()
+        assert running.done() and not running.cancelled()
+
+
+class TestStop(object):
+
+    def testPickle(self):
+        import pickle
+        from yaclifw.cancel import TimedOut
+        from yaclifw.processes import ProcessError
+        for stop in (Stop(3, "boom"), TimedOut(2),
+                     ProcessError(["ls"], 4, "bad\n")):
+            copy = pickle.loads(pickle.dumps(stop))
+            assert type(copy) is type(stop)
+            assert copy.rc == stop.rc
+            assert str(copy) == str(stop)
+        assert copy.command == ["ls"]
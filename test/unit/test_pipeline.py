@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import pytest
+
+from yaclifw.framework import main
+from yaclifw.framework import Command
+from yaclifw.framework import Stop
+from yaclifw.output import FORMATS
+from yaclifw.pipeline import split
+
+PULLED = []
+
+
+class SeqCommand(Command):
+    """Produces numbers"""
+
+    NAME = "seq"
+
+    def __init__(self, sub_parsers):
+        super(SeqCommand, self).__init__(sub_parsers)
+        self.parser.add_argument("count", type=int)
+
+    def __call__(self, args):
+        for i in range(args.count):
+            PULLED.append(i)
+            yield {"n": i}
+
+
+class EvenCommand(Command):
+    """Keeps even numbers"""
+
+    NAME = "even"
+    OUTPUT_FORMATS = FORMATS
+
+    def __call__(self, args):
+        for record in args.pipeline_input or []:
+            if record["n"] % 2 == 0:
+                yield record
+
+
+class HeadCommand(Command):
+    """Keeps the first records"""
+
+    NAME = "head"
+
+    def __init__(self, sub_parsers):
+        super(HeadCommand, self).__init__(sub_parsers)
+        self.parser.add_argument("-n", type=int, default=2)
+
+    def __call__(self, args):
+        for i, record in enumerate(args.pipeline_input or [], 1):
+            yield record["n"]
+            if i == args.n:
+                break
+
+
+class QuietCommand(Command):
+    """Produces nothing"""
+
+    NAME = "quiet"
+
+    def __call__(self, args):
+        pass
+
+
+ITEMS = [("seq", SeqCommand), ("even", EvenCommand),
+         ("head", HeadCommand), ("quiet", QuietCommand)]
+
+
+class TestPipeline(object):
+
+    @pytest.fixture(autouse=True)
+    def reset(self):
+        del PULLED[:]
+
+    def testSplit(self):
+        names = ("a", "b")
+        assert split(["a", "-x", "--", "b", "y"], names) == [
+            ["a", "-x"], ["b", "y"]]
+        assert split(["a", "--", "-y"], names) == [["a", "--", "-y"]]
+
+    def testSingle(self, capsys):
+        main("test", ["seq", "3"], items=ITEMS)
+        assert capsys.readouterr().out == "0\n1\n2\n"
+
+    def testFormat(self, capsys):
+        main("test", ["seq", "5", "--", "even", "--format", "jsonl"],
+             items=ITEMS)
+        assert capsys.readouterr().out == (
+            '{"n": 0}\n{"n": 2}\n{"n": 4}\n')
+
+    @pytest.mark.parametrize("lazy", [True, False])
+    def testLazy(self, capsys, lazy):
+        main("test", ["seq", "1000000", "--", "even", "--", "head", "-n",
+                      "2"], items=ITEMS, lazy=lazy)
+        assert capsys.readouterr().out == "0\n2\n"
+        assert PULLED == [0, 1, 2]
+
+    def testNoRecords(self):
+        with pytest.raises(Stop) as exc:
+            main("test", ["quiet", "--", "even"], items=ITEMS)
+        assert exc.value.rc == 2
+        assert "does not produce records" in str(exc.value)
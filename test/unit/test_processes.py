@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import os
+import sys
+import threading
+import time
+import pytest
+
+from yaclifw import cancel
+from yaclifw.framework import App
+from yaclifw.framework import Command
+from yaclifw.framework import Stop
+from yaclifw.processes import ProcessError
+from yaclifw.processes import Runner
+from yaclifw.processes import default_children
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+COUNT = python(
+    "import sys\n"
+    "for i in range(int(sys.argv[1])):\n"
+    "    print(i)\n"
+    "sys.stderr.write('done\\n')\n")
+
+SLEEP = python("import time; print('started', flush=True); time.sleep(30)")
+
+
+class ChildCommand(Command):
+    """Runs children"""
+
+    NAME = "child"
+
+    def __call__(self, args):
+        self.lines = list(self.runner.lines(SLEEP))
+
+
+class TestRunner(object):
+
+    def testStream(self):
+        pairs = list(Runner().stream(COUNT + ["3"]))
+        assert [p for p in pairs if p[0] == "stdout"] == [
+            ("stdout", "0"), ("stdout", "1"), ("stdout", "2")]
+        assert ("stderr", "done") in pairs
+
+    def testLinesAreStreamed(self):
+        # A huge output is consumed a line at a time
+        lines = Runner().lines(COUNT + ["100000"])
+        assert next(lines) == "0"
+        assert sum(1 for line in lines) == 99999
+
+    def testRun(self):
+        result = Runner().run(COUNT + ["2"])
+        assert result.rc == 0
+        assert result.stdout == "0\n1"
+        assert result.stderr == "done"
+
+    def testFailure(self):
+        failing = python("import sys; sys.stderr.write('bad\\n'); "
+                         "sys.exit(3)")
+        with pytest.raises(ProcessError) as exc:
+            Runner().run(failing)
+        assert exc.value.rc == 3
+        assert "bad" in str(exc.value)
+        assert Runner().run(failing, check=False).rc == 3
+
+    def testTimeout(self):
+        start = time.time()
+        with pytest.raises(cancel.TimedOut):
+            list(Runner().stream(SLEEP, timeout=0.3))
+        assert time.time() - start < 5
+
+    def testEarlyExit(self):
+        runner = Runner(1)
+        for line in runner.lines(SLEEP):
+            break
+        # The slot was released when the generator was dropped
+        assert runner.run(COUNT + ["1"]).stdout == "0"
+
+    def testDefaultChildren(self, monkeypatch, caplog):
+        monkeypatch.setenv("TEST_MAX_CHILDREN", "3")
+        assert default_children("test") == 3
+        monkeypatch.setenv("TEST_MAX_CHILDREN", "many")
+        assert default_children("test") == (os.cpu_count() or 1)
+        assert "Ignoring TEST_MAX_CHILDREN=many" in caplog.text
+
+    def testConcurrency(self):
+        runner = Runner(2)
+        active = []
+        peak = []
+        lock = threading.Lock()
+        sleep = python("import time; time.sleep(0.2)")
+        original = runner._communicate
+
+        def counting(*args, **kwargs):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            try:
+                for pair in original(*args, **kwargs):
+                    yield pair
+            finally:
+                with lock:
+                    active.pop()
+        runner._communicate = counting
+        results = runner.run_all([sleep] * 6)
+        assert [r.rc for r in results] == [0] * 6
+        assert max(peak) <= 2
+
+    def testRunAllOrder(self):
+        results = Runner(3).run_all([COUNT + [str(n)] for n in (3, 1, 2)])
+        assert [r.stdout.count("\n") for r in results] == [2, 0, 1]
+
+    def testRunAllFailure(self):
+        with pytest.raises(Stop) as exc:
+            Runner(2).run_all([COUNT + ["1"], python("exit(4)")])
+        assert exc.value.rc == 4
+
+    def testCancelled(self):
+        app = App("test", [("child", ChildCommand)])
+        start = time.time()
+        with pytest.raises(cancel.TimedOut):
+            app.run(["child", "--timeout=0.5"])
+        assert time.time() - start < 5
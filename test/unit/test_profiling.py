@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import argparse
+import os
+import pstats
+import tracemalloc
+import pytest
+
+from yaclifw.framework import App
+from yaclifw.framework import main
+from yaclifw.framework import Command
+
+
+class WorkCommand(Command):
+    """Does a little work"""
+
+    NAME = "work"
+
+    def __init__(self, sub_parsers):
+        super(WorkCommand, self).__init__(sub_parsers)
+        self.parser.add_argument(
+            '--callback', default=self.finish, help=argparse.SUPPRESS)
+        self.parser.add_argument('words', nargs='*')
+
+    def __call__(self, args):
+        self.words = args.words
+        self.data = [str(i) for i in range(1000)]
+
+    def finish(self):
+        self.joined = ",".join(self.data)
+
+
+class RestCommand(WorkCommand):
+    """Does a little work too"""
+
+    NAME = "rest"
+
+
+ITEMS = [("work", WorkCommand)]
+
+
+def written(tmpdir, suffix):
+    found = [f for f in os.listdir(str(tmpdir)) if f.endswith(suffix)]
+    assert len(found) == 1
+    assert found[0].startswith("test-work-")
+    return str(tmpdir.join(found[0]))
+
+
+class TestProfiling(object):
+
+    @pytest.fixture(autouse=True)
+    def cwd(self, tmpdir, monkeypatch):
+        monkeypatch.chdir(str(tmpdir))
+        monkeypatch.delenv("TEST_PROFILE", raising=False)
+
+    def testNone(self, tmpdir, capsys):
+        main("test", ["work"], items=ITEMS)
+        out, err = capsys.readouterr()
+        assert err == ""
+        assert os.listdir(str(tmpdir)) == []
+
+    def testCpu(self, tmpdir, capsys):
+        main("test", ["work", "--profile"], items=ITEMS)
+        out, err = capsys.readouterr()
+        filename = written(tmpdir, ".pstats")
+        assert "Profile written to %s" % filename in err
+        functions = [f[2] for f in pstats.Stats(filename).stats]
+        assert "__call__" in functions
+        assert "finish" in functions
+
+    def testMem(self, tmpdir, capsys):
+        main("test", ["work", "--profile=mem"], items=ITEMS)
+        out, err = capsys.readouterr()
+        assert "Peak traced memory" in err
+        snapshot = tracemalloc.Snapshot.load(written(tmpdir, ".snapshot"))
+        assert snapshot.statistics("filename")
+
+    def testEnvironment(self, tmpdir, capsys, monkeypatch):
+        monkeypatch.setenv("TEST_PROFILE", "mem")
+        main("test", ["work"], items=ITEMS)
+        written(tmpdir, ".snapshot")
+
+    def testInvalidEnvironment(self, tmpdir, caplog, monkeypatch):
+        monkeypatch.setenv("TEST_PROFILE", "bogus")
+        main("test", ["work"], items=ITEMS)
+        assert "Ignoring TEST_PROFILE=bogus" in caplog.text
+        assert os.listdir(str(tmpdir)) == []
+
+    def testWarnedOnce(self, caplog, monkeypatch):
+        monkeypatch.setenv("TEST_PROFILE", "bogus")
+        main("test", ["work"], items=ITEMS + [("rest", RestCommand)])
+        assert caplog.text.count("Ignoring TEST_PROFILE=bogus") == 1
+
+    def testPositional(self, tmpdir, capsys):
+        # Only --profile=mem selects the mode
+        app = App("test", ITEMS)
+        app.run(["work", "--profile", "mem"])
+        assert app.commands["work"].words == ["mem"]
+        written(tmpdir, ".pstats")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import json
+import subprocess
+import sys
+import pytest
+
+from yaclifw import resources
+from yaclifw.framework import App
+from yaclifw.framework import Command
+from yaclifw.framework import Stop
+
+resource = pytest.importorskip("resource")
+
+
+class HungryCommand(Command):
+    """Uses resources"""
+
+    NAME = "hungry"
+
+    def __init__(self, sub_parsers):
+        super(HungryCommand, self).__init__(sub_parsers)
+        self.parser.add_argument(
+            "what", choices=("nothing", "child", "cpu", "memory"))
+
+    def __call__(self, args):
+        if args.what == "child":
+            subprocess.check_call([sys.executable, "-c", "pass"])
+        elif args.what == "cpu":
+            while True:
+                pass
+        elif args.what == "memory":
+            self.data = bytearray(4 * 1024 ** 3)
+
+
+ITEMS = [("hungry", HungryCommand)]
+
+
+def address_space():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmSize:"):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+class TestResources(object):
+
+    @pytest.fixture(autouse=True)
+    def output(self, tmpdir, monkeypatch):
+        self.path = tmpdir.join("resources.json")
+        monkeypatch.setenv("TEST_RESOURCES", str(self.path))
+
+    def records(self):
+        with open(str(self.path)) as f:
+            return [json.loads(line) for line in f]
+
+    def testParseSize(self):
+        assert resources.parse_size("1024") == 1024
+        assert resources.parse_size("512M") == 512 * 1024 ** 2
+        assert resources.parse_size("1.5g") == int(1.5 * 1024 ** 3)
+        assert resources.parse_size("2KB") == 2048
+        with pytest.raises(ValueError):
+            resources.parse_size("lots")
+
+    def testInvalidSize(self):
+        with pytest.raises(SystemExit):
+            App("test", ITEMS).parse(["hungry", "nothing", "--max-rss=x"])
+
+    def testRecord(self):
+        App("test", ITEMS).run(["hungry", "nothing"])
+        record, = self.records()
+        assert record["command"] == "hungry"
+        assert record["rc"] == 0
+        assert record["maxrss"] > 1024 ** 2
+        for key in ("wall", "user", "system"):
+            assert record[key] >= 0
+
+    def testChildren(self):
+        App("test", ITEMS).run(["hungry", "child"])
+        record, = self.records()
+        children = record["children"]
+        assert children["user"] + children["system"] > 0
+
+    def testDebugLog(self, caplog):
+        caplog.set_level("DEBUG", logger="test.resources")
+        App("test", ITEMS).run(["hungry", "nothing"])
+        assert "hungry: wall=" in caplog.text
+
+    def testCpuLimit(self):
+        before = resource.getrlimit(resource.RLIMIT_CPU)
+        with pytest.raises(Stop) as exc:
+            App("test", ITEMS).run(["hungry", "cpu", "--max-cpu=1"])
+        assert exc.value.rc == resources.CPU_RC
+        assert resource.getrlimit(resource.RLIMIT_CPU) == before
+        assert self.records()[0]["rc"] == resources.CPU_RC
+
+    @pytest.mark.skipif(not sys.platform.startswith("linux"),
+                        reason="needs /proc")
+    def testMemoryLimit(self):
+        before = resource.getrlimit(resource.RLIMIT_AS)
+        limit = address_space() + 256 * 1024 ** 2
+        with pytest.raises(Stop) as exc:
+            App("test", ITEMS).run(
+                ["hungry", "memory", "--max-rss=%d" % limit])
+        assert exc.value.rc == resources.MEMORY_RC
+        assert resource.getrlimit(resource.RLIMIT_AS) == before
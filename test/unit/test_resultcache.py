@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+from __future__ import print_function
+import logging
+import os
+import sys
+import threading
+import time
+import pytest
+
+from yaclifw.framework import main
+from yaclifw.framework import Command
+from yaclifw.framework import Stop
+from yaclifw.resultcache import ResultCache
+from yaclifw.resultcache import input_state
+
+CALLS = []
+
+
+class CountCommand(Command):
+    """Counts the lines of a file"""
+
+    NAME = "count"
+    CACHE = True
+
+    def __init__(self, sub_parsers):
+        super(CountCommand, self).__init__(sub_parsers)
+        self.parser.add_argument("file")
+        self.parser.add_argument("--fail", action="store_true")
+        self.parser.add_argument("--thread", action="store_true")
+
+    def cache_inputs(self, args):
+        return [args.file]
+
+    def __call__(self, args):
+        CALLS.append(args.file)
+        with open(args.file) as f:
+            count = len(f.readlines())
+        if args.thread:
+            # e.g. a pool worker: not recorded
+            worker = threading.Thread(target=print, args=(count,))
+            worker.start()
+            worker.join()
+        else:
+            print(count)
+        print("counted", file=sys.stderr)
+        if args.fail:
+            raise Stop(5, "Failed")
+
+
+class LogCommand(Command):
+    """Logs what it does"""
+
+    NAME = "log"
+    CACHE = True
+
+    def __call__(self, args):
+        super(LogCommand, self).__call__(args)
+        CALLS.append(self.NAME)
+        self.log.info("logged")
+        print("done")
+
+
+ITEMS = [("count", CountCommand), ("log", LogCommand)]
+
+
+class TestResultCache(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, tmpdir, monkeypatch):
+        monkeypatch.setenv("TEST_CACHE_DIR", str(tmpdir.join("cache")))
+        monkeypatch.delenv("TEST_RESULT_CACHE_AGE", raising=False)
+        monkeypatch.delenv("TEST_RESULT_CACHE_SIZE", raising=False)
+        self.input = tmpdir.join("input.txt")
+        self.input.write("a\nb\n")
+        del CALLS[:]
+
+    def count(self, capsys, *args):
+        main("test", ["count", str(self.input)] + list(args), items=ITEMS)
+        return capsys.readouterr()
+
+    def testReplay(self, capsys):
+        first = self.count(capsys)
+        assert first == ("2\n", "counted\n")
+        assert self.count(capsys) == first
+        assert len(CALLS) == 1
+
+    def testInputChanged(self, capsys):
+        self.count(capsys)
+        self.input.write("a\nb\nc\n")
+        assert self.count(capsys).out == "3\n"
+        assert len(CALLS) == 2
+
+    def testArgumentsInKey(self, capsys):
+        self.count(capsys)
+        self.count(capsys, "-v")  # Logging only, same entry
+        assert len(CALLS) == 1
+        with pytest.raises(Stop):
+            self.count(capsys, "--fail")
+        assert len(CALLS) == 2
+
+    def testNoCacheAndRefresh(self, capsys):
+        self.count(capsys)
+        self.count(capsys, "--no-cache")
+        assert len(CALLS) == 2
+        self.count(capsys, "--refresh")
+        self.count(capsys)
+        assert len(CALLS) == 3
+
+    def testReturnCode(self, capsys):
+        for i in range(2):
+            with pytest.raises(Stop) as exc:
+                self.count(capsys, "--fail")
+            assert exc.value.rc == 5
+            assert str(exc.value) == "Failed"
+            assert capsys.readouterr().out == "2\n"
+        assert len(CALLS) == 1
+
+    def testOtherThread(self, capsys):
+        for i in range(2):
+            assert self.count(capsys, "--thread").out == "2\n"
+        assert len(CALLS) == 2
+        assert sys.stdout is not None
+        assert type(sys.stdout).__name__ != "_Capture"
+
+    def testLogging(self, capsys, monkeypatch):
+        # Without pytest's handlers, so that the listener of
+        # yaclifw.logs writes the records to stderr
+        monkeypatch.setattr(logging.getLogger(), "handlers", [])
+        for i in range(5):
+            main("test", ["log"], items=ITEMS)
+            out, err = capsys.readouterr()
+            assert out == "done\n"
+            assert "INFO  logged" in err
+        assert CALLS == ["log"]
+
+    def testExpired(self, capsys, monkeypatch):
+        self.count(capsys)
+        monkeypatch.setenv("TEST_RESULT_CACHE_AGE", "0.000001")
+        time.sleep(0.01)
+        self.count(capsys)
+        assert len(CALLS) == 2
+
+
+class TestEviction(object):
+
+    def testLeastRecentlyUsed(self, tmpdir):
+        cache = ResultCache("test", str(tmpdir), max_size=450)
+        for i, key in enumerate("abc"):
+            cache.write(key, {"created": time.time(), "rc": 0,
+                              "message": [], "chunks": [["stdout", "x" * 50]]})
+            os.utime(cache.filename(key), (i, time.time() - 10 + i))
+        cache.read("a")  # Now the most recent
+        cache.write("d", {"created": time.time(), "rc": 0, "message": [],
+                          "chunks": [["stdout", "x" * 50]]})
+        assert sorted(os.listdir(str(tmpdir))) == ["a.json", "c.json",
+                                                   "d.json"]
+
+
+class TestInputState(object):
+
+    def testModes(self, tmpdir):
+        f = tmpdir.join("f")
+        f.write("data")
+        assert input_state(str(f)) != input_state(str(f), content=False)
+        assert input_state(str(tmpdir)) == [["f", input_state(str(f))]]
+        assert input_state(str(tmpdir.join("missing"))) is None
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import os
+import subprocess
+import sys
+import time
+import pytest
+
+from yaclifw import server
+from yaclifw.main import entry_point
+from yaclifw.server import NoServer
+from yaclifw.server import client
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, "fork"), reason="requires fork and Unix sockets")
+
+
+COMMANDS = '''
+import os
+from yaclifw import framework
+from yaclifw.framework import Command
+from yaclifw.framework import Stop
+
+
+class StateCommand(Command):
+    """Prints state which may leak between requests"""
+
+    NAME = "state"
+
+    def __call__(self, args):
+        super(StateCommand, self).__call__(args)
+        print(framework.FRAMEWORK_NAME, framework.DEBUG_LEVEL, self.cwd,
+              os.environ.get("SERVER_TEST"))
+
+
+class FailCommand(Command):
+    """Always fails"""
+
+    NAME = "fail"
+
+    def __call__(self, args):
+        raise Stop(5, "failed")
+
+
+class DieCommand(Command):
+    """Records that it ran, then kills its server child"""
+
+    NAME = "die"
+
+    def __call__(self, args):
+        import signal
+        with open("died", "a") as f:
+            f.write("x")
+        os.kill(os.getpid(), signal.SIGKILL)
+'''
+
+SERVER = '''
+from yaclifw.server import serve
+serve("test", %r, [("state", "server_test_commands:StateCommand"),
+                   ("fail", "server_test_commands:FailCommand"),
+                   ("die", "server_test_commands:DieCommand")],
+      idle_timeout=%r, lazy=True)
+'''
+
+
+class TestServer(object):
+
+    def start(self, tmpdir, idle_timeout=30):
+        tmpdir.join("server_test_commands.py").write(COMMANDS)
+        self.socket = str(tmpdir.join("server.sock"))
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            [str(tmpdir), os.getcwd(), env.get("PYTHONPATH", "")])
+        self.server = subprocess.Popen(
+            [sys.executable, "-c", SERVER % (self.socket, idle_timeout)],
+            env=env)
+        for i in range(100):
+            if os.path.exists(self.socket):
+                return
+            time.sleep(0.05)
+        raise AssertionError("server did not start")
+
+    def stop(self):
+        if self.server.poll() is None:
+            self.server.kill()
+        self.server.wait()
+
+    def testRequests(self, tmpdir, capfd, monkeypatch):
+        self.start(tmpdir)
+        try:
+            monkeypatch.setenv("TEST_DEBUG_LEVEL", "10")
+            monkeypatch.setenv("SERVER_TEST", "first")
+            monkeypatch.chdir(str(tmpdir))
+            assert client(self.socket, ["state"]) == 0
+            out, err = capfd.readouterr()
+            assert out == "test 10 %s first\n" % tmpdir
+
+            # Module state changed by main() must not leak
+            monkeypatch.delenv("TEST_DEBUG_LEVEL")
+            monkeypatch.delenv("SERVER_TEST")
+            monkeypatch.chdir(os.path.dirname(str(tmpdir)))
+            assert client(self.socket, ["state"]) == 0
+            out, err = capfd.readouterr()
+            assert out == "test 20 %s None\n" % os.path.dirname(str(tmpdir))
+
+            assert client(self.socket, ["fail"]) == 5
+            out, err = capfd.readouterr()
+            assert out == "failed\n"
+
+            assert client(self.socket, ["unknown"]) == 2
+            out, err = capfd.readouterr()
+            assert "invalid choice" in err
+        finally:
+            self.stop()
+
+    def testIdleShutdown(self, tmpdir):
+        self.start(tmpdir, idle_timeout=0.5)
+        try:
+            assert self.server.wait(timeout=10) == 0
+            assert not os.path.exists(self.socket)
+        finally:
+            self.stop()
+
+    def testNoServer(self, tmpdir):
+        with pytest.raises(NoServer):
+            client(str(tmpdir.join("missing.sock")), ["state"])
+
+    def testChildKilled(self, tmpdir, monkeypatch):
+        self.start(tmpdir)
+        try:
+            monkeypatch.chdir(str(tmpdir))
+            monkeypatch.setenv("YACLIFW_SERVER", self.socket)
+            monkeypatch.setattr("sys.argv", ["yaclifw", "die"])
+            with pytest.raises(SystemExit) as exc:
+                entry_point()
+            assert exc.value.code == 1
+            assert tmpdir.join("died").read() == "x"  # Not run again
+        finally:
+            self.stop()
+
+    def testConnectionLost(self, tmpdir, monkeypatch, capsys):
+        self.start(tmpdir)
+        try:
+            monkeypatch.chdir(str(tmpdir))
+
+            def reset(sock, buffer, nfds=0):
+                raise ConnectionResetError("reset")
+            monkeypatch.setattr(server, "_recv", reset)
+            assert client(self.socket, ["state"]) == 1
+            assert "Connection to server lost" in capsys.readouterr().err
+        finally:
+            self.stop()
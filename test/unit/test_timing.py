@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+import argparse
+import json
+import pytest
+
+from yaclifw import timing
+from yaclifw.framework import main
+from yaclifw.framework import Command
+from yaclifw.framework import Stop
+from yaclifw.main import entry_point
+
+
+class WorkCommand(Command):
+    """Does a little work"""
+
+    NAME = "work"
+
+    def __init__(self, sub_parsers):
+        super(WorkCommand, self).__init__(sub_parsers)
+        self.parser.add_argument("--fail", action="store_true")
+        self.parser.add_argument(
+            '--callback', default=self.finish, help=argparse.SUPPRESS)
+
+    def __call__(self, args):
+        if args.fail:
+            raise Stop(5, "Failed")
+
+    def finish(self):
+        pass
+
+
+ITEMS = [("work", WorkCommand)]
+
+
+class TestTiming(object):
+
+    @pytest.fixture(autouse=True)
+    def output(self, tmpdir, monkeypatch):
+        self.path = tmpdir.join("timings.json")
+        monkeypatch.setenv("TEST_TIMINGS", str(self.path))
+        monkeypatch.setenv("YACLIFW_TIMINGS", str(self.path))
+
+    def records(self):
+        with open(str(self.path)) as f:
+            return [json.loads(line) for line in f]
+
+    def testDisabled(self, monkeypatch):
+        monkeypatch.delenv("TEST_TIMINGS")
+        main("test", ["work"], items=ITEMS)
+        assert not self.path.check()
+        assert timing.current() is None
+
+    def testPhases(self):
+        main("test", ["work"], items=ITEMS, lazy=True)
+        record, = self.records()
+        assert record["framework"] == "test"
+        assert record["argv"] == ["work"]
+        assert record["rc"] == 0
+        assert set(record["phases"]) == set(
+            ["parsers", "parse_args", "func", "callback"])
+        assert list(record["commands"]) == ["work"]
+        assert record["total"] >= sum(record["phases"].values())
+
+    def testAppended(self):
+        main("test", ["work"], items=ITEMS)
+        with pytest.raises(Stop):
+            main("test", ["work", "--fail"], items=ITEMS)
+        first, second = self.records()
+        assert first["rc"] == 0
+        assert second["rc"] == 5
+        assert "callback" not in second["phases"]
+        assert timing.current() is None
+
+    def testNested(self):
+        with timing.run("test", ["outer"]) as timings:
+            main("test", ["work"], items=ITEMS)
+            assert timing.current() is timings
+            with timing.phase("func"):
+                with timing.phase("func"):
+                    pass
+        record, = self.records()
+        assert record["argv"] == ["outer"]
+        assert "parse_args" in record["phases"]
+
+    def testEntryPoint(self, monkeypatch, capsys):
+        monkeypatch.setattr("sys.argv", ["yaclifw", "bogus"])
+        with pytest.raises(SystemExit) as exc:
+            entry_point(items=ITEMS)
+        assert exc.value.code == 2
+        record, = self.records()
+        assert record["rc"] == 2
+        assert "import" in record["phases"]
+        assert "stub_parser" in record["phases"]
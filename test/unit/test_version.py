@@ -21,6 +21,7 @@
 
 from __future__ import absolute_import
 import os
+import sys
 import pytest
 
 from yaclifw import __file__ as module_file
@@ -28,6 +29,7 @@ from yaclifw.framework import main
 from yaclifw.version import call_git_describe
 from yaclifw.version import get_git_version
 from yaclifw.version import _lookup_version
+from yaclifw.version import reset_version_cache
 from yaclifw.version import Version
 
 
@@ -37,6 +39,7 @@ version_dir, version_file = _lookup_version(module_file)
 class TestVersion(object):
 
     def setup_method(self, method):
+        reset_version_cache(module_file)
         if os.path.isfile(version_file):
             os.rename(version_file, version_file + '.bak')
         assert not os.path.isfile(version_file)
@@ -116,7 +119,7 @@ class TestVersion(object):
     @pytest.mark.parametrize('prefix', ['', 'v'])
     @pytest.mark.parametrize('suffix', ['', '-rc1', '-31-gbf8afc8'])
     def testVersionNumber(self, capsys, monkeypatch, prefix, suffix):
-        def mockreturn(abbrev):
+        def mockreturn(abbrev, directory=None):
             return '%s0.0.0%s' % (prefix, suffix)
         import yaclifw.version
         monkeypatch.setattr(yaclifw.version, 'call_git_describe', mockreturn)
@@ -125,8 +128,239 @@ class TestVersion(object):
 
     @pytest.mark.parametrize(('prefix', 'suffix'), [['', 'rc1'], ['v.', '']])
     def testInvalidVersionNumber(self, capsys, monkeypatch, prefix, suffix):
-        def mockreturn(abbrev):
+        def mockreturn(abbrev, directory=None):
             return '%s0.0.0%s' % (prefix, suffix)
         import yaclifw.version
         monkeypatch.setattr(yaclifw.version, 'call_git_describe', mockreturn)
         assert "0.0.0" == get_git_version(module_file)
+
+    def testVersionPattern(self):
+        from yaclifw.version import version_pattern
+        assert version_pattern.match("v1.2.3-4-gabc").group(
+            "version") == "1.2.3-4-gabc"
+
+
+class TestVersionCache(object):
+
+    @pytest.fixture(autouse=True)
+    def checkout(self, tmpdir, monkeypatch):
+        # A fake checkout: git is never run since describe is mocked
+        self.git = tmpdir.mkdir(".git")
+        self.git.join("HEAD").write("ref: refs/heads/master\n")
+        self.git.mkdir("refs").mkdir("heads").join("master").write("a" * 40)
+        self.git.join("refs").mkdir("tags")
+        self.module_file = str(tmpdir.mkdir("pkg").join("__init__.py"))
+        self.calls = []
+        self.writes = []
+
+        def describe(abbrev, directory=None):
+            self.calls.append(abbrev)
+            return "v1.2.3"
+
+        import yaclifw.version
+        write = yaclifw.version.write_release_version
+
+        def counting_write(module_file, version):
+            self.writes.append(version)
+            write(module_file, version)
+
+        monkeypatch.setattr(yaclifw.version, 'call_git_describe', describe)
+        monkeypatch.setattr(
+            yaclifw.version, 'write_release_version', counting_write)
+        reset_version_cache()
+        yield
+        reset_version_cache()
+
+    def testMemoized(self):
+        assert get_git_version(self.module_file) == "1.2.3"
+        assert get_git_version(self.module_file) == "1.2.3"
+        assert self.calls == [4]
+        assert self.writes == ["1.2.3"]
+
+    def testDiskCache(self):
+        get_git_version(self.module_file)
+        reset_version_cache()  # As if in a new process
+        assert get_git_version(self.module_file) == "1.2.3"
+        assert self.calls == [4]
+
+    def testAbbrev(self):
+        get_git_version(self.module_file)
+        get_git_version(self.module_file, abbrev=7)
+        assert self.calls == [4, 7]
+
+    @pytest.mark.parametrize('change', ['tag', 'commit', 'checkout'])
+    def testInvalidation(self, change):
+        get_git_version(self.module_file)
+        if change == 'tag':
+            self.git.join("refs", "tags").join("v1.2.4").write("b" * 40)
+        elif change == 'commit':
+            master = self.git.join("refs", "heads", "master")
+            master.remove()
+            master.write("c" * 40 + "\n")
+        else:
+            self.git.join("HEAD").write("d" * 40 + "\n")
+        get_git_version(self.module_file)
+        assert self.calls == [4, 4]
+        assert self.writes == ["1.2.3"]
+
+
+class TestBakedVersion(object):
+
+    @pytest.fixture(autouse=True)
+    def package(self, tmpdir, monkeypatch):
+        pkg = tmpdir.mkdir("yaclifw_baked")
+        pkg.join("__init__.py").write("")
+        monkeypatch.syspath_prepend(str(tmpdir))
+        self.pkg = pkg
+
+        def fail(abbrev, directory=None):
+            raise AssertionError("git should not be consulted")
+        import yaclifw.version
+        monkeypatch.setattr(yaclifw.version, 'call_git_describe', fail)
+        reset_version_cache()
+        import yaclifw_baked
+        self.module_file = yaclifw_baked.__file__
+        yield
+        for name in ("yaclifw_baked", "yaclifw_baked._version"):
+            sys.modules.pop(name, None)
+
+    def testBakedVersion(self):
+        from yaclifw.version import get_version
+        from yaclifw.version import write_version_module
+        write_version_module(str(self.pkg.join("_version.py")), "1.2.3")
+        assert get_version(self.module_file) == "1.2.3"
+        assert not self.pkg.join("RELEASE-VERSION").check()
+
+    def testMode(self):
+        from yaclifw.version import write_version_module
+        filename = str(self.pkg.join("_version.py"))
+        umask = os.umask(0o022)
+        try:
+            write_version_module(filename, "1.2.3")
+        finally:
+            os.umask(umask)
+        assert os.stat(filename).st_mode & 0o777 == 0o644
+
+    def testVersionCommand(self, capsys, monkeypatch):
+        self.pkg.join("_version.py").write("version = '4.5.6'\n")
+        monkeypatch.setattr(Version, "FILE", self.module_file)
+        monkeypatch.setattr(Version, "PACKAGE", "yaclifw_baked")
+        main("test", ["version"], items=[("version", Version)])
+        out, err = capsys.readouterr()
+        assert out == "4.5.6\n"
+
+    def testFallback(self):
+        from yaclifw.version import read_baked_version
+        assert read_baked_version("yaclifw_baked") is None
+
+    def testPackage(self):
+        from yaclifw.version import get_version
+        self.pkg.join("_version.py").write("version = '4.5.6'\n")
+        assert get_version(self.module_file, package="yaclifw_baked") \
+            == "4.5.6"
+
+
+class TestSubclass(object):
+
+    @pytest.fixture(autouse=True)
+    def package(self, tmpdir, monkeypatch):
+        import types
+        import yaclifw.version
+        pkg = tmpdir.mkdir("yaclifw_tool")
+        pkg.join("__init__.py").write("")
+        pkg.join("RELEASE-VERSION").write("1.2.3\n")
+        baked = types.ModuleType("yaclifw._version")
+        baked.version = "9.9.9"
+        monkeypatch.setitem(sys.modules, "yaclifw._version", baked)
+        monkeypatch.setattr(yaclifw.version, "call_git_describe",
+                            lambda abbrev, directory=None: None)
+        reset_version_cache()
+        self.Tool = type("Tool", (Version,), {
+            "FILE": str(pkg.join("__init__.py"))})
+        yield
+        reset_version_cache()
+
+    def testFile(self, capsys):
+        main("test", ["version"], items=[("version", self.Tool)])
+        out, err = capsys.readouterr()
+        assert out == "1.2.3\n"
+
+    def testPackage(self, capsys):
+        self.Tool.PACKAGE = "yaclifw"
+        main("test", ["version"], items=[("version", self.Tool)])
+        out, err = capsys.readouterr()
+        assert out == "9.9.9\n"
+
+
+class TestAllVersions(object):
+
+    @pytest.fixture(autouse=True)
+    def package(self, tmpdir, monkeypatch):
+        import yaclifw.version
+        pkg = tmpdir.mkdir("yaclifw_source")
+        pkg.join("__init__.py").write("")
+        pkg.join("RELEASE-VERSION").write("2.3.4\n")
+        monkeypatch.syspath_prepend(str(tmpdir))
+        monkeypatch.setattr(yaclifw.version, "_package_versions", {})
+        monkeypatch.setattr(yaclifw.version, "call_git_describe",
+                            lambda abbrev, directory=None: None)
+        reset_version_cache()
+
+    def items(self):
+        from yaclifw.framework import CommandReference
+        Installed = type("Installed", (Version,), {"NAME": "installed"})
+        Installed.__module__ = "_pytest.fake"
+        return [("version", Version), ("installed", Installed),
+                ("source", CommandReference(
+                    "source", "yaclifw_source.cli:Source"))]
+
+    def testPackages(self):
+        from yaclifw.framework import App
+        from yaclifw.version import command_packages
+        app = App("test", self.items(), lazy=True)
+        assert command_packages(app) == [
+            "yaclifw", "_pytest", "yaclifw_source"]
+        assert command_packages(None) == ["yaclifw"]
+
+    def testReport(self, capsys):
+        import json
+        from importlib import metadata
+        main("test", ["version", "--all", "--format", "jsonl"],
+             items=self.items(), lazy=True)
+        out, err = capsys.readouterr()
+        records = [json.loads(line) for line in out.splitlines()]
+        assert [r["package"] for r in records] == [
+            "yaclifw", "_pytest", "yaclifw_source"]
+        assert records[1] == {
+            "package": "_pytest", "distribution": "pytest",
+            "version": metadata.version("pytest"), "source": "metadata"}
+        assert records[2] == {
+            "package": "yaclifw_source", "distribution": None,
+            "version": "2.3.4", "source": "RELEASE-VERSION"}
+
+    def testGit(self, monkeypatch):
+        import yaclifw.version
+        from yaclifw.version import package_version
+        calls = []
+
+        def describe(abbrev, directory=None):
+            calls.append(directory)
+            return "v5.6.7"
+        monkeypatch.setattr(yaclifw.version, "call_git_describe", describe)
+        record = package_version("yaclifw_source")
+        assert record["version"] == "5.6.7"
+        assert record["source"] == "git"
+        assert package_version("yaclifw_source") is record
+        assert len(calls) == 1
+
+    @pytest.mark.parametrize("text,editable", [
+        (None, False), ('{"url": "file:///src"}', False),
+        ('{"url": "file:///src", "dir_info": {"editable": true}}', True)])
+    def testEditable(self, text, editable):
+        from yaclifw.version import _editable
+
+        class Distribution(object):
+            def read_text(self, name):
+                assert name == "direct_url.json"
+                return text
+        assert _editable(Distribution()) is editable
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Build yaclifw, or a tool built on it, into a single-file zipapp:
+
+    python -m yaclifw.bundle dist/yaclifw.pyz
+    python -m yaclifw.bundle dist/tool.pyz --package mytool \\
+        --command mycmd=mytool.cli:MyCommand
+
+The archive holds bytecode only, the version of each package baked
+into its _version module (see version.write_version_module) and a
+__main__ with the table of commands and their help texts. Starting
+it reads that one file: there is no entry point discovery, no help
+cache and no sources to stat() along sys.path.
+
+The bytecode is compiled for the Python which builds the archive,
+and other versions will refuse to load it. Only pure-Python
+packages can be included.
+"""
+
+from __future__ import absolute_import
+import os
+import py_compile
+import shutil
+import tempfile
+
+from .framework import CommandReference
+
+INTERPRETER = "/usr/bin/env python3"
+SKIPPED = ("RELEASE-VERSION", "RELEASE-VERSION.cache")
+
+MAIN = """\
+# Generated by yaclifw.bundle
+from yaclifw.framework import CommandReference
+from yaclifw.main import entry_point
+
+COMMANDS = %r
+
+entry_point([(name, CommandReference(name, target, help))
+             for name, target, help in COMMANDS], package=None)
+"""
+
+
+def package_dir(package):
+    import importlib.util
+    spec = importlib.util.find_spec(package)
+    if spec is None or not spec.submodule_search_locations:
+        raise ValueError("Not a package: %s" % package)
+    return list(spec.submodule_search_locations)[0]
+
+
+def compile_package(package, target):
+    """
+    Write the bytecode of package, and any data files, under
+    target. The .pyc files are not checked against sources,
+    which the archive does not contain.
+    """
+    source_dir = package_dir(package)
+    for root, dirs, files in os.walk(source_dir):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        relative = os.path.normpath(
+            os.path.join(package, os.path.relpath(root, source_dir)))
+        os.makedirs(os.path.join(target, relative), exist_ok=True)
+        for filename in sorted(files):
+            source = os.path.join(root, filename)
+            if filename.endswith(".py"):
+                py_compile.compile(
+                    source, cfile=os.path.join(target, relative,
+                                               filename + "c"),
+                    dfile=os.path.join(relative, filename), doraise=True,
+                    invalidation_mode=(
+                        py_compile.PycInvalidationMode.UNCHECKED_HASH))
+            elif not filename.endswith((".pyc", ".pyo")) and \
+                    filename not in SKIPPED:
+                shutil.copy(source, os.path.join(target, relative))
+
+
+def bake_version(package, target):
+    import importlib
+    from .version import VERSION_MODULE
+    from .version import get_version
+    from .version import write_version_module
+    version = get_version(importlib.import_module(package).__file__,
+                          package=package)
+    filename = os.path.join(target, package, VERSION_MODULE + ".py")
+    write_version_module(filename, version)
+    py_compile.compile(
+        filename, cfile=filename + "c",
+        dfile=os.path.join(package, VERSION_MODULE + ".py"), doraise=True,
+        invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+    os.remove(filename)
+    return version
+
+
+def command_table(items):
+    """
+    (name, target, help) for each (name, target) pair,
+    importing each command once to read its help.
+    """
+    return [(name, target, CommandReference(name, target).get_help())
+            for name, target in items]
+
+
+def build(filename, commands=None, packages=(), interpreter=INTERPRETER,
+          compressed=False):
+    """
+    Write a zipapp of yaclifw and packages to filename which
+    runs the (name, "module:Class") pairs in commands (default:
+    the built-in commands of yaclifw.main).
+    """
+    import zipapp
+    from .main import COMMANDS
+    if commands is None:
+        commands = COMMANDS
+    packages = ["yaclifw"] + [p for p in packages if p != "yaclifw"]
+    staging = tempfile.mkdtemp()
+    try:
+        for package in packages:
+            compile_package(package, staging)
+            bake_version(package, staging)
+        with open(os.path.join(staging, "__main__.py"), "w") as f:
+            f.write(MAIN % (command_table(commands),))
+        zipapp.create_archive(staging, filename, interpreter=interpreter,
+                              compressed=compressed)
+    finally:
+        shutil.rmtree(staging)
+    return filename
+
+
+def bundle_main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Build a zipapp of yaclifw commands")
+    parser.add_argument("filename")
+    parser.add_argument(
+        "--command", action="append", metavar="NAME=MODULE:CLASS",
+        help="Command to include (default: the yaclifw commands)")
+    parser.add_argument(
+        "--package", action="append", default=[],
+        help="Further package to include, e.g. the one of a --command")
+    parser.add_argument("--python", default=INTERPRETER,
+                        help="Interpreter of the #! line")
+    parser.add_argument("--compress", action="store_true")
+    ns = parser.parse_args(args)
+    commands = None
+    if ns.command:
+        commands = [tuple(c.split("=", 1)) for c in ns.command]
+    build(ns.filename, commands, ns.package, ns.python, ns.compress)
+
+
+if __name__ == "__main__":
+    bundle_main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Deadlines and cancellation of running commands.
+
+dispatch() runs each command under a Token which is cancelled when
+the --timeout (or <FW>_TIMEOUT) given in seconds expires, or when the
+process receives SIGINT or SIGTERM. Commands see it as self.token:
+
+    for item in items:
+        self.token.check()  # Raises once cancelled
+        ...
+
+Cancelling a token first calls the callbacks registered with
+on_cancel(), e.g. to terminate child processes (see terminating())
+or to drop queued work from a pool. If the command runs in the main
+thread, the deadline is also enforced by SIGALRM, so that a command
+which never checks the token is interrupted like a KeyboardInterrupt.
+
+The exit codes tell a scheduler why a command stopped:
+
+    TimedOut    124 (as for timeout(1))
+    Terminated  143 (128 + SIGTERM)
+    Cancelled   1, also used for SIGINT via KeyboardInterrupt
+"""
+
+from __future__ import absolute_import
+import signal
+import threading
+import time
+
+from .framework import Stop
+
+TIMEOUT_RC = 124
+TERMINATED_RC = 143
+
+_state = threading.local()
+
+
+class Cancelled(Stop):
+
+    def __init__(self, rc=1, message="Cancelled"):
+        super(Cancelled, self).__init__(rc, message)
+
+
+class TimedOut(Cancelled):
+
+    def __init__(self, timeout):
+        super(TimedOut, self).__init__(
+            TIMEOUT_RC, "Timed out after %gs" % timeout)
+
+
+class Terminated(Cancelled):
+
+    def __init__(self):
+        super(Terminated, self).__init__(TERMINATED_RC, "Terminated")
+
+
+class Token(object):
+    """
+    Cancellation state of one run. A token with a parent
+    is cancelled along with it.
+    """
+
+    def __init__(self, timeout=None, parent=None):
+        self.timeout = timeout
+        self.deadline = None
+        if timeout is not None:
+            self.deadline = time.monotonic() + timeout
+        if parent is not None and parent.deadline is not None:
+            if self.deadline is None or parent.deadline < self.deadline:
+                self.timeout = parent.timeout
+                self.deadline = parent.deadline
+        self.parent = parent
+        self.error = None
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.callbacks = []
+        if parent is not None:
+            parent.on_cancel(self.cancel)
+
+    @property
+    def cancelled(self):
+        if not self.event.is_set() and self.expired():
+            self.cancel(TimedOut(self.timeout))
+        return self.event.is_set()
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def remaining(self):
+        """
+        Seconds until the deadline, or None if there is none.
+        """
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        """
+        Raise the reason for cancellation, if any.
+        """
+        if self.cancelled:
+            raise self.error
+
+    def wait(self, timeout=None):
+        """
+        Sleep for timeout seconds, or until cancelled.
+        Returns True if cancelled.
+        """
+        remaining = self.remaining()
+        if remaining is not None and (timeout is None or remaining < timeout):
+            timeout = remaining
+        self.event.wait(timeout)
+        return self.cancelled
+
+    def on_cancel(self, callback):
+        """
+        Call callback(error) when the token is cancelled, or
+        at once if it already is. Returns callback, which can
+        be passed to remove().
+        """
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return callback
+        callback(self.error)
+        return callback
+
+    def remove(self, callback):
+        with self.lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
+
+    def cancel(self, error=None):
+        """
+        Cancel with error (default: Cancelled) and call the
+        registered callbacks. Later calls do nothing.
+        """
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.error = error or Cancelled()
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in reversed(callbacks):
+            try:
+                callback(self.error)
+            except Exception:
+                pass  # Cancellation must reach every callback
+
+    def terminating(self, process):
+        """
+        Context manager terminating process (e.g. a Popen) if
+        the token is cancelled before the block ends.
+        """
+        return _Terminating(self, process)
+
+
+class _Terminating(object):
+
+    def __init__(self, token, process):
+        self.token = token
+        self.process = process
+
+    def _terminate(self, error):
+        try:
+            self.process.terminate()
+        except OSError:
+            pass  # Already gone
+
+    def __enter__(self):
+        self.token.on_cancel(self._terminate)
+        return self.process
+
+    def __exit__(self, *exc_info):
+        self.token.remove(self._terminate)
+        return False
+
+
+NEVER = Token()
+
+
+def current():
+    """
+    The token of the innermost run in this thread. Outside
+    of any run it is a token which is never cancelled.
+    """
+    stack = getattr(_state, "stack", None)
+    if stack:
+        return stack[-1]
+    return NEVER
+
+
+def _main_thread():
+    return threading.current_thread() is threading.main_thread()
+
+
+def _arm(stack):
+    # Point SIGALRM at the earliest deadline of the active runs
+    deadlines = [t.remaining() for t in stack if t.deadline is not None]
+    if deadlines:
+        signal.setitimer(signal.ITIMER_REAL, max(min(deadlines), 0.001))
+    else:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _save_timer():
+    # The ITIMER_REAL of the host application (or of an outer
+    # run), to be given back by _restore_timer()
+    return signal.getitimer(signal.ITIMER_REAL), time.monotonic()
+
+
+def _restore_timer(saved):
+    (value, interval), when = saved
+    if value:
+        value = max(value - (time.monotonic() - when), 0.001)
+    signal.setitimer(signal.ITIMER_REAL, value, interval)
+
+
+def _on_alarm(signum, frame):
+    for token in reversed(getattr(_state, "stack", [])):
+        if token.cancelled:
+            raise token.error
+    _arm(_state.stack)  # Early: wait for the rest
+
+
+def _on_term(signum, frame):
+    error = Terminated()
+    for token in getattr(_state, "stack", []):
+        token.cancel(error)
+    raise error
+
+
+def _on_interrupt(signum, frame):
+    for token in getattr(_state, "stack", []):
+        token.cancel()
+    raise KeyboardInterrupt()
+
+
+def _install():
+    # Only replace the default handlers; an ignored SIGINT
+    # (e.g. under nohup) stays ignored.
+    handlers = {}
+    for signum, default, handler in (
+            (signal.SIGALRM, signal.SIG_DFL, _on_alarm),
+            (signal.SIGTERM, signal.SIG_DFL, _on_term),
+            (signal.SIGINT, signal.default_int_handler, _on_interrupt)):
+        if signal.getsignal(signum) is default:
+            handlers[signum] = signal.signal(signum, handler)
+    return handlers
+
+
+class run(object):
+    """
+    Context manager making a new token, nested in the
+    current one, the token of its body.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+
+    def __enter__(self):
+        stack = getattr(_state, "stack", None)
+        if stack is None:
+            stack = _state.stack = []
+        parent = stack[-1] if stack else None
+        self.token = Token(self.timeout, parent)
+        stack.append(self.token)
+        self.handlers = None
+        self.timer = None
+        self.saved = None
+        if _main_thread():
+            if parent is None:
+                self.handlers = _install()
+            # Only a deadline earlier than the outer one needs the
+            # timer, and only if SIGALRM is ours rather than the
+            # host application's
+            own = self.token.deadline != getattr(parent, "deadline", None)
+            if own and signal.getsignal(signal.SIGALRM) is _on_alarm:
+                self.saved = _save_timer()
+                _arm(stack)
+        elif self.token.deadline is not None:
+            self.timer = threading.Timer(
+                self.token.remaining(), lambda: self.token.cancelled)
+            self.timer.daemon = True
+            self.timer.start()
+        return self.token
+
+    def __exit__(self, *exc_info):
+        stack = _state.stack
+        stack.pop()
+        if self.timer is not None:
+            self.timer.cancel()
+        if self.token.parent is not None:
+            self.token.parent.remove(self.token.cancel)
+        if _main_thread():
+            for signum, handler in (self.handlers or {}).items():
+                signal.signal(signum, handler)
+            if self.saved is not None:
+                _restore_timer(self.saved)
+        return False
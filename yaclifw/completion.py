@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Static shell completion.
+
+The completion command walks the full parser tree once and prints a
+bash, zsh or fish script with every subcommand, option and choice
+baked in, so that pressing tab does not start Python, e.g.:
+
+    yaclifw completion bash > /etc/bash_completion.d/yaclifw
+    yaclifw completion zsh > ~/.zfunc/_yaclifw
+    yaclifw completion fish > ~/.config/fish/completions/yaclifw.fish
+
+The script has to be regenerated when commands or options change.
+
+Only arguments whose values are known at runtime alone call back
+into Python. A Command marks them with dynamic():
+
+    dynamic(self.parser.add_argument("--repo"), self.list_repos)
+
+where list_repos(prefix) returns the candidate values. The script
+then runs "<prog> completion --values <command> <dest> <prefix>".
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import re
+
+from .framework import Command
+from .framework import Stop
+
+SHELLS = ("bash", "zsh", "fish")
+
+
+def dynamic(action, values):
+    """
+    Complete the values of action by calling values(prefix)
+    at completion time. Returns action.
+    """
+    action.completer = values
+    return action
+
+
+class Argument(object):
+    """
+    What the scripts need to know about one argparse action.
+    """
+
+    def __init__(self, action):
+        self.dest = action.dest
+        self.flags = list(action.option_strings)
+        self.help = first_line(action.help)
+        self.nargs = action.nargs
+        self.takes_value = action.nargs != 0
+        self.choices = [str(c) for c in action.choices or ()]
+        self.dynamic = callable(getattr(action, "completer", None))
+
+
+def first_line(text):
+    if not text or text == argparse.SUPPRESS:
+        return ""
+    return text.strip().splitlines()[0].strip()
+
+
+def arguments(parser):
+    """
+    (options, positionals) of parser, without suppressed
+    options and the subcommands.
+    """
+    options, positionals = [], []
+    for action in parser._actions:
+        if isinstance(action, argparse._SubParsersAction):
+            continue
+        if action.help == argparse.SUPPRESS:
+            continue
+        if action.option_strings:
+            options.append(Argument(action))
+        else:
+            positionals.append(Argument(action))
+    return options, positionals
+
+
+def subcommands(parser):
+    """
+    (name, help, parser) for each subcommand of parser.
+    """
+    for action in parser._actions:
+        if isinstance(action, argparse._SubParsersAction):
+            helps = dict((a.dest, first_line(a.help))
+                         for a in action._choices_actions)
+            return [(name, helps.get(name, ""), sub)
+                    for name, sub in sorted(action.choices.items())]
+    return []
+
+
+def function_name(prog):
+    return "_" + re.sub(r"\W", "_", prog)
+
+
+def _words(values):
+    return " ".join(values)
+
+
+#
+# bash
+#
+
+def bash(prog, parser):
+    func = function_name(prog)
+    values = "%s completion --values" % prog
+    options, _ = arguments(parser)
+    commands = subcommands(parser)
+    top = [f for o in options for f in o.flags] + [n for n, _, _ in commands]
+    lines = [
+        "# bash completion for %s" % prog,
+        "# Generated by \"%s completion bash\"" % prog,
+        "%s() {" % func,
+        "    local cur prev cmd i",
+        "    COMPREPLY=()",
+        "    cur=\"${COMP_WORDS[COMP_CWORD]}\"",
+        "    prev=\"${COMP_WORDS[COMP_CWORD-1]}\"",
+        "    cmd=\"\"",
+        "    for ((i=1; i < COMP_CWORD; i++)); do",
+        "        case \"${COMP_WORDS[i]}\" in",
+        "            -*) ;;",
+        "            *) cmd=\"${COMP_WORDS[i]}\"; break;;",
+        "        esac",
+        "    done",
+        "    case \"$cmd\" in",
+        "        \"\")",
+        "            COMPREPLY=($(compgen -W \"%s\" -- \"$cur\"));;"
+        % _words(top),
+    ]
+    for name, _, sub in commands:
+        options, positionals = arguments(sub)
+        lines.append("        %s)" % name)
+        valued = [o for o in options
+                  if o.takes_value and (o.choices or o.dynamic)]
+        if valued:
+            lines.append("            case \"$prev\" in")
+            for option in valued:
+                if option.dynamic:
+                    words = "$(%s %s %s \"$cur\" 2>/dev/null)" % (
+                        values, name, option.dest)
+                else:
+                    words = _words(option.choices)
+                lines.append(
+                    "                %s) COMPREPLY=($(compgen -W \"%s\" -- "
+                    "\"$cur\")); return;;" % ("|".join(option.flags), words))
+            lines.append("            esac")
+        plain = [o for o in options
+                 if o.takes_value and not (o.choices or o.dynamic)]
+        if plain:
+            lines.append("            case \"$prev\" in")
+            lines.append("                %s) return;;" % "|".join(
+                f for o in plain for f in o.flags))
+            lines.append("            esac")
+        words = [f for o in options for f in o.flags]
+        for positional in positionals:
+            words.extend(positional.choices)
+        lines.append(
+            "            COMPREPLY=($(compgen -W \"%s\" -- \"$cur\"));;"
+            % _words(words))
+    lines += [
+        "    esac",
+        "}",
+        "complete -o default -F %s %s" % (func, prog),
+    ]
+    return "\n".join(lines) + "\n"
+
+
+#
+# zsh
+#
+
+def _zsh_quote(text):
+    text = text.replace("\\", "\\\\").replace("[", "\\[").replace("]", "\\]")
+    text = text.replace(":", "\\:")
+    return text.replace("'", "'\\''")
+
+
+def _zsh_action(prog, name, argument):
+    if argument.dynamic:
+        return ("{compadd -- ${(f)\"$(%s completion --values %s %s "
+                "\"$PREFIX\" 2>/dev/null)\"}}" % (prog, name, argument.dest))
+    if argument.choices:
+        return "(%s)" % " ".join(argument.choices)
+    return "_files"
+
+
+def zsh(prog, parser):
+    func = function_name(prog)
+    options, _ = arguments(parser)
+    lines = [
+        "#compdef %s" % prog,
+        "# Generated by \"%s completion zsh\"" % prog,
+        "%s() {" % func,
+        "    local curcontext=\"$curcontext\" state line",
+        "    local -a commands",
+        "    commands=(",
+    ]
+    commands = subcommands(parser)
+    for name, help, _ in commands:
+        lines.append("        '%s:%s'" % (name, _zsh_quote(help)))
+    lines.append("    )")
+    specs = ["'%s[%s]'" % (flag, _zsh_quote(o.help))
+             for o in options for flag in o.flags]
+    specs += ["'1: :->command'", "'*:: :->args'"]
+    lines.append("    _arguments -C %s" % " ".join(specs))
+    lines += [
+        "    case $state in",
+        "        command) _describe 'command' commands;;",
+        "        args)",
+        "            case $words[1] in",
+    ]
+    for name, _, sub in commands:
+        options, positionals = arguments(sub)
+        specs = []
+        for option in options:
+            value = ""
+            if option.takes_value:
+                value = ":%s:%s" % (option.dest,
+                                    _zsh_action(prog, name, option))
+            for flag in option.flags:
+                specs.append("'%s[%s]%s'" % (
+                    flag, _zsh_quote(option.help), value))
+        for positional in positionals:
+            repeat = "*" if positional.nargs in ("*", "+", "...") else ""
+            specs.append("'%s:%s:%s'" % (
+                repeat, positional.dest,
+                _zsh_action(prog, name, positional)))
+        lines.append("                %s) _arguments %s;;" % (
+            name, " ".join(specs)))
+    lines += [
+        "            esac;;",
+        "    esac",
+        "}",
+        "%s \"$@\"" % func,
+    ]
+    return "\n".join(lines) + "\n"
+
+
+#
+# fish
+#
+
+def _fish_quote(text):
+    return "'%s'" % text.replace("\\", "\\\\").replace("'", "\\'")
+
+
+def _fish_flags(flags):
+    parts = []
+    for flag in flags:
+        if flag.startswith("--"):
+            parts.append("-l %s" % flag[2:])
+        elif len(flag) == 2:
+            parts.append("-s %s" % flag[1:])
+        else:
+            parts.append("-o %s" % flag[1:])
+    return " ".join(parts)
+
+
+def fish(prog, parser):
+    lines = [
+        "# fish completion for %s" % prog,
+        "# Generated by \"%s completion fish\"" % prog,
+    ]
+    options, _ = arguments(parser)
+    for option in options:
+        lines.append("complete -c %s -n __fish_use_subcommand %s -d %s" % (
+            prog, _fish_flags(option.flags), _fish_quote(option.help)))
+    commands = subcommands(parser)
+    for name, help, _ in commands:
+        lines.append(
+            "complete -c %s -n __fish_use_subcommand -f -a %s -d %s" % (
+                prog, name, _fish_quote(help)))
+    for name, _, sub in commands:
+        condition = _fish_quote("__fish_seen_subcommand_from %s" % name)
+        options, positionals = arguments(sub)
+        for option in options:
+            value = ""
+            if option.dynamic:
+                value = " -x -a %s" % _fish_quote(
+                    "(%s completion --values %s %s (commandline -ct))" % (
+                        prog, name, option.dest))
+            elif option.choices:
+                value = " -x -a %s" % _fish_quote(" ".join(option.choices))
+            elif option.takes_value:
+                value = " -r"
+            lines.append("complete -c %s -n %s %s%s -d %s" % (
+                prog, condition, _fish_flags(option.flags), value,
+                _fish_quote(option.help)))
+        for positional in positionals:
+            if positional.dynamic:
+                values = "(%s completion --values %s %s (commandline -ct))" \
+                    % (prog, name, positional.dest)
+            elif positional.choices:
+                values = " ".join(positional.choices)
+            else:
+                continue
+            lines.append("complete -c %s -n %s -f -a %s" % (
+                prog, condition, _fish_quote(values)))
+    return "\n".join(lines) + "\n"
+
+
+GENERATORS = {"bash": bash, "zsh": zsh, "fish": fish}
+
+
+def script(shell, prog, parser):
+    """
+    The completion script for shell of the parser tree
+    rooted at parser, installed for the command prog.
+    """
+    return GENERATORS[shell](prog, parser)
+
+
+class Completion(Command):
+    """
+    Print a shell completion script
+
+    The script lists every command and option so that completion
+    does not need to start Python. Regenerate it after installing
+    or upgrading commands.
+    """
+
+    NAME = "completion"
+
+    def __init__(self, sub_parsers):
+        super(Completion, self).__init__(sub_parsers)
+        self.sub_parsers = sub_parsers
+        self.parser.add_argument(
+            "shell", nargs="?", choices=SHELLS, default="bash",
+            help="Shell to print the script for (default: bash)")
+        self.parser.add_argument(
+            "--prog", help="Name of the executable (default: this one)")
+        self.parser.add_argument(
+            "--values", nargs="+", metavar="ARG", help=argparse.SUPPRESS)
+
+    def __call__(self, args):
+        super(Completion, self).__call__(args)
+        if args.values:
+            values = self.values(*args.values)
+        elif self.app is None:
+            raise Stop(1, "Completion needs the parser tree of an App")
+        else:
+            self.app.build()
+            root = self.app.parser
+            prog = args.prog or root.prog
+            values = [script(args.shell, prog, root).rstrip("\n")]
+        for value in values:
+            print(value)
+
+    def values(self, name, dest, prefix=""):
+        """
+        The values of the dynamic argument dest of the
+        command name which start with prefix.
+        """
+        if self.app is not None and name in self.app.names:
+            self.app.build(name)
+        parser = self.sub_parsers.choices.get(name)
+        if parser is None:
+            raise Stop(2, "Unknown command: %s" % name)
+        for action in parser._actions:
+            completer = getattr(action, "completer", None)
+            if action.dest == dest and callable(completer):
+                return [v for v in completer(prefix) if v.startswith(prefix)]
+        raise Stop(2, "No dynamic values for %s %s" % (name, dest))
@@ -0,0 +1,516 @@
+# -*- coding: utf-8 -*-
+# This file is placed into the public domain.
+
+# A pure-Python implementation of
+#
+#   git describe --match=<pattern> --abbrev=<n>
+#
+# which reads refs, packed-refs, tag and commit objects directly from
+# the .git directory rather than starting a git process. It never
+# changes the current working directory.
+#
+# Only the layouts which are needed for version lookups are supported:
+# loose and packed refs, loose objects and version 2 pack files,
+# including delta chains. Anything else (shallow clones, alternates,
+# grafts and replace refs, SHA-256 or reftable repositories) raises
+# Unsupported so that callers can fall back to running git.
+
+from __future__ import absolute_import
+from fnmatch import fnmatchcase
+from os import path
+import heapq
+import mmap
+import os
+import struct
+import zlib
+
+__all__ = ("Unsupported", "describe", "find_git_dir")
+
+MATCH = "[v0-9][.0-9]*"
+MAX_CANDIDATES = 10
+
+
+class Unsupported(Exception):
+    """
+    Raised for repository layouts which this module cannot
+    read. Callers should fall back to running git.
+    """
+
+
+def find_git_dir(start):
+    # Walk up from start the way git does, following "gitdir:" files
+    # as used by worktrees and submodules.
+    current = start
+    while True:
+        candidate = path.join(current, ".git")
+        if path.isdir(candidate):
+            return candidate
+        if path.isfile(candidate):
+            with open(candidate, "r") as f:
+                line = f.readline().strip()
+            if line.startswith("gitdir:"):
+                return path.normpath(
+                    path.join(current, line[len("gitdir:"):].strip()))
+            return None
+        parent = path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+def common_dir(git_dir):
+    try:
+        with open(path.join(git_dir, "commondir"), "r") as f:
+            return path.normpath(path.join(git_dir, f.readline().strip()))
+    except (IOError, OSError):
+        return git_dir
+
+
+def _read(filename):
+    try:
+        with open(filename, "rb") as f:
+            return f.read()
+    except (IOError, OSError):
+        return None
+
+
+#
+# Objects
+#
+
+def _apply_delta(base, delta):
+
+    def varint(pos):
+        value = shift = 0
+        while True:
+            byte = delta[pos]
+            pos += 1
+            value |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value, pos
+
+    base_size, pos = varint(0)
+    result_size, pos = varint(pos)
+    if base_size != len(base):
+        raise Unsupported("Corrupt delta")
+    out = []
+    while pos < len(delta):
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            offset = size = 0
+            for i in range(4):
+                if op & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if op & (0x10 << i):
+                    size |= delta[pos] << (8 * i)
+                    pos += 1
+            out.append(base[offset:offset + (size or 0x10000)])
+        elif op:
+            out.append(delta[pos:pos + op])
+            pos += op
+        else:
+            raise Unsupported("Corrupt delta")
+    result = b"".join(out)
+    if len(result) != result_size:
+        raise Unsupported("Corrupt delta")
+    return result
+
+
+class _Pack(object):
+
+    TYPES = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+
+    def __init__(self, idx_file):
+        with open(idx_file, "rb") as f:
+            self.idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.idx[:8] != b"\377tOc\0\0\0\2":
+            raise Unsupported("Unsupported pack index %s" % idx_file)
+        self.fanout = struct.unpack(">256I", self.idx[8:8 + 1024])
+        self.count = self.fanout[255]
+        self.names = 8 + 1024
+        self.offsets = self.names + self.count * 24
+        self.large = self.offsets + self.count * 4
+        self.pack_file = idx_file[:-len(".idx")] + ".pack"
+        self.pack = None
+
+    def _name(self, i):
+        return self.idx[self.names + i * 20:self.names + i * 20 + 20]
+
+    def _bounds(self, sha):
+        first = sha[0]
+        lo = self.fanout[first - 1] if first else 0
+        return lo, self.fanout[first]
+
+    def _search(self, sha):
+        lo, hi = self._bounds(sha)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(mid) < sha:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, sha):
+        i = self._search(sha)
+        if i < self.count and self._name(i) == sha:
+            offset, = struct.unpack(
+                ">I", self.idx[self.offsets + i * 4:self.offsets + i * 4 + 4])
+            if offset & 0x80000000:
+                pos = self.large + (offset & 0x7fffffff) * 8
+                offset, = struct.unpack(">Q", self.idx[pos:pos + 8])
+            return offset
+        return None
+
+    def neighbours(self, sha):
+        # Names immediately before and after sha in sort order
+        i = self._search(sha)
+        found = []
+        if i > 0:
+            found.append(self._name(i - 1))
+        if i < self.count and self._name(i) == sha:
+            i += 1
+        if i < self.count:
+            found.append(self._name(i))
+        return found
+
+    def read(self, offset, lookup):
+        if self.pack is None:
+            with open(self.pack_file, "rb") as f:
+                self.pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        pack = self.pack
+        byte = pack[offset]
+        kind = (byte >> 4) & 7
+        pos = offset + 1
+        while byte & 0x80:
+            byte = pack[pos]
+            pos += 1
+        if kind == 6:  # OFS_DELTA
+            byte = pack[pos]
+            pos += 1
+            base = byte & 0x7f
+            while byte & 0x80:
+                byte = pack[pos]
+                pos += 1
+                base = ((base + 1) << 7) | (byte & 0x7f)
+            kind, data = self.read(offset - base, lookup)
+            return kind, _apply_delta(data, self._inflate(pos))
+        elif kind == 7:  # REF_DELTA
+            kind, data = lookup(bytes(pack[pos:pos + 20]))
+            return kind, _apply_delta(data, self._inflate(pos + 20))
+        elif kind in self.TYPES:
+            return self.TYPES[kind], self._inflate(pos)
+        raise Unsupported("Unknown pack object type %d" % kind)
+
+    def _inflate(self, pos):
+        inflater = zlib.decompressobj()
+        out = []
+        while not inflater.eof:
+            chunk = self.pack[pos:pos + 4096]
+            if not chunk:
+                raise Unsupported("Truncated pack %s" % self.pack_file)
+            out.append(inflater.decompress(chunk))
+            pos += 4096
+        return b"".join(out)
+
+
+class Repository(object):
+    """
+    Read-only access to the refs and objects of the
+    repository in git_dir.
+    """
+
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        self.common_dir = common_dir(git_dir)
+        self.objects = path.join(self.common_dir, "objects")
+        self._check_layout()
+        self.packs = []
+        pack_dir = path.join(self.objects, "pack")
+        if path.isdir(pack_dir):
+            for name in sorted(os.listdir(pack_dir)):
+                if name.endswith(".idx"):
+                    self.packs.append(_Pack(path.join(pack_dir, name)))
+        self._packed_refs = None
+        self._cache = {}
+
+    def _check_layout(self):
+        for name in ("shallow", path.join("info", "grafts"),
+                     path.join("objects", "info", "alternates")):
+            if path.exists(path.join(self.common_dir, name)):
+                raise Unsupported("Cannot handle %s" % name)
+        replace = path.join(self.common_dir, "refs", "replace")
+        if path.isdir(replace) and os.listdir(replace):
+            raise Unsupported("Cannot handle replace refs")
+        config = _read(path.join(self.common_dir, "config")) or b""
+        for line in config.lower().splitlines():
+            key = line.split(b"=")[0].strip()
+            if key in (b"objectformat", b"refstorage"):
+                raise Unsupported("Cannot handle extensions.%s" % key)
+
+    # Refs
+
+    def packed_refs(self):
+        """
+        Return a dict of ref name to (sha, peeled sha or
+        None) from packed-refs.
+        """
+        if self._packed_refs is None:
+            refs = {}
+            data = _read(path.join(self.common_dir, "packed-refs")) or b""
+            last = None
+            for line in data.decode("utf-8").splitlines():
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("^"):
+                    if last is not None:
+                        refs[last] = (refs[last][0], line[1:].strip())
+                    continue
+                sha, last = line.split(" ", 1)
+                refs[last] = (sha, None)
+            self._packed_refs = refs
+        return self._packed_refs
+
+    def resolve(self, ref, depth=0):
+        """
+        Return the sha that ref (e.g. "HEAD") points to,
+        following symbolic refs, or None.
+        """
+        if depth > 5:
+            return None
+        for base in (self.git_dir, self.common_dir):
+            data = _read(path.join(base, ref))
+            if data is not None:
+                value = data.decode("utf-8").strip()
+                if value.startswith("ref:"):
+                    return self.resolve(value[len("ref:"):].strip(), depth + 1)
+                return value
+        packed = self.packed_refs().get(ref)
+        if packed:
+            return packed[0]
+        return None
+
+    def tags(self):
+        """
+        Return a dict of tag name (without refs/tags/) to sha,
+        with loose refs taking precedence over packed-refs.
+        """
+        tags = {}
+        for ref, (sha, peeled) in self.packed_refs().items():
+            if ref.startswith("refs/tags/"):
+                tags[ref[len("refs/tags/"):]] = sha
+        tags_dir = path.join(self.common_dir, "refs", "tags")
+        for root, dirs, files in os.walk(tags_dir):
+            for name in files:
+                filename = path.join(root, name)
+                data = _read(filename)
+                if data:
+                    rel = path.relpath(filename, tags_dir)
+                    tags[rel.replace(os.sep, "/")] = \
+                        data.decode("utf-8").strip()
+        return tags
+
+    # Objects
+
+    def read(self, sha):
+        """
+        Return (type, data) for the hex or binary sha.
+        """
+        if len(sha) == 40:
+            sha = bytes(bytearray.fromhex(sha))
+        if sha in self._cache:
+            return self._cache[sha]
+        hex = "".join("%02x" % b for b in bytearray(sha))
+        data = _read(path.join(self.objects, hex[:2], hex[2:]))
+        if data is not None:
+            data = zlib.decompress(data)
+            header, _, body = data.partition(b"\0")
+            result = (header.split(b" ")[0].decode("ascii"), body)
+        else:
+            for pack in self.packs:
+                offset = pack.find(sha)
+                if offset is not None:
+                    result = pack.read(offset, self.read)
+                    break
+            else:
+                raise Unsupported("Object %s not found" % hex)
+        self._cache[sha] = result
+        return result
+
+    def commit(self, sha):
+        """
+        Return (committer timestamp, parent shas) of a commit.
+        """
+        kind, data = self.read(sha)
+        if kind != "commit":
+            raise Unsupported("%s is not a commit" % sha)
+        parents = []
+        date = 0
+        for line in data.split(b"\n"):
+            if not line:
+                break
+            if line.startswith(b"parent "):
+                parents.append(line[7:].decode("ascii"))
+            elif line.startswith(b"committer "):
+                date = int(line.rsplit(b" ", 2)[-2])
+        return date, parents
+
+    def peel(self, sha):
+        """
+        Follow tag objects from sha. Return (commit sha or
+        None, tagger timestamp of the outermost tag or None).
+        """
+        kind, data = self.read(sha)
+        date = None
+        while kind == "tag":
+            target = None
+            for line in data.split(b"\n"):
+                if not line:
+                    break
+                if line.startswith(b"object "):
+                    target = line[7:].decode("ascii")
+                elif line.startswith(b"tagger ") and date is None:
+                    date = int(line.rsplit(b" ", 2)[-2])
+            if date is None:
+                date = 0
+            sha = target
+            kind, data = self.read(sha)
+        if kind != "commit":
+            return None, date
+        return sha, date
+
+    def abbreviate(self, sha, abbrev):
+        """
+        Return the shortest prefix of sha with at least abbrev
+        characters which no other object shares.
+        """
+        if abbrev >= 40:
+            return sha
+        binary = bytes(bytearray.fromhex(sha))
+        others = []
+        loose = path.join(self.objects, sha[:2])
+        if path.isdir(loose):
+            others.extend(sha[:2] + name for name in os.listdir(loose)
+                          if len(name) == 38)
+        for pack in self.packs:
+            others.extend("".join("%02x" % b for b in bytearray(other))
+                          for other in pack.neighbours(binary))
+        length = max(abbrev, 4)
+        for other in others:
+            if other == sha:
+                continue
+            common = 0
+            while common < 40 and other[common] == sha[common]:
+                common += 1
+            length = max(length, common + 1)
+        return sha[:length]
+
+
+#
+# Describe
+#
+
+def describe(git_dir, abbrev=4, match=MATCH):
+    """
+    Return the output of "git describe --match=<match>
+    --abbrev=<abbrev>" for the repository in git_dir, or
+    None if git would fail (e.g. no matching tags).
+    """
+    repo = Repository(git_dir)
+    head = repo.resolve("HEAD")
+    if not head:
+        return None
+
+    # Only annotated tags are considered, as without --tags. If
+    # several point at the same commit, the newest tag wins.
+    names = {}
+    for name, sha in sorted(repo.tags().items()):
+        if not fnmatchcase(name, match):
+            continue
+        kind, data = repo.read(sha)
+        if kind != "tag":
+            continue
+        commit, date = repo.peel(sha)
+        if commit is None:
+            continue
+        if commit not in names or names[commit][1] < date:
+            names[commit] = (name, date)
+
+    if head in names:
+        return names[head][0]
+
+    # What follows mirrors describe_commit() in git's
+    # builtin/describe.c: walk the history newest first,
+    # tracking which candidate tags each commit can reach.
+    flags = {head: 0}
+    queue = []
+    counter = [0]
+
+    def push(sha):
+        # Equal dates are popped in insertion order
+        date = repo.commit(sha)[0]
+        heapq.heappush(queue, (-date, counter[0], sha))
+        counter[0] += 1
+
+    push(head)
+    matches = []  # [name, depth, flag_within, found_order]
+    seen_commits = 0
+    gave_up_on = None
+    while queue:
+        c = heapq.heappop(queue)[2]
+        seen_commits += 1
+        if c in names:
+            if len(matches) < MAX_CANDIDATES:
+                flag = 1 << (len(matches) + 1)
+                matches.append([names[c][0], seen_commits - 1, flag,
+                                len(matches) + 1])
+                flags[c] |= flag
+            else:
+                gave_up_on = c
+                break
+        for t in matches:
+            if not flags[c] & t[2]:
+                t[1] += 1
+        if matches and not queue:
+            best_depth = min(t[1] for t in matches)
+            best_within = 0
+            for t in matches:
+                if t[1] == best_depth:
+                    best_within |= t[2]
+            if flags[c] & best_within == best_within:
+                break
+        for p in repo.commit(c)[1]:
+            if p not in flags:
+                flags[p] = 0
+                push(p)
+            flags[p] |= flags[c]
+
+    if not matches:
+        return None
+
+    matches.sort(key=lambda t: (t[1], t[3]))
+    best = matches[0]
+    if gave_up_on is not None:
+        push(gave_up_on)
+
+    # finish_depth_computation()
+    while queue:
+        c = heapq.heappop(queue)[2]
+        if flags[c] & best[2]:
+            if all(flags[q[2]] & best[2] for q in queue):
+                break
+        else:
+            best[1] += 1
+        for p in repo.commit(c)[1]:
+            if p not in flags:
+                flags[p] = 0
+                push(p)
+            flags[p] |= flags[c]
+
+    if not abbrev:
+        return best[0]
+    return "%s-%d-g%s" % (best[0], best[1], repo.abbreviate(head, abbrev))
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Discovery of Commands registered by other distributions
+through package entry points, e.g. in setup.py:
+
+    entry_points={
+        'yaclifw.commands': ['mycmd = mypackage.cli:MyCommand'],
+    }
+
+Reading the metadata of every installed distribution is
+slow, so the name, "module:Class" target and help text of
+each command is stored in an index under the framework's
+cache directory. The index is only rebuilt when the mtime
+of a sys.path directory such as site-packages changes.
+Building the index imports each command once; using it
+imports nothing.
+"""
+
+from __future__ import absolute_import
+import hashlib
+import json
+import logging
+import os
+import sys
+
+from .framework import CommandReference
+from .framework import atomic_write
+from .framework import get_cache_dir
+
+log = logging.getLogger("yaclifw.discovery")
+
+INDEX_VERSION = 1
+
+
+def _entry_points(group):
+    """
+    Return (name, "module:Class") pairs for all entry
+    points in group.
+    """
+    try:
+        from importlib import metadata
+    except ImportError:
+        return []
+    eps = metadata.entry_points()
+    if hasattr(eps, "select"):
+        eps = eps.select(group=group)
+    else:
+        eps = eps.get(group, [])
+    return [(ep.name, ep.value) for ep in eps]
+
+
+def _stamp(path=None):
+    """
+    Return a list of [directory, mtime] pairs which changes
+    whenever a distribution is installed, removed or
+    upgraded on the given path (default: sys.path without
+    sys.path[0]): each of these adds or removes a
+    .dist-info or .egg-info entry in a site-packages
+    directory, which updates the mtime of that directory.
+    sys.path[0], the directory of the script or the current
+    directory, changes far more often than the installed
+    packages and is skipped.
+    """
+    if path is None:
+        path = sys.path[1:]
+    stamp = []
+    for entry in path:
+        if not entry:
+            continue
+        entry = os.path.abspath(entry)
+        try:
+            stamp.append([entry, os.stat(entry).st_mtime])
+        except OSError:
+            pass
+    return stamp
+
+
+def index_file(fw_name, group):
+    """
+    Return the location of the index for group. Each
+    interpreter prefix gets its own file so that several
+    virtualenvs can share one cache directory.
+    """
+    prefix = hashlib.md5(sys.prefix.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(
+        get_cache_dir(fw_name), "commands-%s-%s.json" % (group, prefix))
+
+
+def build_index(group):
+    """
+    Import every command registered in group and return a
+    list of {"name", "target", "help"} entries.
+    """
+    from .framework import Command
+
+    index = []
+    for name, target in sorted(_entry_points(group)):
+        try:
+            MyCommand = CommandReference(name, target).load()
+        except Exception:
+            log.warning("Cannot load command %s from %s", name, target,
+                        exc_info=True)
+            continue
+        if not (isinstance(MyCommand, type) and
+                issubclass(MyCommand, Command)):
+            log.warning("%s is not a Command subclass", target)
+            continue
+        index.append({"name": MyCommand.NAME, "target": target,
+                      "help": MyCommand.get_help()})
+    return index
+
+
+def read_index(filename, stamp):
+    """
+    Return the cached index if it is still valid for
+    stamp, otherwise None.
+    """
+    try:
+        with open(filename, "r") as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    if data.get("version") != INDEX_VERSION or data.get("stamp") != stamp:
+        return None
+    return data.get("commands")
+
+
+def write_index(filename, stamp, index):
+    """
+    Atomically replace the index file. Failures are
+    logged and otherwise ignored since the index is only
+    a cache.
+    """
+    data = {"version": INDEX_VERSION, "stamp": stamp, "commands": index}
+    try:
+        atomic_write(filename, json.dumps(data))
+    except (IOError, OSError):
+        log.debug("Cannot write command index %s", filename, exc_info=True)
+
+
+def discover(fw_name, group=None):
+    """
+    Return (name, CommandReference) items for all commands
+    registered in the entry point group (default:
+    "<fw_name>.commands"), suitable for passing to main().
+    """
+    if group is None:
+        group = "%s.commands" % fw_name
+    filename = index_file(fw_name, group)
+    stamp = _stamp()
+    index = read_index(filename, stamp)
+    if index is None:
+        index = build_index(group)
+        write_index(filename, stamp, index)
+    return [(entry["name"], CommandReference(
+        entry["name"], entry["target"], entry["help"])) for entry in index]
@@ -28,6 +28,18 @@ See the documentation on each Command subclass for specifics.
 
 Environment variables:
     YACLIFW_DEBUG_LEVEL     default: logging.INFO
+    YACLIFW_CACHE_DIR       default: $XDG_CACHE_HOME/yaclifw
+    YACLIFW_PROFILE         default: unset (cpu or mem, see --profile)
+    YACLIFW_LOG_FORMAT      default: text (or json, see --log-format)
+    YACLIFW_TIMINGS         default: unset (see timing)
+    YACLIFW_HELP_CACHE      default: 1 (0 disables, see helpcache)
+    YACLIFW_TIMEOUT         default: unset (seconds, see --timeout)
+    YACLIFW_MAX_CPU         default: unset (seconds, see --max-cpu)
+    YACLIFW_MAX_RSS         default: unset (bytes, see --max-rss)
+    YACLIFW_RESOURCES       default: unset (see resources)
+    YACLIFW_MAX_CHILDREN    default: number of CPUs (see processes)
+    YACLIFW_RESULT_CACHE_AGE  default: 604800 (seconds, see resultcache)
+    YACLIFW_RESULT_CACHE_SIZE default: 100M (see resultcache)
 
 """
 
@@ -37,6 +49,12 @@ import os
 import sys
 import logging
 import argparse
+import importlib
+import threading
+
+from . import logs
+from . import timing
+from .profiling import PROFILERS
 
 FRAMEWORK_NAME = "yaclifw"
 DEBUG_LEVEL = logging.INFO
@@ -57,6 +75,19 @@ class Stop(Exception):
         self.rc = rc
         super(Stop, self).__init__(*args, **kwargs)
 
+    def __reduce__(self):
+        # Exception pickles only args, which lost rc and so the
+        # message too, e.g. when raised in a worker process.
+        # Subclasses take other arguments, so restore the state
+        # without calling __init__.
+        return (_new_stop, (type(self), self.args), self.__dict__)
+
+
+def _new_stop(cls, args):
+    stop = Exception.__new__(cls)
+    stop.args = args
+    return stop
+
 
 #
 # What follows are the commands which are available from the command-line.
@@ -70,17 +101,57 @@ class Command(object):
     should register themselves with the parser during
     instantiation. Note: Command.__call__ implementations
     are responsible for calling cleanup()
+
+    __call__ and the callback may also be coroutine functions,
+    in which case they are run on an event loop managed by
+    the framework.
+
+    Commands which produce records should list the formats
+    they support in OUTPUT_FORMATS (see output.FORMATS) and
+    write them through self.output(args).
+
+    Commands whose output only depends on their arguments and
+    on the files named by cache_inputs() can set CACHE = True
+    to have their results cached on disk (see resultcache).
     """
 
     NAME = "abstract"
+    OUTPUT_FORMATS = ()
+    CACHE = False
+    CACHE_HASH = True
 
-    def __init__(self, sub_parsers, set_defaults=True):
-        self.log = logging.getLogger("%s.%s" % (FRAMEWORK_NAME, self.NAME))
-        self.log_level = DEBUG_LEVEL
-
-        help = self.__doc__
+    @classmethod
+    def get_help(cls):
+        """
+        Return the help text for this command, taken from
+        the class docstring. No instance is needed, which
+        allows the command to be listed without being built.
+        """
+        help = cls.__doc__
         if help:
             help = help.lstrip()
+        return help
+
+    def __init__(self, sub_parsers, set_defaults=True):
+        # Commands built by an App take their settings from it,
+        # otherwise from the module globals set by main()
+        self.app = getattr(sub_parsers, "app", None)
+        if self.app is not None:
+            self.fw_name = self.app.fw_name
+            self.default_log_level = self.app.debug_level
+        else:
+            self.fw_name = FRAMEWORK_NAME
+            self.default_log_level = DEBUG_LEVEL
+        self.log = logging.getLogger("%s.%s" % (self.fw_name, self.NAME))
+        if self.app is not None:
+            self.environment = self.app.environment
+        else:
+            self.environment = environment_defaults(self.fw_name)
+        # Per-run state: an App may run this command in several
+        # threads at once
+        self._local = threading.local()
+
+        help = self.get_help()
         self.parser = sub_parsers.add_parser(self.NAME,
                                              help=help, description=help)
         if set_defaults:
@@ -92,23 +163,292 @@ class Command(object):
         self.parser.add_argument(
             "-q", "--quiet", action="count", default=0,
             help="Decrease the logging level by multiples of 10")
+        self.parser.add_argument(
+            "--log-format", choices=logs.FORMATS,
+            default=self.environment["log_format"] or "text",
+            help="Log as text lines (default) or as JSON lines")
+        # --profile[=cpu|mem]: only the "=" form takes a value, so
+        # that "--profile FILE" leaves FILE to the positionals
+        self.parser.add_argument(
+            "--profile", action="store_const", const="cpu",
+            default=self.environment["profile"],
+            help="Profile the command's CPU use, or its memory use "
+            "with --profile=mem")
+        for mode in PROFILERS:
+            self.parser.add_argument(
+                "--profile=%s" % mode, action="store_const", const=mode,
+                dest="profile", default=argparse.SUPPRESS,
+                help=argparse.SUPPRESS)
+        self.parser.add_argument(
+            "--timeout", type=float, metavar="SECONDS",
+            default=self.environment["timeout"],
+            help="Stop the command after this many seconds")
+        self.parser.add_argument(
+            "--max-cpu", type=float, metavar="SECONDS",
+            default=self.environment["max_cpu"],
+            help="Limit the CPU time of the command")
+        self.parser.add_argument(
+            "--max-rss", type=size, metavar="SIZE",
+            default=self.environment["max_rss"],
+            help="Limit the memory of the command, e.g. 512M")
+        if self.OUTPUT_FORMATS:
+            self.parser.add_argument(
+                "--format", choices=self.OUTPUT_FORMATS,
+                default=self.OUTPUT_FORMATS[0],
+                help="Output format (default: %(default)s)")
+        if self.CACHE:
+            self.parser.add_argument(
+                "--no-cache", action="store_true",
+                help="Neither use nor update the result cache")
+            self.parser.add_argument(
+                "--refresh", action="store_true",
+                help="Run the command and replace its cached result")
 
     def __call__(self, args):
         self.configure_logging(args)
         self.cwd = os.path.abspath(os.getcwd())
 
+    @property
+    def log_level(self):
+        """
+        The logging level of the current run in this thread.
+        """
+        return getattr(self._local, "log_level", self.default_log_level)
+
+    @log_level.setter
+    def log_level(self, level):
+        self._local.log_level = level
+
+    @property
+    def cwd(self):
+        """
+        The working directory of the current run in this thread.
+        """
+        return getattr(self._local, "cwd", None)
+
+    @cwd.setter
+    def cwd(self, cwd):
+        self._local.cwd = cwd
+
+    @property
+    def token(self):
+        """
+        The cancel.Token of the current run, which long
+        loops should check().
+        """
+        from .cancel import current
+        return current()
+
+    @property
+    def runner(self):
+        """
+        The processes.Runner which this command should use
+        to start child processes.
+        """
+        runner = getattr(self, "_runner", None)
+        if runner is None:
+            from .processes import Runner
+            from .processes import default_children
+            runner = self._runner = Runner(
+                default_children(self.fw_name), log=self.log)
+        return runner
+
+    def output(self, args, fields=None):
+        """
+        An output.Output writing records to stdout in the
+        --format parsed into args.
+        """
+        from .output import Output
+        return Output(getattr(args, "format", "text"), fields)
+
+    def cache_inputs(self, args):
+        """
+        The paths whose content the result of this command
+        depends on, used in the result cache key when CACHE
+        is set.
+        """
+        return []
+
     def configure_logging(self, args):
-        self.log_level += args.quiet * 10
-        self.log_level -= args.verbose * 10
+        # Relative to the default so that repeated calls, e.g. for
+        # each line of a batch, do not accumulate.
+        self.log_level = (self.default_log_level + args.quiet * 10 -
+                          args.verbose * 10)
 
-        format = "%(asctime)s [%(name)12.12s] %(levelname)-5.5s %(message)s"
-        logging.basicConfig(level=self.log_level, format=format)
+        logs.configure(self.log_level, args.log_format)
         logging.getLogger('github').setLevel(logging.INFO)
 
-        self.log = logging.getLogger('%s.%s' % (FRAMEWORK_NAME, self.NAME))
+        self.log = logging.getLogger('%s.%s' % (self.fw_name, self.NAME))
         self.dbg = self.log.debug
 
 
+class Batch(Command):
+    """
+    Run many command lines in one process
+
+    Each line of the file (default: stdin) holds the arguments of one
+    command, quoted as in a shell. Blank lines and lines starting with
+    # are ignored. The parsers built for this invocation are reused for
+    every line. The exit code of each line is logged and the batch
+    fails with the code of the first failing line.
+    """
+
+    NAME = "batch"
+
+    def __init__(self, sub_parsers):
+        super(Batch, self).__init__(sub_parsers)
+        self.sub_parsers = sub_parsers
+        self.parser.add_argument(
+            "file", nargs="?", default="-",
+            help="File of command lines, one per line (default: stdin)")
+        self.parser.add_argument(
+            "-x", "--stop-on-error", action="store_true",
+            help="Stop at the first command line which fails")
+
+    def __call__(self, args):
+        super(Batch, self).__call__(args)
+        if args.file == "-":
+            rcs = self.run(sys.stdin, args.stop_on_error)
+        else:
+            with open(args.file, "r") as f:
+                rcs = self.run(f, args.stop_on_error)
+        failed = [(lineno, rc) for lineno, rc in rcs if rc]
+        if failed:
+            raise Stop(failed[0][1], "%d of %d command lines failed" % (
+                len(failed), len(rcs)))
+
+    def run(self, lines, stop_on_error=False):
+        """
+        Run each line and return a list of (line number,
+        exit code) pairs.
+        """
+        import shlex
+        rcs = []
+        for lineno, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                args = shlex.split(line)
+            except ValueError as error:
+                self.log.error("line %d: %s", lineno, error)
+                rc = 2
+            else:
+                rc = self.run_line(args)
+            if rc:
+                self.log.info("line %d: rc=%d", lineno, rc)
+            else:
+                self.log.debug("line %d: rc=%d", lineno, rc)
+            rcs.append((lineno, rc))
+            if rc and stop_on_error:
+                break
+        return rcs
+
+    def run_line(self, args):
+        """
+        Parse and run one command line, returning its exit
+        code as entry_point() would.
+        """
+        parser = self.sub_parsers.choices.get(args[0])
+        if parser is None or args[0] == self.NAME:
+            self.log.error("Unknown command: %s", args[0])
+            return 2
+        try:
+            ns = parser.parse_args(args[1:])
+            dispatch(ns)
+        except Stop as stop:
+            self.token.check()  # The whole batch was cancelled
+            print(stop)
+            return stop.rc
+        except SystemExit as exit:
+            if exit.code is None or isinstance(exit.code, int):
+                return exit.code or 0
+            return 1
+        except KeyboardInterrupt:
+            raise
+        except Exception:
+            self.log.exception("%s failed", " ".join(args))
+            return 1
+        return 0
+
+
+class CommandReference(object):
+    """
+    Stand-in for a Command subclass which has not been
+    imported yet. The target is a "module:Class" string
+    which is only imported by load(). If the help text
+    is known up front (e.g. from a discovery index) the
+    command can be listed without any import at all.
+    """
+
+    def __init__(self, name, target, help=None):
+        self.NAME = name
+        self.target = target
+        self.help = help
+
+    def __repr__(self):
+        return "CommandReference(%r, %r)" % (self.NAME, self.target)
+
+    def get_help(self):
+        if self.help is None:
+            return self.load().get_help()
+        return self.help
+
+    def load(self):
+        module_name, _, attr = self.target.partition(":")
+        obj = importlib.import_module(module_name)
+        for part in attr.split("."):
+            obj = getattr(obj, part)
+        return obj
+
+
+def size(text):
+    """
+    argparse type for sizes such as 512M (see resources).
+    """
+    from .resources import parse_size
+    return parse_size(text)
+
+
+def get_cache_dir(fw_name):
+    """
+    Return the directory used for on-disk caches of the
+    given framework. It is not created here.
+    """
+    cache_name = "%s_CACHE_DIR" % fw_name.upper()
+    if os.environ.get(cache_name):
+        return os.environ[cache_name]
+    base = os.environ.get("XDG_CACHE_HOME")
+    if not base:
+        base = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, fw_name)
+
+
+def atomic_write(filename, text):
+    """
+    Write text to a temporary file in the directory of
+    filename, creating it if needed, and rename it over
+    filename so that readers never see a partial file.
+    The file gets the mode which open() would give it.
+    """
+    import tempfile
+    dirname = os.path.dirname(filename)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dirname or None, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        # mkstemp() creates the file readable by its owner only
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp, 0o666 & ~umask)
+        os.replace(tmp, filename)
+    except Exception:
+        os.remove(tmp)
+        raise
+
+
 def parsers():
 
     class HelpFormatter(argparse.RawTextHelpFormatter):
@@ -145,7 +485,253 @@ def parsers():
     return yaclifw_parser, sub_parsers
 
 
-def main(fw_name, args=None, items=None):
+def find_subcommand(args, names):
+    """
+    Return the name of the subcommand selected by args
+    without parsing them. The top-level parser only
+    accepts -h/--help, so the first positional argument
+    is the subcommand. None is returned if help was
+    requested first or if no known name was found.
+    """
+    for arg in args:
+        if arg in ("-h", "--help"):
+            return None
+        if arg.startswith("-"):
+            continue
+        if arg in names:
+            return arg
+        return None
+    return None
+
+
+def commands(items):
+    """
+    Filter items down to the (name, Command subclass)
+    pairs which should be registered, sorted by name.
+    CommandReference instances are kept as they are and
+    "module:Class" strings are turned into references
+    which use the item name as the command NAME.
+    """
+    found = []
+    for name, MyCommand in sorted(items, key=lambda item: item[0]):
+        if isinstance(MyCommand, str):
+            MyCommand = CommandReference(name, MyCommand)
+        if isinstance(MyCommand, CommandReference):
+            found.append((name, MyCommand))
+            continue
+        if not isinstance(MyCommand, type):
+            continue
+        if not issubclass(MyCommand, Command):
+            continue
+        if MyCommand.NAME == "abstract":
+            continue
+        found.append((name, MyCommand))
+    return found
+
+
+def load(MyCommand):
+    """
+    Return the Command subclass for MyCommand, importing
+    it first if it is a CommandReference.
+    """
+    if isinstance(MyCommand, CommandReference):
+        return MyCommand.load()
+    return MyCommand
+
+
+def get_debug_level(fw_name, default=logging.INFO):
+    """
+    Return the logging level requested by the
+    <FW_NAME>_DEBUG_LEVEL environment variable.
+    """
+    debug_name = "%s_DEBUG_LEVEL" % fw_name.upper()
+    if debug_name in os.environ:
+        try:
+            return int(os.environ.get(debug_name))
+        except ValueError:
+            return 10  # Assume poorly formatted means "debug"
+    return default
+
+
+def _choice(choices):
+    def check(value):
+        if value not in choices:
+            raise ValueError("expected one of %s" % ", ".join(choices))
+    return check
+
+
+# Options of every Command whose default <FW>_<DEST> may supply,
+# with a function raising ValueError for values they reject
+ENVIRONMENT = (
+    ("log_format", _choice(logs.FORMATS)),
+    ("profile", _choice(PROFILERS)),
+    ("timeout", float),
+    ("max_cpu", float),
+    ("max_rss", size),
+)
+
+
+def environment_defaults(fw_name):
+    """
+    The defaults which the <FW>_* environment variables supply
+    for the options of every Command (see ENVIRONMENT), by
+    option dest. argparse does not check defaults, so a value
+    which the option would reject is ignored with a warning
+    instead of failing every command.
+    """
+    defaults = {}
+    for dest, check in ENVIRONMENT:
+        name = "%s_%s" % (fw_name.upper(), dest.upper())
+        value = os.environ.get(name) or None
+        if value is not None:
+            try:
+                check(value)
+            except ValueError as e:
+                logging.getLogger(fw_name).warning(
+                    "Ignoring %s=%s: %s", name, value, e)
+                value = None
+        defaults[dest] = value
+    return defaults
+
+
+class App(object):
+    """
+    A framework instance: the Commands in items registered
+    on a parser tree which is built once and then reused by
+    every call to run(). The framework name and debug level
+    are held here rather than in the module globals, so that
+    an App can be used repeatedly and from several threads
+    of a long-running process.
+
+    If lazy is True, each Command is only built the first
+    time it is selected. Until then help and usage errors
+    are produced from its NAME and help line alone. If
+    package is also given, "-h" and "<command> -h" are
+    answered from a help cache keyed by the version of
+    that package (see helpcache).
+    """
+
+    def __init__(self, fw_name, items=None, lazy=False, debug_level=None,
+                 package=None):
+        self.fw_name = fw_name
+        if debug_level is None:
+            debug_level = get_debug_level(fw_name, DEBUG_LEVEL)
+        self.debug_level = debug_level
+        self.environment = environment_defaults(fw_name)
+        if items is None:
+            items = list(globals().items())
+        self.items = commands(items)
+        self.names = dict((MyCommand.NAME, MyCommand)
+                          for _, MyCommand in self.items)
+        self.lazy = lazy
+        self.package = package
+        self.lock = threading.RLock()
+        self.commands = {}
+        with timing.phase("parsers"):
+            self.parser, self.sub_parsers = parsers()
+        self.sub_parsers.app = self
+        self._stub_parser = None
+        if not lazy:
+            self.build()
+
+    def build(self, name=None):
+        """
+        Build the Command called name, or all Commands,
+        unless already built. Returns the instance or None.
+        """
+        with self.lock:
+            if name is None:
+                for _, MyCommand in self.items:
+                    self.build(MyCommand.NAME)
+                return None
+            if name not in self.commands:
+                with timing.phase("command", name):
+                    MyCommand = load(self.names[name])
+                    self.commands[name] = MyCommand(self.sub_parsers)
+            return self.commands[name]
+
+    def stub_parser(self):
+        """
+        A parser listing each Command by NAME and help line
+        only, for top-level help and usage errors.
+        """
+        with self.lock:
+            if self._stub_parser is None:
+                with timing.phase("stub_parser"):
+                    parser, sub_parsers = parsers()
+                    for _, MyCommand in self.items:
+                        help = MyCommand.get_help()
+                        sub_parsers.add_parser(MyCommand.NAME, help=help,
+                                               description=help)
+                self._stub_parser = parser
+            return self._stub_parser
+
+    def parser_for(self, args):
+        """
+        Return a parser which can parse args, building the
+        selected Command first in lazy mode.
+        """
+        if not self.lazy:
+            return self.parser
+        selected = find_subcommand(args, self.names)
+        if selected is None:
+            return self.stub_parser()
+        if issubclass(load(self.names[selected]), Batch):
+            # Every line may need any of the other commands
+            self.build()
+        else:
+            self.build(selected)
+        return self.parser
+
+    def help(self, topic):
+        """
+        The help text of the Command named topic, or the
+        top-level help if topic is "".
+        """
+        def render(topic):
+            if topic:
+                return self.build(topic).parser.format_help()
+            return self.stub_parser().format_help()
+
+        if not (self.lazy and self.package):
+            return render(topic)
+        from .helpcache import get_help
+        return get_help(self, topic, render)
+
+    def parse(self, args=None):
+        if args is None:
+            args = sys.argv[1:]
+        if self.lazy and self.package and args[-1:] in (["-h"], ["--help"]):
+            from .helpcache import help_request
+            topic = help_request(args, self.names)
+            if topic is not None:
+                sys.stdout.write(self.help(topic))
+                raise SystemExit(0)
+        parser = self.parser_for(args)
+        with timing.phase("parse_args"):
+            return parser.parse_args(args)
+
+    def run(self, args=None):
+        """
+        Parse args (default: sys.argv[1:]) and run the selected
+        Command, or the pipeline of Commands separated by "--"
+        (see pipeline). Stop exceptions are propagated to callers.
+        """
+        if args is None:
+            args = sys.argv[1:]
+        stages = [args]
+        if "--" in args:
+            from .pipeline import split
+            stages = split(args, self.names)
+        with logs.run():
+            if len(stages) == 1:
+                dispatch(self.parse(args))
+            else:
+                from .pipeline import dispatch as dispatch_pipeline
+                dispatch_pipeline([self.parse(stage) for stage in stages])
+
+
+def main(fw_name, args=None, items=None, lazy=False, package=None):
     """
     Reusable entry point. Arguments are parsed
     via the argparse-subcommands configured via
@@ -154,40 +740,157 @@ def main(fw_name, args=None, items=None):
 
     The name of the framework will be used in logging
     and similar.
+
+    If lazy is True, only the selected Command is
+    instantiated. When no Command is selected (e.g.
+    for -h or a typo) each Command is registered with
+    just its NAME and help line so that argparse can
+    print usage without building any full subparser.
+
+    If package is also given, help is printed from a
+    cache keyed by the version of package (see App).
+
+    This builds a new App on each call. Long-running
+    processes should create an App once and call its
+    run() method instead.
+
+    If <FW>_TIMINGS is set, the time spent in each phase
+    of the call is appended to that file (see timing).
     """
 
     global DEBUG_LEVEL
     global FRAMEWORK_NAME
 
-    debug_name = "%s_DEBUG_LEVEL" % fw_name.upper()
-    if debug_name in os.environ:
-        try:
-            DEBUG_LEVEL = int(os.environ.get(debug_name))
-        except ValueError:
-            DEBUG_LEVEL = 10  # Assume poorly formatted means "debug"
+    DEBUG_LEVEL = get_debug_level(fw_name, DEBUG_LEVEL)
     FRAMEWORK_NAME = fw_name
 
-    if args is None:
-        args = sys.argv[1:]
-
     if items is None:
         items = list(globals().items())
 
-    yaclifw_parser, sub_parsers = parsers()
+    with timing.run(fw_name, args):
+        App(fw_name, items, lazy=lazy, debug_level=DEBUG_LEVEL,
+            package=package).run(args)
 
-    for name, MyCommand in sorted(items):
-        if not isinstance(MyCommand, type):
-            continue
-        if not issubclass(MyCommand, Command):
-            continue
-        if MyCommand.NAME == "abstract":
-            continue
-        MyCommand(sub_parsers)
 
-    ns = yaclifw_parser.parse_args(args)
-    ns.func(ns)
+def dispatch(ns):
+    """
+    Run the command selected by the parsed namespace
+    followed by its callback, if any. If either is a
+    coroutine, both are run on one event loop. Both
+    are profiled together if --profile was given, and
+    cancelled together after --timeout seconds or on a
+    signal (see cancel). Their resource use is reported
+    and limited together (see resources). The results of
+    commands with CACHE set are replayed from the result
+    cache when possible (see resultcache).
+    """
+    from .cancel import run
+    from .resources import account
+    command = getattr(ns.func, "__self__", None)
+    with run(getattr(ns, "timeout", None)), account(ns):
+        if getattr(command, "CACHE", False):
+            from .resultcache import ResultCache
+            ResultCache(command.fw_name).call(command, ns, _profiled)
+        else:
+            _profiled(ns)
+
+
+def _profiled(ns):
+    mode = getattr(ns, "profile", None)
+    if mode:
+        from .profiling import profile
+        from .profiling import profile_name
+        with profile(mode, profile_name(ns)):
+            _dispatch(ns)
+    else:
+        _dispatch(ns)
+
+
+def is_awaitable(result):
+    """
+    Whether result must be run on an event loop. Same as
+    inspect.isawaitable(), which is slow to import.
+    """
+    return hasattr(result, "__await__")
+
+
+def _dispatch(ns):
+    with timing.phase("func"):
+        result = ns.func(ns)
+    if is_awaitable(result):
+        run_async(_dispatch_async(result, ns))
+        return
+    if result is not None:
+        from .pipeline import is_records
+        from .pipeline import write
+        if is_records(result):
+            with timing.phase("pipeline"):
+                write(ns, result)
+    callback = check_callback(ns)
+    if callback is not None:
+        with timing.phase("callback"):
+            result = callback()
+            if is_awaitable(result):
+                run_async(result)
+
+
+def check_callback(ns):
     if hasattr(ns, 'callback'):
         if callable(ns.callback):
-            ns.callback()
+            return ns.callback
         else:
             raise Stop(3, "Callback not callable")
+    return None
+
+
+async def _dispatch_async(result, ns):
+    with timing.phase("func"):
+        await result
+    callback = check_callback(ns)
+    if callback is not None:
+        with timing.phase("callback"):
+            result = callback()
+            if is_awaitable(result):
+                await result
+
+
+def run_async(awaitable):
+    """
+    Run awaitable on a new event loop which is closed
+    afterwards. On KeyboardInterrupt or cancel.Cancelled
+    the task is cancelled and given the chance to clean up
+    before the exception is re-raised. A cancelled or timed
+    out task is turned into Stop.
+    """
+    import asyncio
+    from .cancel import Cancelled
+    from .cancel import TIMEOUT_RC
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    task = asyncio.ensure_future(awaitable, loop=loop)
+    try:
+        try:
+            return loop.run_until_complete(task)
+        except (KeyboardInterrupt, Cancelled):
+            task.cancel()
+            try:
+                loop.run_until_complete(task)
+            except BaseException:
+                pass
+            raise
+        except asyncio.CancelledError:
+            raise Stop(1, "Cancelled")
+        except asyncio.TimeoutError:
+            raise Stop(TIMEOUT_RC, "Timed out")
+    finally:
+        try:
+            pending = asyncio.all_tasks(loop)
+            for other in pending:
+                other.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(
+                    *pending, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
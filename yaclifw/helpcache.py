@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Cache of rendered help texts.
+
+"tool -h" and "tool <command> -h" only print text which is fully
+determined by the installed code, so an App created with a package
+renders each text once, stores it under the framework's cache
+directory and prints it from there afterwards without building any
+subparser. The cache is keyed by the version of the package and
+everything else the text depends on: the installed distributions (as
+for the discovery index), the program name, the terminal width, the
+registered commands and the <FW>_* environment variables which may
+supply defaults. Changing any of them starts a new cache.
+
+Set <FW>_HELP_CACHE=0 to always render help from the parsers, e.g.
+while editing commands in a source checkout.
+"""
+
+from __future__ import absolute_import
+import hashlib
+import json
+import logging
+import os
+
+from .framework import atomic_write
+from .framework import get_cache_dir
+
+log = logging.getLogger("yaclifw.helpcache")
+
+HELP = ("-h", "--help")
+TOP_LEVEL = ""
+
+
+def help_request(args, names):
+    """
+    TOP_LEVEL for "-h", the command name for "<command> -h",
+    otherwise None.
+    """
+    if len(args) == 1 and args[0] in HELP:
+        return TOP_LEVEL
+    if len(args) == 2 and args[0] in names and args[1] in HELP:
+        return args[0]
+    return None
+
+
+def enabled(fw_name):
+    return os.environ.get("%s_HELP_CACHE" % fw_name.upper()) != "0"
+
+
+def cache_version(package):
+    """
+    The version which keys the help cache of package: the one
+    baked in at build time (see yaclifw.version), else that of
+    the installed distribution called package, or None.
+    """
+    from .version import read_baked_version
+    version = read_baked_version(package)
+    if version is not None:
+        return version
+    try:
+        from importlib import metadata
+        return metadata.version(package)
+    except Exception:
+        return None
+
+
+def _target(MyCommand):
+    target = getattr(MyCommand, "target", None)
+    if target is None:
+        target = "%s:%s" % (MyCommand.__module__, MyCommand.__name__)
+    return target
+
+
+def cache_key(app, version):
+    import shutil
+    from .discovery import _stamp
+    prefix = "%s_" % app.fw_name.upper()
+    return {
+        "version": version,
+        "installed": _stamp(),
+        "prog": app.parser.prog,
+        "columns": shutil.get_terminal_size().columns,
+        "commands": [[MyCommand.NAME, _target(MyCommand)]
+                     for _, MyCommand in app.items],
+        "environment": sorted([k, v] for k, v in os.environ.items()
+                              if k.startswith(prefix)),
+    }
+
+
+def cache_file(fw_name, key):
+    digest = hashlib.md5(
+        json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+    return os.path.join(get_cache_dir(fw_name), "help-%s.json" % digest)
+
+
+def read(filename, key):
+    """
+    The cached texts if filename holds them for key,
+    otherwise an empty dict.
+    """
+    try:
+        with open(filename, "r") as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("key") != key:
+        return {}
+    return data.get("texts", {})
+
+
+def write(filename, key, texts):
+    """
+    Atomically replace filename and remove the caches of
+    other keys. Failures are logged and otherwise ignored.
+    """
+    dirname = os.path.dirname(filename)
+    try:
+        atomic_write(filename, json.dumps({"key": key, "texts": texts}))
+        for name in os.listdir(dirname):
+            other = os.path.join(dirname, name)
+            if name.startswith("help-") and other != filename:
+                os.remove(other)
+    except (IOError, OSError):
+        log.debug("Cannot write help cache %s", filename, exc_info=True)
+
+
+def get_help(app, topic, render):
+    """
+    The help text for topic, read from the cache of app if
+    possible, otherwise from render(topic) and then cached.
+    """
+    version = cache_version(app.package)
+    if version is None or not enabled(app.fw_name):
+        return render(topic)
+    key = cache_key(app, version)
+    filename = cache_file(app.fw_name, key)
+    texts = read(filename, key)
+    if topic not in texts:
+        texts[topic] = render(topic)
+        write(filename, key, texts)
+    return texts[topic]
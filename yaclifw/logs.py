@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Logging for a run of the framework.
+
+configure() installs, once per run, a QueueHandler on the root
+logger so that emitting a record only puts it on a queue. A
+QueueListener thread formats the records and writes them to
+stderr, so a slow reader of stderr does not hold up the command.
+Records still on the queue are written when the run ends, and
+flush() waits for them. The listener writes to whatever
+sys.stderr is at the time, so that the result cache records the
+log lines of each cached command (see writer()).
+
+The format is either the usual text line or, with
+--log-format=json (or <FW>_LOG_FORMAT=json), one JSON object
+per line with the keys time, name, level and message, plus
+exc_info if there was an exception.
+
+Worker processes must not use the handlers of their parent.
+ProcessLogging forwards their records to this process over a
+multiprocessing queue instead; see init_worker().
+
+If the root logger already has handlers when a run starts, e.g.
+because the application configured logging itself, they are
+left alone and only the level is set.
+
+Runs in several threads (see App.run) may ask for different
+levels. The root level is then the lowest of them, and the
+handler installed here drops each record below the level of the
+run in the thread which emitted it, so that -v in one run does
+not make the others verbose.
+"""
+
+from __future__ import absolute_import
+import logging
+import os
+import sys
+import threading
+
+FORMAT = "%(asctime)s [%(name)12.12s] %(levelname)-5.5s %(message)s"
+FORMATS = ("text", "json")
+
+_lock = threading.RLock()
+_listener = None
+_handler = None
+_runs = 0
+_levels = {}  # Thread ident -> level of the run in that thread
+_state = threading.local()
+_writing = threading.local()
+
+
+class _StreamHandler(logging.StreamHandler):
+    # Runs in the listener thread. Writes to the current sys.stderr
+    # unless given a stream, and records on whose behalf it writes
+    # for writer(). A record carrying an Event is a flush() marker.
+
+    def __init__(self, stream=None):
+        super(_StreamHandler, self).__init__(stream)
+        self.fixed = stream is not None
+
+    def handle(self, record):
+        flushed = getattr(record, "flushed", None)
+        if flushed is not None:
+            flushed.set()
+            return True
+        if not self.fixed:
+            self.stream = sys.stderr
+        # Records from worker processes belong to no thread here
+        _writing.thread = (record.thread if record.process == os.getpid()
+                           else -1)
+        try:
+            return super(_StreamHandler, self).handle(record)
+        finally:
+            _writing.thread = None
+
+
+def writer():
+    """
+    The ident of the thread on whose behalf the current thread
+    writes: the one which logged the record being written by
+    the listener, otherwise the current thread.
+    """
+    thread = getattr(_writing, "thread", None)
+    if thread is None:
+        return threading.get_ident()
+    return thread
+
+
+def flush(timeout=5):
+    """
+    Wait until the records queued so far have been written.
+    """
+    with _lock:
+        listener = _listener
+    if listener is None or threading.current_thread() is listener._thread:
+        return
+    flushed = threading.Event()
+    listener.queue.put_nowait(logging.makeLogRecord({"flushed": flushed}))
+    flushed.wait(timeout)
+
+
+class _RunLevel(logging.Filter):
+    # Threads without a run of their own, e.g. pool workers,
+    # are only subject to the root level
+
+    def filter(self, record):
+        level = _levels.get(record.thread)
+        return level is None or record.levelno >= level
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats each record as a single line of JSON.
+    """
+
+    def format(self, record):
+        import json
+        data = {
+            "time": self.formatTime(record),
+            "name": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, sort_keys=True)
+
+
+def formatter(log_format="text"):
+    if log_format == "json":
+        return JsonFormatter()
+    if log_format == "text":
+        return logging.Formatter(FORMAT)
+    raise ValueError("Unknown log format: %s" % log_format)
+
+
+def _queue_handler(queue):
+    from logging.handlers import QueueHandler
+
+    class _QueueHandler(QueueHandler):
+
+        def prepare(self, record):
+            # Merge the arguments and render the traceback now, as
+            # the default does, but keep them out of the message
+            # so that the formatter on the other side decides.
+            record = logging.makeLogRecord(record.__dict__)
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(
+                    record.exc_info)
+                record.exc_info = None
+            return record
+
+    return _QueueHandler(queue)
+
+
+def configure(level, log_format="text", stream=None):
+    """
+    Set the root level and, on the first call of a run,
+    start the queue and listener writing to stream
+    (default: sys.stderr) in log_format. Later calls
+    only change the level and format.
+    """
+    global _handler, _listener
+    with _lock:
+        root = logging.getLogger()
+        if _listener is None and not root.handlers:
+            import queue
+            from logging.handlers import QueueListener
+            _handler = _StreamHandler(stream)
+            records = queue.SimpleQueue()
+            handler = _queue_handler(records)
+            handler.addFilter(_RunLevel())
+            root.addHandler(handler)
+            _listener = QueueListener(records, _handler)
+            _listener.start()
+        if _handler is not None:
+            _handler.setFormatter(formatter(log_format))
+        if getattr(_state, "depth", 0):
+            _levels[threading.get_ident()] = level
+            level = min(_levels.values())
+        root.setLevel(level)
+
+
+def shutdown():
+    """
+    Write the queued records and remove the handlers
+    installed by configure().
+    """
+    global _handler, _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            if getattr(handler, "queue", None) is _listener.queue:
+                root.removeHandler(handler)
+        _handler.flush()
+        _listener = _handler = None
+
+
+class run(object):
+    """
+    Context manager for one run. Logging configured during
+    the run is shut down when the last concurrent run ends.
+    """
+
+    def __enter__(self):
+        global _runs
+        with _lock:
+            _runs += 1
+        _state.depth = getattr(_state, "depth", 0) + 1
+        return self
+
+    def __exit__(self, *exc_info):
+        global _runs
+        _state.depth -= 1
+        with _lock:
+            if not _state.depth:
+                _levels.pop(threading.get_ident(), None)
+                if _levels:
+                    logging.getLogger().setLevel(min(_levels.values()))
+            _runs -= 1
+            if _runs == 0:
+                shutdown()
+        return False
+
+
+def _after_fork():
+    # The listener thread does not survive fork(); the child
+    # configures its own logging if it needs any.
+    global _handler, _listener, _lock, _runs
+    _lock = threading.RLock()
+    if _listener is not None:
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            if getattr(handler, "queue", None) is _listener.queue:
+                root.removeHandler(handler)
+    _listener = _handler = None
+    _runs = 0
+    _levels.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def init_worker(queue, level):
+    """
+    Initializer for worker processes: send every record
+    to the parent through queue.
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler(queue))
+    root.setLevel(level)
+
+
+class ProcessLogging(object):
+    """
+    Context manager providing a multiprocessing queue whose
+    records are passed to the handlers of this process.
+    Pass (init_worker, self.initargs) as the initializer of
+    the worker processes.
+    """
+
+    def __enter__(self):
+        import multiprocessing
+        from logging.handlers import QueueListener
+        root = logging.getLogger()
+        self.queue = multiprocessing.Queue()
+        self.initargs = (self.queue, root.getEffectiveLevel())
+        self.listener = QueueListener(
+            self.queue, *root.handlers, respect_handler_level=True)
+        self.listener.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.listener.stop()
+        self.queue.close()
+        return False
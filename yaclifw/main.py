@@ -22,30 +22,82 @@
 """
 Primary launching functions for yaclifw. All Commands
 which are present in the globals() of this module
-will be presented to the user.
+will be presented to the user, along with any Commands
+registered by other distributions under the
+"yaclifw.commands" entry point group.
+
+If YACLIFW_SERVER names the socket of a running server
+(see yaclifw.server), commands are run there instead.
+
+If YACLIFW_TIMINGS names a file, the time spent in each
+phase of the run is appended to it (see yaclifw.timing).
 """
 
 from __future__ import absolute_import
 from __future__ import print_function
-import traceback
+import os
 import sys
 
-from .framework import main
-from .framework import Stop
+from . import timing
+
+
+# Built-in commands, imported only when selected
+COMMANDS = (
+    ("batch", "yaclifw.framework:Batch"),
+    ("completion", "yaclifw.completion:Completion"),
+    ("example", "yaclifw.example:ExampleCommand"),
+    ("version", "yaclifw.version:Version"),
+)
+
+
+def default_items():
+    """
+    The built-in commands plus those registered by other
+    distributions, without importing any of them.
+    """
+    from .discovery import discover
+    items = list(COMMANDS)
+    builtin = set(name for name, _ in items)
+    items += [(name, ref) for name, ref in discover("yaclifw")
+              if name not in builtin]
+    return items
 
 
-def entry_point(items=tuple()):
+def entry_point(items=tuple(), package=None):
     """
     External entry point which calls main() and
-    if Stop is raised, calls sys.exit()
+    if Stop is raised, calls sys.exit(). Help is
+    cached under the version of package (see
+    yaclifw.helpcache): by default yaclifw for its
+    own commands, and not at all for given items,
+    whose help the version of yaclifw says nothing
+    about.
     """
+    if package is None and not items:
+        package = "yaclifw"
+    server = os.environ.get("YACLIFW_SERVER")
+    if server and not items:
+        from .server import NoServer
+        from .server import client
+        try:
+            sys.exit(client(server))
+        except NoServer:
+            pass  # No server listening, run locally
+    with timing.run("yaclifw"):
+        _run(items, package)
+
+
+def _run(items, package):
+    # Imported here so that the "import" phase covers the
+    # framework, and clients of a server never load it
+    with timing.phase("import"):
+        from .framework import main
+        from .framework import Stop
     try:
         if not items:
-            from .example import ExampleCommand
-            from .version import Version
-            items = [(ExampleCommand.NAME, ExampleCommand),
-                     (Version.NAME, Version)]
-        main("yaclifw", items=items)
+            with timing.phase("discovery"):
+                items = default_items()
+        main("yaclifw", items=items, lazy=True, package=package)
     except Stop as stop:
         print(stop)
         sys.exit(stop.rc)
@@ -55,6 +107,7 @@ def entry_point(items=tuple()):
         print("Cancelled")
         sys.exit(1)
     except Exception:
+        import traceback
         traceback.print_exc()
         sys.exit(1)
 
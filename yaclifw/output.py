@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Structured output for Commands.
+
+A Command which sets OUTPUT_FORMATS gets a --format option and
+writes its results through self.output(args), e.g.:
+
+    with self.output(args, fields=("name", "version")) as out:
+        out.write(self.find_packages())
+
+Each record may be a dict, a tuple or list (matched with fields)
+or a single value. Records can come from a generator; they are
+formatted one at a time and written to stdout in large chunks:
+
+    text    values separated by tabs, no header
+    jsonl   one JSON object (or value) per line
+    tsv     a header line (if fields are known), then tab separated
+            values with tabs, newlines and backslashes escaped
+    csv     as written by the csv module, with a header line
+
+If the reader goes away (e.g. "tool list | head"), the rest of the
+output is discarded and Stop(PIPE_RC) is raised, as the shell would
+report for a process killed by SIGPIPE.
+"""
+
+from __future__ import absolute_import
+import os
+import sys
+
+from .framework import Stop
+
+FORMATS = ("text", "jsonl", "tsv", "csv")
+BUFFER_SIZE = 64 * 1024
+PIPE_RC = 141  # 128 + SIGPIPE
+
+
+def _text(value):
+    if value is None:
+        return ""
+    return str(value)
+
+
+def _tsv(value):
+    return _text(value).replace("\\", "\\\\").replace(
+        "\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+class Output(object):
+    """
+    Writes records to stream (default: sys.stdout) in
+    format. Use as a context manager or call close().
+    """
+
+    def __init__(self, format="text", fields=None, stream=None,
+                 buffer_size=BUFFER_SIZE):
+        if format not in FORMATS:
+            raise ValueError("Unknown output format: %s" % format)
+        self.format = format
+        self.fields = list(fields) if fields else None
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.count = 0
+        self.chunks = []
+        self.size = 0
+        self.header = format in ("tsv", "csv")
+        self.csv = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            try:
+                self.close()
+            except Stop:
+                pass  # Keep the original exception
+        return False
+
+    def write(self, records):
+        """
+        Write each record of the iterable records.
+        """
+        for record in records:
+            self.writerow(record)
+
+    def writerow(self, record):
+        if isinstance(record, dict):
+            if self.fields is None:
+                self.fields = list(record)
+            values = [record.get(field) for field in self.fields]
+        elif isinstance(record, (tuple, list)):
+            values = list(record)
+        else:
+            values = [record]
+        if self.header:
+            self.header = False
+            if self.fields:
+                self._row(self.fields)
+        self._row(values, record=record)
+        self.count += 1
+
+    def _row(self, values, record=None):
+        if self.format == "text":
+            line = "\t".join(_text(v) for v in values) + "\n"
+        elif self.format == "tsv":
+            line = "\t".join(_tsv(v) for v in values) + "\n"
+        elif self.format == "csv":
+            if self.csv is None:
+                import csv
+                self.csv = csv.writer(_Sink(self._write), lineterminator="\n")
+            self.csv.writerow(["" if v is None else v for v in values])
+            return
+        else:
+            import json
+            if isinstance(record, dict):
+                data = record
+            elif self.fields and isinstance(record, (tuple, list)):
+                data = dict(zip(self.fields, record))
+            else:
+                data = record
+            line = json.dumps(data) + "\n"
+        self._write(line)
+
+    def _write(self, text):
+        self.chunks.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush(final=False)
+
+    def flush(self, final=True):
+        """
+        Write out the buffered output, and flush the stream
+        as well if final.
+        """
+        stream = self.stream or sys.stdout
+        try:
+            if self.chunks:
+                stream.write("".join(self.chunks))
+            if final:
+                stream.flush()
+        except BrokenPipeError:
+            self.chunks = []
+            self.size = 0
+            _discard(stream)
+            raise Stop(PIPE_RC, "Output closed")
+        self.chunks = []
+        self.size = 0
+
+    def close(self):
+        self.flush(final=True)
+
+
+class _Sink(object):
+    # File-like object for csv.writer
+
+    def __init__(self, write):
+        self.write = write
+
+
+def _discard(stream):
+    # Point the stream's file descriptor at /dev/null so that
+    # later writes and the flush at exit do not fail again.
+    try:
+        fd = stream.fileno()
+    except (AttributeError, ValueError, OSError):
+        return
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, fd)
+    finally:
+        os.close(devnull)
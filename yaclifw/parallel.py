@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Running a function over many work items (repositories,
+servers, ...) on a bounded thread or process pool.
+
+Commands which need this should subclass ParallelCommand,
+which adds the shared --jobs and --executor options, and
+iterate over self.fan_out(func, items, args).
+
+Failures of single items are logged and do not stop the
+others. Once all items have been processed a single Stop
+is raised, carrying the highest return code of the failed
+items (1 for exceptions other than Stop).
+
+Log records from worker processes are sent back to the
+parent through a queue and emitted there, one at a time,
+so that output from several workers never interleaves.
+"""
+
+from __future__ import absolute_import
+import collections
+import logging
+import os
+
+from . import logs
+from .framework import Command
+from .framework import Stop
+
+EXECUTORS = ("thread", "process")
+POLL = 0.5
+
+
+def default_jobs():
+    return os.cpu_count() or 1
+
+
+def _init_worker(queue, level):
+    # Forked workers inherit the handlers of cancel.run(), which
+    # would turn terminate() into an exception in the work item
+    import signal
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGALRM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    logs.init_worker(queue, level)
+
+
+class _Pool(object):
+    """
+    Context manager creating the executor and, for worker
+    processes, the queue and listener which forward their
+    log records to the handlers of this process.
+    """
+
+    def __init__(self, jobs, executor):
+        if executor not in EXECUTORS:
+            raise ValueError("Unknown executor: %s" % executor)
+        self.jobs = max(1, jobs or default_jobs())
+        self.executor = executor
+        self.logging = None
+        self.futures = set()
+
+    def __enter__(self):
+        from concurrent import futures
+        if self.executor == "thread":
+            self.pool = futures.ThreadPoolExecutor(self.jobs)
+        else:
+            self.logging = logs.ProcessLogging().__enter__()
+            self.pool = futures.ProcessPoolExecutor(
+                self.jobs, initializer=_init_worker,
+                initargs=self.logging.initargs)
+        return self.pool
+
+    def submit(self, func, item):
+        future = self.pool.submit(func, item)
+        self.futures.add(future)
+        future.add_done_callback(self.futures.discard)
+        return future
+
+    def terminate(self, error=None):
+        """
+        Drop the queued work and, for worker processes,
+        stop the work in progress too.
+        """
+        # shutdown(cancel_futures=True) needs Python 3.9
+        for future in list(self.futures):
+            future.cancel()
+        # Read before shutdown(), which forgets them
+        processes = list((getattr(self.pool, "_processes", None) or
+                          {}).values())
+        self.pool.shutdown(wait=False)
+        for process in processes:
+            process.terminate()
+
+    def __exit__(self, *exc_info):
+        self.pool.shutdown(wait=True)
+        if self.logging is not None:
+            self.logging.__exit__(*exc_info)
+
+
+def fan_out(func, items, jobs=None, executor="thread", ordered=False,
+            log=None):
+    """
+    Call func(item) for each item on a pool of at most jobs
+    workers and yield (item, result) pairs, in input order
+    if ordered is True, otherwise as they complete. Items
+    are submitted lazily, so items may be a long generator.
+
+    With executor="process", func and the items must be
+    picklable. Raises Stop after the last result if any
+    item failed. If the current cancel.Token is cancelled,
+    queued items are dropped, worker processes are
+    terminated and the cancellation is raised.
+    """
+    from concurrent import futures
+    from .cancel import current
+    token = current()
+    if log is None:
+        log = logging.getLogger("yaclifw.parallel")
+
+    failures = []
+    count = 0
+    bounded = _Pool(jobs, executor)
+    with bounded:
+        work = iter(items)
+        pending = collections.OrderedDict()
+        limit = 2 * bounded.jobs
+
+        def submit():
+            for item in work:
+                pending[bounded.submit(func, item)] = item
+                if len(pending) >= limit:
+                    break
+
+        def collect(future):
+            item = pending.pop(future)
+            try:
+                return True, item, future.result()
+            except Stop as stop:
+                log.error("%s: %s", item, stop)
+                failures.append(stop.rc or 1)
+            except Exception as e:
+                log.error("%s: %s", item, e, exc_info=True)
+                failures.append(1)
+            return False, item, None
+
+        cancel = token.on_cancel(bounded.terminate)
+        try:
+            submit()
+            while pending:
+                # Wake up now and then for tokens cancelled by
+                # another thread
+                if ordered:
+                    done, _ = futures.wait(
+                        [next(iter(pending))], timeout=POLL)
+                else:
+                    done, _ = futures.wait(
+                        list(pending), timeout=POLL,
+                        return_when=futures.FIRST_COMPLETED)
+                token.check()
+                for future in done:
+                    count += 1
+                    ok, item, result = collect(future)
+                    if ok:
+                        yield item, result
+                submit()
+        finally:
+            token.remove(cancel)
+            # If the caller stopped early, drop the queued work
+            for future in pending:
+                future.cancel()
+
+    if failures:
+        raise Stop(max(failures), "%d of %d items failed" % (
+            len(failures), count))
+
+
+class ParallelCommand(Command):
+    """
+    Base type for Commands which run the same operation over
+    many work items. Adds --jobs and --executor.
+    """
+
+    NAME = "abstract"
+
+    def __init__(self, sub_parsers, set_defaults=True):
+        super(ParallelCommand, self).__init__(sub_parsers, set_defaults)
+        self.parser.add_argument(
+            "-j", "--jobs", type=int, default=default_jobs(),
+            help="Number of items to process at once (default: %(default)s)")
+        self.parser.add_argument(
+            "--executor", choices=EXECUTORS, default="thread",
+            help="Run items in threads or in processes")
+
+    def fan_out(self, func, items, args, ordered=False):
+        """
+        fan_out() using the --jobs and --executor options
+        parsed into args.
+        """
+        return fan_out(func, items, jobs=args.jobs, executor=args.executor,
+                       ordered=ordered, log=self.log)
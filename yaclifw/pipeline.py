@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Pipelines of commands run in one process:
+
+    $ yaclifw a ARGS -- b ARGS -- c ARGS
+
+Each "--" followed by the name of a command starts a new stage.
+Every stage is parsed as if it had been run on its own, and the
+records produced by one stage are handed to the next one as
+ns.pipeline_input, which is None when a command is run alone or
+is first in a pipeline. A command taking part in a pipeline
+returns an iterable of records from __call__, typically by being
+a generator:
+
+    def __call__(self, args):
+        for record in args.pipeline_input or []:
+            if self.wanted(record):
+                yield record
+
+Nothing is serialized between stages, and since every stage is
+a generator the records are pulled through the whole pipeline
+one at a time. The records of the last stage are written through
+its output() (see output), so its --format applies. A last stage
+returning None is expected to have written its own output. The
+same goes for a command run on its own: records returned from
+__call__ are written through its output().
+
+The pipeline runs under one token and resource account (see
+cancel and resources), using the shortest --timeout and the
+limits of the last stage. Coroutine commands and the result
+cache are not used in pipelines.
+"""
+
+from __future__ import absolute_import
+
+from . import timing
+from .framework import Stop
+from .framework import check_callback
+from .framework import is_awaitable
+
+SEPARATOR = "--"
+
+
+def split(args, names):
+    """
+    Split args into the argument lists of each stage. A
+    "--" which is not followed by a command name is left
+    to argparse.
+    """
+    stages = [[]]
+    for i, arg in enumerate(args):
+        if arg == SEPARATOR and i + 1 < len(args) and args[i + 1] in names:
+            stages.append([])
+        else:
+            stages[-1].append(arg)
+    return stages
+
+
+def _command(ns):
+    return getattr(ns.func, "__self__", None)
+
+
+def _name(ns):
+    command = _command(ns)
+    return command.NAME if command is not None else "command"
+
+
+def dispatch(namespaces):
+    """
+    Run the parsed stages of a pipeline, followed by the
+    callback of each stage, if any.
+    """
+    from .cancel import run
+    from .resources import account
+    timeouts = [ns.timeout for ns in namespaces
+                if getattr(ns, "timeout", None)]
+    last = namespaces[-1]
+    mode = getattr(last, "profile", None)
+    with run(min(timeouts) if timeouts else None), account(last):
+        if mode:
+            from .profiling import profile
+            from .profiling import profile_name
+            with profile(mode, profile_name(last)):
+                _dispatch(namespaces)
+        else:
+            _dispatch(namespaces)
+
+
+def _dispatch(namespaces):
+    records = None
+    for i, ns in enumerate(namespaces):
+        ns.pipeline_input = records
+        with timing.phase("func"):
+            records = ns.func(ns)
+        if is_awaitable(records):
+            if hasattr(records, "close"):
+                records.close()  # Never awaited
+            raise Stop(2, "%s: coroutines cannot be run in a pipeline"
+                       % _name(ns))
+        if i + 1 < len(namespaces) and records is None:
+            raise Stop(2, "%s: does not produce records" % _name(ns))
+    if records is not None:
+        with timing.phase("pipeline"):
+            write(namespaces[-1], records)
+    for ns in namespaces:
+        callback = check_callback(ns)
+        if callback is not None:
+            with timing.phase("callback"):
+                callback()
+
+
+def is_records(result):
+    """
+    Whether result, as returned by __call__, is an iterable
+    of records to be written out.
+    """
+    return (result is not None and hasattr(result, "__iter__")
+            and not isinstance(result, (str, bytes, dict)))
+
+
+def write(ns, records):
+    """
+    Write records through the output() of the command
+    selected by ns.
+    """
+    from .cancel import current
+    from .output import Output
+    command = _command(ns)
+    if command is not None:
+        out = command.output(ns)
+    else:
+        out = Output(getattr(ns, "format", "text"))
+    token = current()
+    with out:
+        for record in records:
+            token.check()
+            out.writerow(record)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Running child processes from commands.
+
+Each Command has a Runner as self.runner:
+
+    for line in self.runner.lines(["git", "log", "--oneline"]):
+        ...                       # stdout, one line at a time
+    result = self.runner.run(["git", "status"], timeout=10)
+    results = self.runner.run_all([["make", "a"], ["make", "b"]])
+
+stdout and stderr are read as the child writes them, a line at a
+time, so that long outputs are never held in memory; stderr lines
+are logged at debug level unless the caller asks for them. At most
+max_children children (default: <FW>_MAX_CHILDREN or the number of
+CPUs) run at once per Runner, which also bounds run_all().
+
+A child which outlives its timeout is terminated and TimedOut is
+raised. Children are also terminated when the command's cancel.Token
+is cancelled, e.g. by --timeout or SIGTERM. A child which exits with
+a non-zero code raises ProcessError, unless check=False.
+"""
+
+from __future__ import absolute_import
+import logging
+import os
+import threading
+import time
+
+from .framework import Stop
+
+GRACE = 5.0
+CHUNK = 64 * 1024
+
+
+class ProcessError(Stop):
+
+    def __init__(self, args, rc, stderr=None):
+        message = "%s exited with %d" % (" ".join(args), rc)
+        if stderr:
+            message += ": %s" % stderr.strip().splitlines()[-1]
+        super(ProcessError, self).__init__(rc, message)
+        self.command = list(args)
+        self.stderr = stderr
+
+
+class Result(object):
+
+    def __init__(self, args, rc, stdout, stderr):
+        self.args = list(args)
+        self.rc = rc
+        self.stdout = stdout
+        self.stderr = stderr
+
+    def __repr__(self):
+        return "Result(%r, rc=%r)" % (self.args, self.rc)
+
+
+def default_children(fw_name="yaclifw"):
+    name = "%s_MAX_CHILDREN" % fw_name.upper()
+    value = os.environ.get(name)
+    if value:
+        try:
+            return max(1, int(value))
+        except ValueError:
+            logging.getLogger("%s.processes" % fw_name).warning(
+                "Ignoring %s=%s: not a whole number", name, value)
+    return os.cpu_count() or 1
+
+
+class _Lines(object):
+    # Splits the chunks read from one pipe into lines
+
+    def __init__(self, name):
+        self.name = name
+        self.buffer = b""
+
+    def feed(self, data):
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split(b"\n")
+        return [self.decode(line) for line in lines]
+
+    def close(self):
+        rest, self.buffer = self.buffer, b""
+        return [self.decode(rest)] if rest else []
+
+    @staticmethod
+    def decode(line):
+        return line.rstrip(b"\r").decode("utf-8", "replace")
+
+
+class Runner(object):
+    """
+    Starts child processes, at most max_children at once,
+    which are terminated if token (default: the token of
+    the current run) is cancelled.
+    """
+
+    def __init__(self, max_children=None, timeout=None, token=None,
+                 log=None):
+        self.max_children = max_children or default_children()
+        self.timeout = timeout
+        self.token = token
+        self.log = log or logging.getLogger("yaclifw.processes")
+        self.slots = threading.BoundedSemaphore(self.max_children)
+
+    def _token(self):
+        if self.token is not None:
+            return self.token
+        from .cancel import current
+        return current()
+
+    def stream(self, args, check=True, **kwargs):
+        """
+        Run args and yield ("stdout" or "stderr", line) pairs
+        as the child writes them, without line endings. The
+        keyword arguments are cwd, env, timeout and stdin.
+        """
+        status = {}
+        tail = []
+        for name, line in self._communicate(args, status, **kwargs):
+            if name == "stderr":
+                tail = (tail + [line])[-20:]
+            yield name, line
+        if check and status["rc"]:
+            raise ProcessError(args, status["rc"], "\n".join(tail))
+
+    def _communicate(self, args, status, cwd=None, env=None, timeout=None,
+                     stdin=None):
+        import selectors
+        import subprocess
+        from .cancel import TimedOut
+        if timeout is None:
+            timeout = self.timeout
+        token = self._token()
+        token.check()
+        with self.slots:
+            self.log.debug("Running %s", " ".join(args))
+            start = time.monotonic()
+            process = subprocess.Popen(
+                args, cwd=cwd, env=env, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                stdin=subprocess.DEVNULL if stdin is None else stdin)
+            try:
+                with token.terminating(process):
+                    selector = selectors.DefaultSelector()
+                    for pipe, name in ((process.stdout, "stdout"),
+                                       (process.stderr, "stderr")):
+                        selector.register(pipe, selectors.EVENT_READ,
+                                          _Lines(name))
+                    with selector:
+                        while selector.get_map():
+                            wait = None
+                            if timeout is not None:
+                                wait = start + timeout - time.monotonic()
+                                if wait <= 0:
+                                    raise TimedOut(timeout)
+                            for key, _ in selector.select(wait):
+                                data = os.read(key.fd, CHUNK)
+                                lines = key.data
+                                if data:
+                                    found = lines.feed(data)
+                                else:
+                                    selector.unregister(key.fileobj)
+                                    found = lines.close()
+                                for line in found:
+                                    yield lines.name, line
+                    status["rc"] = process.wait()
+                token.check()
+            finally:
+                if process.poll() is None:
+                    _stop(process)
+                process.stdout.close()
+                process.stderr.close()
+
+    def lines(self, args, **kwargs):
+        """
+        Run args and yield the lines of its stdout. stderr
+        is logged at debug level.
+        """
+        for name, line in self.stream(args, **kwargs):
+            if name == "stdout":
+                yield line
+            else:
+                self.log.debug("%s: %s", args[0], line)
+
+    def run(self, args, **kwargs):
+        """
+        Run args and return a Result holding its output.
+        """
+        check = kwargs.pop("check", True)
+        status = {}
+        out, err = [], []
+        for name, line in self._communicate(args, status, **kwargs):
+            (out if name == "stdout" else err).append(line)
+        rc = status["rc"]
+        stderr = "\n".join(err)
+        if check and rc:
+            raise ProcessError(args, rc, stderr)
+        return Result(args, rc, "\n".join(out), stderr)
+
+    def run_all(self, commands, **kwargs):
+        """
+        run() each of commands (lists of arguments) with up
+        to max_children at once. Returns the Results in the
+        order of commands; see parallel.fan_out() for errors.
+        """
+        from .parallel import fan_out
+
+        def run(args):
+            return self.run(args, **kwargs)
+        return [result for _, result in fan_out(
+            run, [list(args) for args in commands], jobs=self.max_children,
+            ordered=True, log=self.log)]
+
+
+def _stop(process):
+    process.terminate()
+    try:
+        process.wait(GRACE)
+    except Exception:
+        process.kill()
+        process.wait()
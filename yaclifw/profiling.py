@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Support for the --profile option which every Command has.
+
+--profile (or --profile=cpu) runs the command under cProfile and
+writes a pstats file; --profile=mem traces allocations with
+tracemalloc and writes a snapshot file. In both cases the top
+entries are summarized on stderr. The files are written to the
+current directory as <framework>-<command>-<pid>.pstats/.snapshot
+and can be loaded with pstats.Stats() or
+tracemalloc.Snapshot.load().
+
+Setting <FW>_PROFILE=cpu|mem profiles every command without
+passing the option.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+
+PROFILERS = ("cpu", "mem")
+TOP = 20
+
+
+def output_file(name, mode):
+    suffix = "pstats" if mode == "cpu" else "snapshot"
+    return os.path.abspath("%s-%d.%s" % (name, os.getpid(), suffix))
+
+
+class profile(object):
+    """
+    Context manager profiling its body with the given mode
+    and reporting to stream (default: sys.stderr) on exit.
+    """
+
+    def __init__(self, mode, name, top=TOP, stream=None):
+        if mode not in PROFILERS:
+            raise ValueError("Unknown profiler: %s" % mode)
+        self.mode = mode
+        self.name = name
+        self.top = top
+        self.stream = stream
+        self.filename = output_file(name, mode)
+
+    def __enter__(self):
+        if self.mode == "cpu":
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            import tracemalloc
+            tracemalloc.start(25)
+        return self
+
+    def __exit__(self, *exc_info):
+        stream = self.stream or sys.stderr
+        if self.mode == "cpu":
+            import pstats
+            self.profiler.disable()
+            self.profiler.dump_stats(self.filename)
+            stats = pstats.Stats(self.profiler, stream=stream)
+            stats.sort_stats("cumulative").print_stats(self.top)
+        else:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            snapshot.dump(self.filename)
+            print("Peak traced memory: %.1f KiB" % (peak / 1024.0),
+                  file=stream)
+            print("Top %d allocations by line:" % self.top, file=stream)
+            for stat in snapshot.statistics("lineno")[:self.top]:
+                print("  %s" % stat, file=stream)
+        print("Profile written to %s" % self.filename, file=stream)
+        return False
+
+
+def profile_name(ns):
+    """
+    <framework>-<command> for the command selected in ns.
+    """
+    command = getattr(ns.func, "__self__", None)
+    if command is None:
+        return "profile"
+    return "%s-%s" % (command.fw_name, command.NAME)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Resource accounting and limits for each command.
+
+dispatch() measures the wall time, the CPU time and the peak RSS of
+the process and of its waited-for children while the command and its
+callback run. The numbers are logged at debug level under
+"<fw>.resources" and, if <FW>_RESOURCES names a file, appended to it
+as one JSON object per command, e.g.:
+
+    {"command": "version", "wall": 0.01, "user": 0.008,
+     "system": 0.001, "maxrss": 21430272, "children": {...}, "rc": 0}
+
+Times are in seconds and sizes in bytes. maxrss is the peak of the
+whole process so far, not just of the command.
+
+--max-cpu SECONDS and --max-rss SIZE (e.g. 512M) limit the command
+with setrlimit(). Linux does not enforce RLIMIT_RSS, so --max-rss
+limits the address space (RLIMIT_AS) instead, which is larger than
+the resident size. Child processes inherit both limits. The limits
+are lifted again when the command returns. A command which exceeds
+them is stopped with CPU_RC or MEMORY_RC.
+"""
+
+from __future__ import absolute_import
+import logging
+import os
+import sys
+import time
+
+from .framework import Stop
+
+CPU_RC = 152  # 128 + SIGXCPU
+MEMORY_RC = 137  # As for the OOM killer's SIGKILL
+UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parse_size(text):
+    """
+    Bytes in text such as "1048576", "512M" or "2G".
+    """
+    text = text.strip().upper()
+    if text.endswith("B"):
+        text = text[:-1]
+    unit = text[-1:] if text[-1:] in UNITS else ""
+    try:
+        number = float(text[:len(text) - len(unit)])
+    except ValueError:
+        raise ValueError("Invalid size: %s" % text)
+    return int(number * UNITS[unit])
+
+
+def _resource():
+    try:
+        import resource
+        return resource
+    except ImportError:
+        return None  # Not on Windows
+
+
+def _maxrss(kilobytes):
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    if sys.platform == "darwin":
+        return kilobytes
+    return kilobytes * 1024
+
+
+def snapshot():
+    """
+    (wall, self, children) usage now.
+    """
+    resource = _resource()
+    if resource is None:
+        return time.monotonic(), None, None
+    return (time.monotonic(),
+            resource.getrusage(resource.RUSAGE_SELF),
+            resource.getrusage(resource.RUSAGE_CHILDREN))
+
+
+def difference(before, after):
+    """
+    The usage between two snapshots as a dict.
+    """
+    usage = {"wall": after[0] - before[0]}
+    for key, index in (("self", 1), ("children", 2)):
+        if after[index] is None:
+            continue
+        part = {
+            "user": after[index].ru_utime - before[index].ru_utime,
+            "system": after[index].ru_stime - before[index].ru_stime,
+            "maxrss": _maxrss(after[index].ru_maxrss),
+        }
+        if key == "self":
+            usage.update(part)
+        else:
+            usage["children"] = part
+    return usage
+
+
+def summary(usage):
+    text = "wall=%.3fs" % usage["wall"]
+    if "user" in usage:
+        text += " user=%.3fs system=%.3fs maxrss=%.1fMiB" % (
+            usage["user"], usage["system"], usage["maxrss"] / 1048576.0)
+    children = usage.get("children")
+    if children and (children["user"] or children["system"]):
+        text += " children: user=%.3fs system=%.3fs maxrss=%.1fMiB" % (
+            children["user"], children["system"],
+            children["maxrss"] / 1048576.0)
+    return text
+
+
+class _Limits(object):
+    """
+    Lowers the soft limits for the body and restores them.
+    """
+
+    def __init__(self, max_cpu=None, max_rss=None):
+        self.max_cpu = max_cpu
+        self.max_rss = max_rss
+        self.saved = []
+        self.handler = None
+
+    def _set(self, resource, which, soft):
+        current = resource.getrlimit(which)
+        hard = current[1]
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        if current[0] != resource.RLIM_INFINITY:
+            soft = min(soft, current[0])
+        resource.setrlimit(which, (soft, hard))
+        self.saved.append((which, current))
+
+    def __enter__(self):
+        if not (self.max_cpu or self.max_rss):
+            return self
+        resource = _resource()
+        if resource is None:
+            raise Stop(2, "Resource limits are not supported here")
+        if self.max_cpu:
+            import math
+            import signal
+            used = resource.getrusage(resource.RUSAGE_SELF)
+            # RLIMIT_CPU counts the CPU time of the whole process
+            self._set(resource, resource.RLIMIT_CPU, int(math.ceil(
+                used.ru_utime + used.ru_stime + self.max_cpu)))
+            if hasattr(signal, "SIGXCPU"):
+                self.handler = signal.signal(signal.SIGXCPU, self._on_xcpu)
+        if self.max_rss:
+            self._set(resource, resource.RLIMIT_AS, self.max_rss)
+        return self
+
+    def _on_xcpu(self, signum, frame):
+        raise Stop(CPU_RC, "CPU time limit of %gs exceeded" % self.max_cpu)
+
+    def __exit__(self, exc_type, exc, tb):
+        resource = _resource()
+        for which, limits in reversed(self.saved):
+            resource.setrlimit(which, limits)
+        if self.handler is not None:
+            import signal
+            signal.signal(signal.SIGXCPU, self.handler)
+        if exc_type is MemoryError and self.max_rss:
+            raise Stop(MEMORY_RC, "Memory limit of %d bytes exceeded"
+                       % self.max_rss)
+        return False
+
+
+class account(object):
+    """
+    Context manager applying the limits parsed into ns to
+    its body and reporting its usage.
+    """
+
+    def __init__(self, ns):
+        command = getattr(ns.func, "__self__", None)
+        self.name = getattr(command, "NAME", "command")
+        self.fw_name = getattr(command, "fw_name", "yaclifw")
+        self.limits = _Limits(getattr(ns, "max_cpu", None),
+                              getattr(ns, "max_rss", None))
+
+    def __enter__(self):
+        self.before = snapshot()
+        self.limits.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.limits.__exit__(exc_type, exc, tb)
+        except Stop as stop:
+            self.report(stop.rc)
+            raise stop
+        rc = 0
+        if exc is not None:
+            from .timing import exit_code
+            rc = exit_code(exc)
+        self.report(rc)
+        return False
+
+    def report(self, rc):
+        self.usage = difference(self.before, snapshot())
+        log = logging.getLogger("%s.resources" % self.fw_name)
+        log.debug("%s: %s", self.name, summary(self.usage))
+        path = os.environ.get("%s_RESOURCES" % self.fw_name.upper())
+        if path:
+            import json
+            record = dict(self.usage, command=self.name, rc=rc)
+            try:
+                with open(path, "a") as f:
+                    f.write(json.dumps(record, sort_keys=True) + "\n")
+            except (IOError, OSError):
+                log.debug("Cannot write %s", path, exc_info=True)
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+On-disk cache of command results.
+
+A Command which is a pure function of its arguments and of some
+input files can set CACHE = True and list those files:
+
+    class Report(Command):
+        CACHE = True
+
+        def cache_inputs(self, args):
+            return [args.config] + args.files
+
+dispatch() then looks up the command line before running it. On a
+hit the recorded stdout and stderr are written again and the
+recorded return code is raised as Stop (or nothing for 0), without
+calling ns.func. On a miss the command runs with its output copied
+into a new entry. --no-cache bypasses the cache and --refresh runs
+the command and replaces the entry.
+
+The key holds the framework and command names, the source file of
+the command (path, size, mtime), the working directory, the parsed
+arguments other than the ones which only change logging, profiling
+and limits, and for each input path either a SHA-256 of its content
+(CACHE_HASH = True, the default) or its size and mtime. Directories
+are listed recursively.
+
+Entries live under <cache dir>/results. Entries older than
+<FW>_RESULT_CACHE_AGE seconds (default: a week) are dropped, and
+the least recently used ones are removed while the entries take
+more than <FW>_RESULT_CACHE_SIZE bytes (default: 100M). Output
+written to the file descriptors directly, e.g. by child processes,
+is not recorded. Only output written through sys.stdout and
+sys.stderr by the thread running the command, including the log
+records which it emits, is recorded (and replayed as recorded,
+whatever the logging options of the hit), and the result is not
+cached if any other thread writes to them meanwhile. Cancelled commands
+are never cached.
+"""
+
+from __future__ import absolute_import
+import hashlib
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from . import logs
+from .framework import Stop
+from .framework import atomic_write
+from .framework import get_cache_dir
+
+log = logging.getLogger("yaclifw.resultcache")
+
+MAX_AGE = 7 * 24 * 3600
+MAX_SIZE = 100 * 1024 ** 2
+IGNORED = frozenset((
+    "func", "callback", "no_cache", "refresh", "verbose", "quiet",
+    "log_format", "profile", "timeout", "max_cpu", "max_rss"))
+
+
+def _file_state(path, content):
+    if content:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime]
+
+
+def input_state(path, content=True):
+    """
+    What the key records about one input path.
+    """
+    if os.path.isdir(path):
+        state = []
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                state.append([os.path.relpath(full, path),
+                              _file_state(full, content)])
+        return state
+    if os.path.exists(path):
+        return _file_state(path, content)
+    return None
+
+
+def _value(value):
+    # Namespace values as JSON, falling back on repr()
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return repr(value)
+
+
+_recordings = {}  # Thread ident -> _Recording of the command run there
+_lock = threading.Lock()
+
+
+class _Capture(object):
+    # Stands in for sys.stdout or sys.stderr while commands are
+    # recorded. Writes are added to the recording of the thread
+    # which makes them. A write from any other thread, e.g. a
+    # pool worker or another App.run(), might belong to any of
+    # the recorded commands, so none of them is cached.
+
+    def __init__(self, name, stream):
+        self._name = name
+        self._stream = stream
+
+    def write(self, text):
+        recording = _recordings.get(logs.writer())
+        if recording is not None:
+            recording.add(self._name, text)
+        else:
+            for other in list(_recordings.values()):
+                other.chunks = None
+        return self._stream.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _recorded(object):
+    # Context manager recording the output of this thread
+
+    def __init__(self, recording):
+        self.recording = recording
+
+    def __enter__(self):
+        with _lock:
+            if not _recordings:
+                sys.stdout = _Capture("stdout", sys.stdout)
+                sys.stderr = _Capture("stderr", sys.stderr)
+            self.ident = threading.get_ident()
+            self.outer = _recordings.get(self.ident)
+            if self.outer is not None:
+                self.outer.chunks = None  # Nested: output is split
+            _recordings[self.ident] = self.recording
+        return self.recording
+
+    def __exit__(self, *exc_info):
+        logs.flush()  # Log lines of this command are its output too
+        with _lock:
+            if self.outer is not None:
+                _recordings[self.ident] = self.outer
+            else:
+                del _recordings[self.ident]
+            if not _recordings:
+                for name in ("stdout", "stderr"):
+                    stream = getattr(sys, name)
+                    if isinstance(stream, _Capture):
+                        setattr(sys, name, stream._stream)
+        return False
+
+
+class _Recording(object):
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.chunks = []
+        self.size = 0
+
+    def add(self, name, text):
+        if self.chunks is None:
+            return
+        self.size += len(text)
+        if self.size > self.limit:
+            self.chunks = None  # Too large to cache
+        else:
+            self.chunks.append([name, text])
+
+
+class ResultCache(object):
+
+    def __init__(self, fw_name, directory=None, max_age=None, max_size=None):
+        prefix = fw_name.upper()
+        self.fw_name = fw_name
+        self.directory = directory or os.path.join(
+            get_cache_dir(fw_name), "results")
+        self.max_age = max_age or float(os.environ.get(
+            "%s_RESULT_CACHE_AGE" % prefix, MAX_AGE))
+        if max_size is None:
+            from .resources import parse_size
+            max_size = parse_size(os.environ.get(
+                "%s_RESULT_CACHE_SIZE" % prefix, str(MAX_SIZE)))
+        self.max_size = max_size
+
+    def key(self, command, ns):
+        try:
+            source = inspect.getsourcefile(type(command))
+            st = os.stat(source)
+            code = [source, st.st_size, st.st_mtime]
+        except (TypeError, OSError):
+            code = None
+        content = getattr(command, "CACHE_HASH", True)
+        inputs = [[path, input_state(path, content)]
+                  for path in command.cache_inputs(ns)]
+        data = {
+            "framework": self.fw_name,
+            "command": command.NAME,
+            "code": code,
+            "cwd": os.getcwd(),
+            "args": sorted([k, _value(v)] for k, v in vars(ns).items()
+                           if k not in IGNORED),
+            "inputs": inputs,
+        }
+        return hashlib.sha256(json.dumps(
+            data, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.directory, "%s.json" % key)
+
+    def read(self, key):
+        filename = self.filename(key)
+        try:
+            with open(filename, "r") as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if time.time() - entry.get("created", 0) > self.max_age:
+            return None
+        try:
+            os.utime(filename)  # Recently used
+        except OSError:
+            pass
+        return entry
+
+    def write(self, key, entry):
+        try:
+            atomic_write(self.filename(key), json.dumps(entry))
+            self.evict()
+        except (IOError, OSError):
+            log.debug("Cannot write result cache %s", key, exc_info=True)
+
+    def evict(self):
+        """
+        Remove expired entries, then the least recently used
+        ones until the rest fit into max_size.
+        """
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            filename = os.path.join(self.directory, name)
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, filename))
+        total = sum(size for _, size, _ in entries)
+        for used, size, filename in sorted(entries):
+            if total <= self.max_size and now - used <= self.max_age:
+                continue
+            try:
+                os.remove(filename)
+                total -= size
+            except OSError:
+                pass
+
+    def replay(self, entry):
+        streams = {"stdout": sys.stdout, "stderr": sys.stderr}
+        for name, text in entry["chunks"]:
+            streams[name].write(text)
+        for stream in streams.values():
+            stream.flush()
+        if entry["rc"]:
+            raise Stop(entry["rc"], *entry["message"])
+
+    def call(self, command, ns, func):
+        """
+        Run func(ns) for command through the cache.
+        """
+        if getattr(ns, "no_cache", False):
+            return func(ns)
+        key = self.key(command, ns)
+        if not getattr(ns, "refresh", False):
+            entry = self.read(key)
+            if entry is not None:
+                log.debug("%s: replaying %s", command.NAME, key)
+                return self.replay(entry)
+        recording = _Recording(self.max_size // 10)
+        rc, message = None, []
+        try:
+            with _recorded(recording):
+                func(ns)
+            rc = 0
+        except Stop as stop:
+            from .cancel import Cancelled
+            from .output import PIPE_RC
+            if not isinstance(stop, Cancelled) and stop.rc != PIPE_RC:
+                rc, message = stop.rc, [str(a) for a in stop.args]
+            raise
+        finally:
+            if rc is not None and recording.chunks is not None:
+                self.write(key, {"created": time.time(), "rc": rc,
+                                 "message": message,
+                                 "chunks": recording.chunks})
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Warm server mode for short-lived commands.
+
+serve() imports the framework and every command once and then
+listens on a Unix socket. For each connection it forks, so that
+every request starts from the same warm interpreter and any module
+state which main() changes (DEBUG_LEVEL, FRAMEWORK_NAME, logging
+configuration, ...) is thrown away with the child process.
+
+client() forwards argv, the current directory, the environment and
+the stdin/stdout/stderr file descriptors of the calling process and
+returns the exit code of the command. This module only imports the
+standard library at load time so that the client stays cheap.
+
+The server exits once it has been idle for idle_timeout seconds.
+The socket is only accessible to the user who started the server.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import array
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import time
+
+FDS = (0, 1, 2)
+_INT_SIZE = array.array("i").itemsize
+
+
+#
+# Wire format: newline-terminated JSON messages. The request from the
+# client carries the stdio file descriptors as SCM_RIGHTS ancillary
+# data. The server replies with {"pid": ...} and then {"rc": ...}.
+#
+
+def _send(sock, message, fds=None):
+    data = (json.dumps(message) + "\n").encode("utf-8")
+    if fds:
+        fds = array.array("i", fds)
+        sock.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+    else:
+        sock.sendall(data)
+
+
+def _recv(sock, buffer, nfds=0):
+    """
+    Read one message. Returns (message, fds, rest of buffer);
+    message is None if the peer closed the connection.
+    """
+    fds = array.array("i")
+    while b"\n" not in buffer:
+        if nfds and not fds:
+            data, ancdata, flags, addr = sock.recvmsg(
+                65536, socket.CMSG_LEN(nfds * _INT_SIZE))
+            for level, kind, cdata in ancdata:
+                if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                    fds.frombytes(cdata[:len(cdata) - len(cdata) % _INT_SIZE])
+        else:
+            data = sock.recv(65536)
+        if not data:
+            return None, list(fds), buffer
+        buffer += data
+    line, _, buffer = buffer.partition(b"\n")
+    return json.loads(line.decode("utf-8")), list(fds), buffer
+
+
+#
+# Client
+#
+
+class NoServer(Exception):
+    """
+    Raised by client() if no server accepts the connection,
+    in which case nothing has been run.
+    """
+
+
+def client(socket_path, args=None):
+    """
+    Run args (default: sys.argv[1:]) on the server listening
+    on socket_path and return its exit code. Raises NoServer
+    if no server is listening so that callers can fall back
+    on running the command locally. Once the request may
+    have been received, errors return 1 instead: running the
+    command again could repeat its effects.
+    """
+    if args is None:
+        args = sys.argv[1:]
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(socket_path)
+        except (IOError, OSError) as error:
+            raise NoServer(error)
+        return _request(sock, args)
+    except (IOError, OSError) as error:
+        print("Connection to server lost: %s" % error, file=sys.stderr)
+        return 1
+    finally:
+        sock.close()
+
+
+def _request(sock, args):
+    # Send the request and wait for the exit code
+    for stream in (sys.stdout, sys.stderr):
+        stream.flush()
+    _send(sock, {"argv0": sys.argv[0], "argv": list(args),
+                 "cwd": os.getcwd(), "env": dict(os.environ)}, FDS)
+    buffer = b""
+    pid = None
+    while True:
+        try:
+            message, fds, buffer = _recv(sock, buffer)
+        except KeyboardInterrupt:
+            # Forward to the command, which will report back
+            if pid:
+                os.kill(pid, signal.SIGINT)
+            continue
+        if message is None:
+            return 1  # Server child died without a reply
+        if "pid" in message:
+            pid = message["pid"]
+        if "rc" in message:
+            return message["rc"]
+
+
+#
+# Server
+#
+
+def run(fw_name, args, items=None, lazy=False):
+    """
+    Call main() the way main.entry_point() does but return
+    the exit code rather than calling sys.exit().
+    """
+    from .framework import main
+    from .framework import Stop
+    try:
+        main(fw_name, args, items=items, lazy=lazy)
+        return 0
+    except Stop as stop:
+        print(stop)
+        return stop.rc
+    except SystemExit as exit:
+        if exit.code is None:
+            return 0
+        if isinstance(exit.code, int):
+            return exit.code
+        print(exit.code, file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        print("Cancelled")
+        return 1
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        return 1
+
+
+def preload(items):
+    """
+    Import every command so that forked children start warm.
+    """
+    from .framework import CommandReference
+    from .framework import commands
+    from .framework import load
+    loaded = []
+    for name, MyCommand in commands(items):
+        if isinstance(MyCommand, CommandReference):
+            MyCommand = load(MyCommand)
+        loaded.append((name, MyCommand))
+    return loaded
+
+
+def _handle(conn, fw_name, items, lazy):
+    # Runs in the forked child
+    message, fds, buffer = _recv(conn, b"", len(FDS))
+    if message is None or len(fds) != len(FDS):
+        return
+    for fd, target in zip(fds, FDS):
+        os.dup2(fd, target)
+        os.close(fd)
+    os.chdir(message["cwd"])
+    os.environ.clear()
+    os.environ.update(message["env"])
+    sys.argv = [message["argv0"]] + message["argv"]
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    _send(conn, {"pid": os.getpid()})
+    rc = run(fw_name, message["argv"], items=items, lazy=lazy)
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except Exception:
+            pass
+    _send(conn, {"rc": rc})
+
+
+def _listen(socket_path):
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except socket.error:
+            os.remove(socket_path)  # Stale
+        else:
+            raise RuntimeError("A server is already listening on %s"
+                               % socket_path)
+        finally:
+            probe.close()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o077)
+    try:
+        sock.bind(socket_path)
+    finally:
+        os.umask(umask)
+    sock.listen(64)
+    return sock
+
+
+def serve(fw_name, socket_path, items, idle_timeout=600, lazy=False):
+    """
+    Preload items and serve requests on socket_path until
+    no request has arrived for idle_timeout seconds.
+    """
+    items = preload(items)
+    sock = _listen(socket_path)
+    children = set()
+    last = time.time()
+    try:
+        while True:
+            while children:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+                if not pid:
+                    break
+                children.discard(pid)
+                last = time.time()
+            idle = time.time() - last
+            if not children and idle >= idle_timeout:
+                break
+            timeout = max(min(idle_timeout - idle, 1.0), 0.05)
+            try:
+                ready, _, _ = select.select([sock], [], [], timeout)
+            except KeyboardInterrupt:
+                break
+            if not ready:
+                continue
+            conn, _ = sock.accept()
+            last = time.time()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                rc = 0
+                try:
+                    sock.close()
+                    _handle(conn, fw_name, items, lazy)
+                except BaseException:
+                    rc = 1
+                finally:
+                    os._exit(rc)
+            conn.close()
+            children.add(pid)
+    finally:
+        sock.close()
+        try:
+            os.remove(socket_path)
+        except OSError:
+            pass
+
+
+def server_main(args=None):
+    """
+    Serve yaclifw's own commands, e.g.:
+
+        python -m yaclifw.server /tmp/yaclifw.sock
+
+    and then run them with YACLIFW_SERVER=/tmp/yaclifw.sock
+    """
+    import argparse
+    from .main import default_items
+    parser = argparse.ArgumentParser(description="Serve yaclifw commands")
+    parser.add_argument("socket")
+    parser.add_argument("--idle-timeout", type=float, default=600)
+    ns = parser.parse_args(args)
+    serve("yaclifw", ns.socket, default_items(),
+          idle_timeout=ns.idle_timeout, lazy=True)
+
+
+if __name__ == "__main__":
+    server_main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2014 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Timing of the phases of a run: import of the framework,
+parsers() construction, building each Command, parse_args,
+ns.func and ns.callback.
+
+Timing is off unless <FW>_TIMINGS names a file. When set, one
+JSON record per run is appended to that file, e.g.:
+
+    {"framework": "yaclifw", "argv": ["version"], "rc": 0,
+     "total": 0.0123, "phases": {"import": 0.0081, ...},
+     "commands": {"version": 0.0002}, ...}
+
+Durations are in seconds, measured with time.perf_counter().
+Phases which occur several times in one run (e.g. for each
+line of a batch) are summed.
+"""
+
+from __future__ import absolute_import
+import os
+import sys
+import threading
+import time
+
+_state = threading.local()
+
+
+class Timings(object):
+
+    def __init__(self, fw_name, path, argv=None):
+        self.fw_name = fw_name
+        self.path = path
+        if argv is None:
+            argv = sys.argv[1:]
+        self.argv = list(argv)
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.commands = {}
+        self.active = set()
+
+    def add(self, name, seconds, command=None):
+        if command is not None:
+            target, key = self.commands, command
+        else:
+            target, key = self.phases, name
+        target[key] = target.get(key, 0.0) + seconds
+
+    def record(self, rc=None):
+        return {
+            "framework": self.fw_name,
+            "argv": self.argv,
+            "pid": os.getpid(),
+            "timestamp": self.timestamp,
+            "rc": rc,
+            "total": time.perf_counter() - self.start,
+            "phases": self.phases,
+            "commands": self.commands,
+        }
+
+    def write(self, rc=None):
+        import json
+        line = json.dumps(self.record(rc), sort_keys=True) + "\n"
+        with open(self.path, "a") as f:
+            f.write(line)
+
+
+def current():
+    return getattr(_state, "timings", None)
+
+
+def start(fw_name, argv=None):
+    """
+    Begin timing a run if <FW>_TIMINGS is set and no run is
+    being timed already. Returns the new Timings, which the
+    caller must pass to finish(), or None.
+    """
+    path = os.environ.get("%s_TIMINGS" % fw_name.upper())
+    if not path or current() is not None:
+        return None
+    _state.timings = Timings(fw_name, path, argv)
+    return _state.timings
+
+
+def finish(timings, rc=None):
+    """
+    Write the record for timings, as returned by start().
+    """
+    if timings is None:
+        return
+    _state.timings = None
+    try:
+        timings.write(rc)
+    except (IOError, OSError):
+        pass  # Timing must never break the command
+
+
+def add(name, seconds, command=None):
+    timings = current()
+    if timings is not None:
+        timings.add(name, seconds, command)
+
+
+class phase(object):
+    """
+    Context manager timing its body as the named phase, or
+    as the construction of command if given. Does nothing
+    unless a run is being timed, or inside the same phase.
+    """
+
+    def __init__(self, name, command=None):
+        self.name = name
+        self.command = command
+
+    def __enter__(self):
+        self.timings = current()
+        key = (self.name, self.command)
+        if self.timings is not None:
+            if key in self.timings.active:
+                # Nested, e.g. a batch line: counted by the outer one
+                self.timings = None
+            else:
+                self.timings.active.add(key)
+                self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.active.discard((self.name, self.command))
+            self.timings.add(self.name, time.perf_counter() - self.start,
+                             self.command)
+        return False
+
+
+class run(object):
+    """
+    Context manager timing a whole run via start() and
+    finish(), recording the exit code which its body ends
+    with. Nested runs are part of the outer one.
+    """
+
+    def __init__(self, fw_name, argv=None):
+        self.fw_name = fw_name
+        self.argv = argv
+
+    def __enter__(self):
+        self.timings = start(self.fw_name, self.argv)
+        return self.timings
+
+    def __exit__(self, exc_type, exc, tb):
+        finish(self.timings, exit_code(exc))
+        return False
+
+
+def exit_code(exc):
+    """
+    The exit code which entry_point() uses for exc.
+    """
+    from .framework import Stop
+    if exc is None:
+        return 0
+    if isinstance(exc, Stop):
+        return exc.rc
+    if isinstance(exc, SystemExit):
+        if exc.code is None or isinstance(exc.code, int):
+            return exc.code or 0
+    return 1
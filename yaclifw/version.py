@@ -3,7 +3,8 @@
 # This file is placed into the public domain.
 
 # Calculates the current version number.  If possible, this is the
-# output of “git describe”, modified to conform to the versioning
+# output of “git describe” (computed by yaclifw.describe without
+# running git where possible), modified to conform to the versioning
 # scheme that setuptools uses.  If “git describe” returns an error
 # (most likely because we're in an unpacked copy of a release tarball,
 # rather than in a git working copy), then we fall back on reading the
@@ -30,16 +31,34 @@
 # contains the following line:
 #
 #   include RELEASE-VERSION
+#
+# The output of “git describe” is cached both in-process and in a
+# RELEASE-VERSION.cache file next to RELEASE-VERSION. Both are keyed on
+# the state of .git/HEAD, the refs it points to, packed-refs and the
+# refs/tags directories, so git is only consulted again when one of
+# those changes. RELEASE-VERSION.cache should not be checked in either.
+#
+# Installed copies should not need git at all. Call
+# write_version_module() from a build_py subclass in setup.py to write
+# the version into a _version.py module in the built package (see
+# yaclifw's own setup.py). get_version() reads that constant first and
+# only then falls back on get_git_version(). _version.py should not be
+# checked in either.
 
 from __future__ import absolute_import
 from __future__ import print_function
 from yaclifw import __file__ as module_file
-from subprocess import Popen, PIPE
-from os import path, getcwd, chdir
+from os import path, getcwd
+from .describe import common_dir, describe, find_git_dir
 from .framework import Command
+from .framework import atomic_write
+from .output import FORMATS
+import importlib
+import json
+import os
 import re
 
-__all__ = ("get_git_version")
+__all__ = ("get_git_version", "get_version")
 
 
 def _lookup_version(module_file):
@@ -57,16 +76,43 @@ def _lookup_version(module_file):
     return version_dir, version_file
 
 
-def call_git_describe(abbrev=4):
-    try:
-        p = Popen(['git', 'describe', '--match=[v0-9][.0-9]*',
-                   '--abbrev=%d' % abbrev], stdout=PIPE, stderr=PIPE)
-        p.stderr.close()
-        line = p.stdout.readlines()[0]
-        return line.strip().decode("utf-8")
+GIT_TIMEOUT = 30
+
+
+def call_git_describe(abbrev=4, directory=None):
+    # Describe the repository containing directory (default: the
+    # current directory) without changing directory. The pure-Python
+    # implementation is tried first and git is only run for
+    # repository layouts which it cannot read.
+    if directory is None:
+        directory = getcwd()
+    if "GIT_DIR" not in os.environ:
+        try:
+            git_dir = find_git_dir(directory)
+            if git_dir is None:
+                return None
+            return describe(git_dir, abbrev)
+        except Exception:
+            pass  # Unsupported layouts and anything unexpected
+    return call_git_describe_subprocess(abbrev, directory)
+
 
+def call_git_describe_subprocess(abbrev=4, directory=None, runner=None):
+    from .cancel import Cancelled
+    from .processes import Runner
+    if runner is None:
+        runner = Runner(1)
+    try:
+        for line in runner.lines(
+                ['git', 'describe', '--match=[v0-9][.0-9]*',
+                 '--abbrev=%d' % abbrev], cwd=directory,
+                timeout=GIT_TIMEOUT):
+            return line.strip()
+    except Cancelled:
+        raise
     except Exception:
-        return None
+        pass  # No git, not a repository, no matching tag, ...
+    return None
 
 
 def read_release_version(module_file):
@@ -81,12 +127,97 @@ def read_release_version(module_file):
 
 def write_release_version(module_file, version):
     version_dir, version_file = _lookup_version(module_file)
-    with open(version_file, "w") as f:
-        f.write("%s\n" % version)
+    atomic_write(version_file, "%s\n" % version)
+
+
+def _stat_key(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size, st.st_ino]
+
+
+def _git_state(version_dir):
+    # Return a JSON-serializable value which changes whenever the result
+    # of "git describe" run in version_dir may change, or None if the
+    # state cannot be determined and git must always be asked.
+    if "GIT_DIR" in os.environ:
+        return None
+    try:
+        git_dir = find_git_dir(version_dir)
+        if git_dir is None:
+            return ["no-git"]
+        git_common_dir = common_dir(git_dir)
+        with open(path.join(git_dir, "HEAD"), "r") as f:
+            head = f.read().strip()
+    except (IOError, OSError):
+        return None
+    state = [git_dir, head]
+    if head.startswith("ref:"):
+        ref = head[len("ref:"):].strip()
+        state.append(_stat_key(path.join(git_common_dir, ref)))
+    state.append(_stat_key(path.join(git_common_dir, "packed-refs")))
+    tags_dir = path.join(git_common_dir, "refs", "tags")
+    for root, dirs, files in os.walk(tags_dir):
+        dirs.sort()
+        state.append([path.relpath(root, tags_dir), _stat_key(root)])
+    return state
+
 
+_describe_cache = {}
 
-version_pattern = r'^(v)?(?P<version>[0-9]+[\.][0-9]+[\.][0-9]+(\-.+)*)$'
-version_pattern = re.compile(version_pattern)
+
+def _describe_cache_file(version_dir):
+    return path.join(version_dir, "RELEASE-VERSION.cache")
+
+
+def reset_version_cache(module_file=None):
+    """
+    Forget all cached "git describe" results, in-process
+    and, if module_file is given, on disk.
+    """
+    _describe_cache.clear()
+    if module_file is not None:
+        version_dir, version_file = _lookup_version(module_file)
+        try:
+            os.remove(_describe_cache_file(version_dir))
+        except OSError:
+            pass
+
+
+def cached_git_describe(version_dir, abbrev=4):
+    state = _git_state(version_dir)
+    if state is None:
+        return call_git_describe(abbrev, version_dir)
+    key = [abbrev, state]
+
+    cached = _describe_cache.get(version_dir)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    cache_file = _describe_cache_file(version_dir)
+    try:
+        with open(cache_file, "r") as f:
+            data = json.load(f)
+        if data["key"] == key:
+            _describe_cache[version_dir] = (key, data["describe"])
+            return data["describe"]
+    except Exception:
+        pass
+
+    git_version = call_git_describe(abbrev, version_dir)
+    _describe_cache[version_dir] = (key, git_version)
+    try:
+        atomic_write(cache_file, json.dumps(
+            {"key": key, "describe": git_version}))
+    except (IOError, OSError):
+        pass  # e.g. read-only installation
+    return git_version
+
+
+version_pattern = re.compile(
+    r'^(v)?(?P<version>[0-9]+[\.][0-9]+[\.][0-9]+(\-.+)*)$')
 
 
 def get_git_version(module_file, abbrev=4):
@@ -96,12 +227,7 @@ def get_git_version(module_file, abbrev=4):
     # First try to get the current version using “git describe”.
     cwd = getcwd()
     version_dir, version_file = _lookup_version(module_file)
-    git_version = None
-    try:
-        chdir(version_dir)
-        git_version = call_git_describe(abbrev)
-    finally:
-        chdir(cwd)
+    git_version = cached_git_describe(version_dir, abbrev)
 
     # Extract version number
     version = None
@@ -130,30 +256,193 @@ def get_git_version(module_file, abbrev=4):
     # RELEASE-VERSION file, update the file to be current.
 
     if version != release_version:
-        write_release_version(module_file, version)
+        try:
+            write_release_version(module_file, version)
+        except (IOError, OSError):
+            pass  # e.g. read-only installation
 
     # Finally, return the current version.
 
     return version
 
 
+VERSION_MODULE = "_version"
+
+
+def write_version_module(filename, version):
+    atomic_write(filename, (
+        "# Generated at build time by yaclifw.version\n"
+        "version = %r\n") % version)
+
+
+def _package_name(module_file):
+    # The package whose __init__ is module_file
+    if path.splitext(path.basename(module_file))[0] != "__init__":
+        return None
+    return path.basename(path.dirname(path.abspath(module_file)))
+
+
+def read_baked_version(package):
+    """
+    The version baked into package at build time, or None.
+    """
+    try:
+        baked = importlib.import_module(
+            "%s.%s" % (package, VERSION_MODULE))
+    except ImportError:
+        return None
+    return getattr(baked, "version", None)
+
+
+def get_version(module_file, abbrev=4, package=None):
+    # The version baked in at build time is authoritative for installed
+    # copies. Source checkouts have no _version.py and use git. package
+    # defaults to the one whose __init__ is module_file.
+    if package is None:
+        package = _package_name(module_file)
+    version = package and read_baked_version(package)
+    if version is None:
+        version = get_git_version(module_file, abbrev)
+    return version
+
+
+_package_versions = {}
+_top_level = None
+
+
+def _distributions(package):
+    # Names of the installed distributions providing package
+    global _top_level
+    from importlib import metadata
+    if _top_level is None:
+        try:
+            _top_level = metadata.packages_distributions()
+        except AttributeError:  # Python < 3.10
+            _top_level = {}
+    return list(_top_level.get(package, [])) + [package]
+
+
+def _distribution(package):
+    from importlib import metadata
+    for name in _distributions(package):
+        try:
+            return metadata.distribution(name)
+        except metadata.PackageNotFoundError:
+            pass
+    return None
+
+
+def _editable(distribution):
+    # PEP 610: editable installs record dir_info.editable
+    try:
+        data = json.loads(distribution.read_text("direct_url.json") or "{}")
+        return bool(data.get("dir_info", {}).get("editable"))
+    except (ValueError, AttributeError):
+        return False
+
+
+def _package_file(package):
+    # A file inside package, found without importing it
+    import importlib.util
+    try:
+        spec = importlib.util.find_spec(package)
+    except (ImportError, ValueError):
+        return None
+    if spec is None:
+        return None
+    if spec.origin and spec.has_location:
+        return spec.origin
+    for directory in spec.submodule_search_locations or []:
+        return path.join(directory, "__init__.py")
+    return None
+
+
+def package_version(package):
+    """
+    Return a record of the version of the top-level package:
+    that of its installed distribution, or for editable
+    installs and source trees the one given by "git describe"
+    or RELEASE-VERSION. Results are kept for the process.
+    """
+    result = _package_versions.get(package)
+    if result is not None:
+        return result
+    distribution = _distribution(package)
+    name = version = source = None
+    if distribution is not None:
+        name = distribution.metadata["Name"]
+        version, source = distribution.version, "metadata"
+    if distribution is None or _editable(distribution):
+        filename = _package_file(package)
+        if filename is not None:
+            version_dir, version_file = _lookup_version(filename)
+            m = version_pattern.match(cached_git_describe(version_dir) or "")
+            if m:
+                version, source = m.group("version"), "git"
+            elif version is None:
+                version = read_release_version(filename)
+                source = version and "RELEASE-VERSION"
+    result = {"package": package, "distribution": name,
+              "version": version or "unknown", "source": source}
+    _package_versions[package] = result
+    return result
+
+
+def command_packages(app, package="yaclifw"):
+    """
+    The top-level packages of package and of every
+    Command registered with app, in order.
+    """
+    packages = []
+    modules = [package]
+    for _, MyCommand in (app.items if app is not None else []):
+        target = getattr(MyCommand, "target", None)
+        if target is not None:
+            modules.append(target.split(":")[0])
+        else:
+            modules.append(MyCommand.__module__)
+    for module in modules:
+        package = module.split(".")[0]
+        if package not in packages and package != "__main__":
+            packages.append(package)
+    return packages
+
+
 class Version(Command):
     """Find which version of this library is being used"""
 
     NAME = "version"
     FILE = module_file
+    PACKAGE = None  # Holds the baked version, default: that of FILE
+    OUTPUT_FORMATS = FORMATS
 
     def __init__(self, sub_parsers):
         super(Version, self).__init__(sub_parsers)
-        # No token args
+        self.parser.add_argument(
+            "--all", action="store_true",
+            help="Report the version of every package providing commands")
 
     def __call__(self, args):
         super(Version, self).__call__(args)
 
+        if args.all:
+            return self.report_all(args)
         try:
             # If this file has been downloaded in isolation,
             # then scc_version will not be present.
-            version = get_git_version(self.FILE)
+            version = get_version(self.FILE, package=self.PACKAGE)
         except Exception:
             version = "unknown"
-        print(version)
+        with self.output(args, fields=("version",)) as out:
+            out.writerow((version,))
+
+    def report_all(self, args):
+        from .parallel import fan_out
+        packages = command_packages(
+            self.app, self.PACKAGE or _package_name(self.FILE) or "yaclifw")
+        _distributions(packages[0])  # Scan the installation only once
+        fields = ("package", "distribution", "version", "source")
+        with self.output(args, fields=fields) as out:
+            for package, record in fan_out(package_version, packages,
+                                           ordered=True, log=self.log):
+                out.writerow(record)